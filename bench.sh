@@ -0,0 +1,7 @@
+#!/bin/bash
+# runs the performance benchmarks in src/bp/tests/benchmarks.py
+# results are saved to .benchmarks/ and can be compared with: pytest-benchmark compare
+set -e
+source venv/bin/activate
+cd src
+pytest bp/tests/benchmarks.py --benchmark-autosave --benchmark-storage="file://../.benchmarks" "$@"
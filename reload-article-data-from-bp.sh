@@ -2,9 +2,12 @@
 function is_int() { return $(test "$@" -eq "$@" > /dev/null 2>&1); }
 source venv/bin/activate
 set -eu
-msid="$1"
+msid="${1:-}"
 if $(is_int "$msid"); then
-    ./src/manage.py reload_article_data "$msid"
+    ./src/manage.py reload_article_data "$@"
+elif [[ "$msid" == --* ]]; then
+    # bulk mode, see: ./src/manage.py reload_article_data --help
+    ./src/manage.py reload_article_data "$@"
 else
     echo "msid must be an integer"
     exit 1
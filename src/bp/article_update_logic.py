@@ -1,72 +1,174 @@
 from django.conf import settings
-import json, boto3
+from django import db
+from asgiref.sync import async_to_sync
+import boto3
 import logging
-from . import logic
+import math
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from . import async_logic, codec, logic, metrics, outbox, utils
 
 LOG = logging.getLogger()
 
 
 # listens to the configured SQS queue (see app.cfg) for updates to articles
 # management command "update_listener" will call listen() that polls SQS queue for messages
-# calls 'handle_update' on each message
+# messages are received in batches, duplicate article events within a batch are coalesced and
+# 'handle_article' is called on each distinct article by a pool of worker threads.
+# if 'async' is set in the 'sqs' section of app.cfg the articles of a batch are instead handled together
+# in an event loop by 'async_logic.handle_articles'
+
+# maximum number of messages that can be received or deleted in a single call to SQS
+SQS_MAX_BATCH_SIZE = 10
 
 
 def queue_resource(name):
     return boto3.resource("sqs").get_queue_by_name(QueueName=name)
 
 
-def poll(queue_obj):
-    """an infinite poll on the given queue object.
-    blocks for 20 seconds before connection is dropped and re-established"""
+def _receive(queue_obj, wait, max_messages=SQS_MAX_BATCH_SIZE):
+    return queue_obj.receive_messages(
+        MaxNumberOfMessages=min(
+            settings.SQS["batch-size"], SQS_MAX_BATCH_SIZE, max_messages
+        ),
+        # time allowed to handle the batch and call delete
+        VisibilityTimeout=settings.SQS["visibility-timeout"],
+        WaitTimeSeconds=wait,
+    )
+
+
+def poll(queue_obj, window=0, max_messages=None):
+    """an infinite poll on the given queue object, yielding non-empty lists of messages.
+    blocks for 20 seconds before connection is dropped and re-established.
+    once a message arrives, messages continue to be received for `window` seconds, or until there are `max_messages`,
+    before the list is yielded."""
+    max_messages = max_messages or settings.SQS["coalesce-max-messages"]
     while True:
-        messages = []
-        while not messages:
-            messages = queue_obj.receive_messages(
-                MaxNumberOfMessages=1,
-                VisibilityTimeout=60,  # time allowed to call delete, can be increased
-                WaitTimeSeconds=20,  # maximum setting for long polling
-            )
+        # maximum setting for long polling
+        messages = _receive(queue_obj, wait=20, max_messages=max_messages)
         if not messages:
             continue
-        message = messages[0]
+        deadline = time.monotonic() + window
+        remaining = window
+        while remaining > 0 and len(messages) < max_messages:
+            messages.extend(
+                _receive(
+                    queue_obj,
+                    wait=min(20, math.ceil(remaining)),
+                    max_messages=max_messages - len(messages),
+                )
+            )
+            remaining = deadline - time.monotonic()
+        yield messages
+
+
+def delete_messages(queue_obj, messages):
+    "deletes the given messages from the queue in batches of up to 10"
+    for chunk in utils.chunks(messages, SQS_MAX_BATCH_SIZE):
+        entries = [
+            {"Id": str(i), "ReceiptHandle": message.receipt_handle}
+            for i, message in enumerate(chunk)
+        ]
+        resp = queue_obj.delete_messages(Entries=entries)
+        for failure in resp.get("Failed", []):
+            LOG.error("failed to delete message from queue: %s", failure)
+
+
+def _worker(fn):
+    "wraps `fn` so the database connections of worker threads are managed as they are for requests"
+
+    def wrapper(event):
+        db.close_old_connections()
         try:
-            yield message.body
+            return fn(event)
         finally:
-            # failing while handling a message will see the message deleted regardless
-            message.delete()
+            db.close_old_connections()
 
-
-def _listen(fn):
-    # `any` doesn't accumulate a list of results in memory so long as `fn` returns false-y values
-    any(fn(event) for event in poll(queue_resource(settings.SQS["queue-name"])))
+    return wrapper
 
 
-def handler(json_event):
+def parse_event(json_event):
+    """returns the msid of the given article event.
+    returns `None` if the event can't be parsed or isn't an article event."""
     try:
         # parse event
         LOG.info("handling event %s" % json_event)
-        event = json.loads(json_event)
+        event = codec.loads(json_event)
         # rule: event id will always be a string
         event_id, event_type = int(event["id"]), event["type"]
-    except (KeyError, ValueError):
+    except (KeyError, TypeError, ValueError):
         LOG.error("skipping unparseable event: %s", str(json_event)[:50])
-        return None  # important
+        return None
 
     if event_type != "article":
         # not interested in non-article events
-        return None  # important
+        return None
+
+    return event_id
 
-    msid = event_id
 
+def coalesce(json_event_list):
+    """returns a list of distinct msids from the given list of events, in the order they were first seen.
+    several events for the same article are handled just once."""
+    msid_list = [parse_event(json_event) for json_event in json_event_list]
+    msid_list = [msid for msid in msid_list if msid is not None]
+    distinct_msid_list = list(OrderedDict.fromkeys(msid_list))
+    coalesced = len(msid_list) - len(distinct_msid_list)
+    metrics.SQS_MESSAGES_COALESCED.inc(coalesced)
+    if coalesced:
+        LOG.info("coalesced %s duplicate article events", coalesced)
+    return distinct_msid_list
+
+
+def _consume(handle_batch):
+    "calls `handle_batch` with the distinct msids of each batch of messages received, then deletes the messages"
+    queue_obj = queue_resource(settings.SQS["queue-name"])
+    for messages in poll(queue_obj, settings.SQS["coalesce-window"]):
+        metrics.SQS_MESSAGES_RECEIVED.inc(len(messages))
+        try:
+            handle_batch(coalesce([message.body for message in messages]))
+        finally:
+            # failing while handling a message will see the message deleted regardless
+            delete_messages(queue_obj, messages)
+
+
+def _listen(fn):
+    "`fn` is called with each distinct msid of a batch by a pool of worker threads"
+    with ThreadPoolExecutor(max_workers=settings.SQS["concurrency"]) as executor:
+        # consuming the results waits for every article in the batch to be handled
+        _consume(lambda msid_list: list(executor.map(_worker(fn), msid_list)))
+
+
+def _listen_async(fn):
+    "`fn` is a coroutine function called with the distinct msids of a batch, see `async_logic.handle_articles`"
+    _consume(async_to_sync(fn))
+
+
+def handle_article(msid):
     try:
-        logic.download_parse_deliver_data(msid)
+        if settings.OUTBOX["enabled"]:
+            outbox.download_parse_enqueue(msid)
+        else:
+            logic.download_parse_deliver_data(msid)
+        metrics.SQS_ARTICLES_HANDLED.inc()
 
     except BaseException:
-        LOG.exception("unhandled exception handling event: %s", json_event)
+        metrics.SQS_ARTICLES_FAILED.inc()
+        LOG.exception("unhandled exception handling article: %s", msid)
 
     return None  # important, ensures results don't accumulate
 
 
+def handler(json_event):
+    msid = parse_event(json_event)
+    if msid is None:
+        return None  # important
+    return handle_article(msid)
+
+
 def listen():
-    handler_fn = handler
-    _listen(handler_fn)
+    if settings.SQS["async"]:
+        _listen_async(async_logic.handle_articles)
+    else:
+        _listen(handle_article)
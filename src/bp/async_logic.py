@@ -0,0 +1,209 @@
+"""an asyncio implementation of downloading, parsing and delivering articles to BioProtocol.
+
+`logic.download_parse_deliver_data` holds a thread for the whole of both network calls.
+here a single event loop keeps many articles in flight at once. failed requests are re-attempted
+with the same backoff as their synchronous counterparts in `logic.py`.
+
+the database is only touched through `sync_to_async`. called via `async_to_sync` (see `resend_many`),
+these calls run in the calling thread and not the event loop's."""
+
+from django.conf import settings
+from asgiref.sync import async_to_sync, sync_to_async
+import asyncio
+import backoff
+import httpx
+import logging
+from . import clients, codec, logic, metrics, models, outbox, utils
+
+LOG = logging.getLogger()
+
+# most networking related exceptions subclass TimeoutException or NetworkError.
+# 4xx and 5xx responses are not re-attempted.
+RETRY_EXCEPTIONS = (httpx.TimeoutException, httpx.NetworkError)
+
+# number of articles handled per event loop by `resend_many`
+RESEND_CHUNK_SIZE = 1000
+
+
+@backoff.on_exception(
+    backoff.expo,
+    RETRY_EXCEPTIONS,
+    max_tries=3,
+    max_time=60,
+    on_backoff=metrics.count_retry,
+)
+async def _get(session, url):
+    resp = await session.get(url)
+    resp.raise_for_status()
+    return resp
+
+
+async def get(session, url):
+    try:
+        return await _get(session, url)
+    except httpx.HTTPStatusError as e:
+        LOG.error(
+            "request failed with status code %r: %s" % (e.response.status_code, url)
+        )
+        return e.response
+    except RETRY_EXCEPTIONS + (clients.CircuitOpen,) as e:
+        # timeouts, connection errors and requests refused by an open circuit have no response
+        LOG.error("request failed with %s: %s" % (e.__class__.__name__, url))
+        return None
+
+
+async def download_elife_article(session, msid):
+    "downloads the latest article data for given msid."
+    url = settings.ELIFE_GATEWAY + "/articles/" + str(msid)
+    resp = await get(session, url)
+    if resp is not None and resp.status_code == 200:
+        return codec.loads(resp.content)
+    return resp
+
+
+async def download_parse_data(session, msid):
+    """downloads and parses the article for the given `msid`, returning the protocol data to deliver to BioProtocol.
+    returns `None` if the article couldn't be downloaded or isn't a VOR."""
+    result = await download_elife_article(session, msid)
+
+    # we failed to connect to the api, this has already been logged
+    if result is None:
+        return
+
+    # we failed to download article_json from the api
+    if isinstance(result, httpx.Response):
+        if result.status_code == 404:
+            return  # not published, unpublished
+        LOG.error(
+            "unhandled response from API requesting article-json for %s: %s"
+            % (utils.pad_msid(msid), result.status_code)
+        )
+        return
+
+    article_json = result
+
+    # only deliver updates to VOR articles
+    if article_json["status"] != "vor":
+        return
+
+    return logic.extract_bioprotocol_response(article_json)
+
+
+@backoff.on_exception(
+    backoff.expo,
+    RETRY_EXCEPTIONS,
+    max_tries=3,
+    max_time=60,
+    on_backoff=metrics.count_retry,
+)
+async def _deliver_protocol_data(session, msid, protocol_data):
+    "POSTs protocol data to BioProtocol."
+    auth = (settings.BP["api_user"], settings.BP["api_password"])
+    resp = await session.post(logic.delivery_url(msid), json=protocol_data, auth=auth)
+    resp.raise_for_status()
+    return resp
+
+
+async def deliver_protocol_data(session, msid, protocol_data):
+    """POSTs protocol data to BioProtocol.
+    exponential backoff will attempt to deliver data N times. the first successful or final unsuccessful response is returned
+    """
+    try:
+        return await _deliver_protocol_data(session, msid, protocol_data)
+    except httpx.HTTPStatusError as e:
+        LOG.error("failed to deliver article %r to BioProtocol: %s" % (msid, str(e)))
+        return e.response
+    except RETRY_EXCEPTIONS + (clients.CircuitOpen,) as e:
+        LOG.error("failed to deliver article %r to BioProtocol: %s" % (msid, str(e)))
+    except Exception as e:
+        LOG.exception(
+            "unhandled exception attempting to deliver article '%s' to BioProtocol: %s"
+            % (msid, str(e))
+        )
+
+
+async def resend_article(session, msid, force=False, dry_run=False):
+    """downloads, parses and delivers the protocol data for the given `msid` to BioProtocol.
+    returns a triple of (msid, outcome, protocol data), see `logic.resend_articles`."""
+    try:
+        protocol_data = await download_parse_data(session, msid)
+    except Exception:
+        LOG.exception("unhandled exception downloading article %r" % msid)
+        return msid, logic.RESEND_FAILED, None
+
+    if protocol_data is None:
+        return msid, logic.RESEND_NOT_FOUND, None
+
+    if dry_run:
+        return msid, logic.RESEND_DRY_RUN, protocol_data
+
+    try:
+        digest = logic.fingerprint(protocol_data)
+        if not force and await sync_to_async(logic.is_delivered)(msid, digest):
+            return msid, logic.RESEND_UNCHANGED, protocol_data
+
+        resp = await deliver_protocol_data(session, msid, protocol_data)
+        if resp is None or not resp.is_success:
+            return msid, logic.RESEND_FAILED, protocol_data
+
+        await sync_to_async(utils.create_or_update)(
+            models.DeliveryFingerprint, {"msid": msid, "digest": digest}, ["msid"]
+        )
+    except Exception:
+        LOG.exception("unhandled exception resending article %r" % msid)
+        return msid, logic.RESEND_FAILED, protocol_data
+    return msid, logic.RESEND_DELIVERED, protocol_data
+
+
+async def resend_articles(
+    msid_list,
+    concurrency=100,
+    host_concurrency=None,
+    force=False,
+    dry_run=False,
+    transport=None,
+):
+    """downloads, parses and delivers the protocol data for many articles to BioProtocol.
+    up to `concurrency` articles are in flight at once with no more than `host_concurrency` requests
+    in flight to each of the eLife API gateway and BioProtocol.
+    returns a list of (msid, outcome, protocol data) triples, in the order given."""
+    in_flight = asyncio.Semaphore(concurrency)
+    host_concurrency = host_concurrency or concurrency
+    async with clients.AsyncSession(host_concurrency, transport) as session:
+
+        async def resend(msid):
+            async with in_flight:
+                return await resend_article(session, msid, force, dry_run)
+
+        return await asyncio.gather(*[resend(msid) for msid in msid_list])
+
+
+def resend_many(msid_list, chunk_size=None, **kwargs):
+    """like `logic.resend_articles`, but each chunk of articles is handled by `resend_articles` in an event loop.
+    yields a triple of (msid, outcome, protocol data) per-article, in the order given.
+    """
+    for msid_chunk in utils.chunks(msid_list, chunk_size or RESEND_CHUNK_SIZE):
+        yield from async_to_sync(resend_articles)(msid_chunk, **kwargs)
+
+
+async def handle_articles(msid_list):
+    """handles a batch of articles received by the update listener, see `article_update_logic.listen`.
+    an article that fails is logged and counted, like `article_update_logic.handle_article`, the rest are still handled.
+    if the outbox is enabled the protocol data is queued for delivery rather than delivered, see `outbox.enqueue`.
+    """
+    enqueue = settings.OUTBOX["enabled"]
+    results = await resend_articles(
+        msid_list, concurrency=settings.SQS["concurrency"], dry_run=enqueue
+    )
+    for msid, outcome, protocol_data in results:
+        if outcome == logic.RESEND_DRY_RUN:
+            try:
+                await sync_to_async(outbox.enqueue)(msid, protocol_data)
+            except Exception:
+                LOG.exception("unhandled exception handling article: %s", msid)
+                outcome = logic.RESEND_FAILED
+        if outcome == logic.RESEND_FAILED:
+            metrics.SQS_ARTICLES_FAILED.inc()
+        else:
+            metrics.SQS_ARTICLES_HANDLED.inc()
+    return None  # important, ensures results don't accumulate
@@ -0,0 +1,119 @@
+"""read-through cache of rendered article responses and their ETag and Last-Modified values, keyed by msid.
+
+the default backend is an in-process LRU cache. the 'django' backend uses one of Django's `CACHES` and can be shared
+between processes. entries expire after the 'ttl' setting in the 'cache' section of `app.cfg`.
+
+a cached entry is served without querying the database. an entry is discarded once new data for the article is
+committed (see `logic.add_result`), but only from this process's cache when using the 'lru' backend. an article written
+by another process, or written while it's entry was being cached, may be served stale until the entry expires.
+"""
+
+from django.conf import settings
+from django.core.cache import caches
+from collections import OrderedDict
+import threading
+import time
+
+
+class LRUCache:
+    """a thread-safe, size-bounded, in-process cache that evicts the least recently used entry.
+    entries expire `ttl` seconds after they are set."""
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.data = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            if key not in self.data:
+                return None
+            expires, val = self.data[key]
+            if expires <= time.monotonic():
+                del self.data[key]
+                return None
+            self.data.move_to_end(key)
+            return val
+
+    def set(self, key, val):
+        with self.lock:
+            self.data[key] = (time.monotonic() + self.ttl, val)
+            self.data.move_to_end(key)
+            while len(self.data) > self.maxsize:
+                self.data.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.data.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.data.clear()
+
+
+class DjangoCache:
+    "a thin wrapper around one of Django's configured `CACHES`"
+
+    def __init__(self, alias, ttl):
+        self.cache = caches[alias]
+        self.ttl = ttl
+
+    def _key(self, key):
+        return "bp:article:%s" % key
+
+    def get(self, key):
+        return self.cache.get(self._key(key))
+
+    def set(self, key, val):
+        self.cache.set(self._key(key), val, timeout=self.ttl)
+
+    def delete(self, key):
+        self.cache.delete(self._key(key))
+
+    def clear(self):
+        self.cache.clear()
+
+
+BACKENDS = {
+    "lru": lambda: LRUCache(
+        settings.RESPONSE_CACHE["size"], settings.RESPONSE_CACHE["ttl"]
+    ),
+    "django": lambda: DjangoCache(
+        settings.RESPONSE_CACHE["django-cache"], settings.RESPONSE_CACHE["ttl"]
+    ),
+}
+
+_CACHE = None
+_CACHE_LOCK = threading.Lock()
+
+
+def backend():
+    "returns the configured cache backend, creating it if necessary"
+    global _CACHE
+    with _CACHE_LOCK:
+        if _CACHE is None:
+            _CACHE = BACKENDS[settings.RESPONSE_CACHE["backend"]]()
+        return _CACHE
+
+
+def get(msid):
+    "returns the cached response entry for the given `msid` or `None`"
+    if not settings.RESPONSE_CACHE["enabled"]:
+        return None
+    return backend().get(int(msid))
+
+
+def put(msid, entry):
+    if settings.RESPONSE_CACHE["enabled"]:
+        backend().set(int(msid), entry)
+
+
+def invalidate(msid):
+    if settings.RESPONSE_CACHE["enabled"]:
+        backend().delete(int(msid))
+
+
+def clear():
+    if settings.RESPONSE_CACHE["enabled"]:
+        backend().clear()
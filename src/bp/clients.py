@@ -0,0 +1,263 @@
+"""shared HTTP sessions for talking to the eLife API gateway and BioProtocol.
+
+a session is created per-host and reused so connections are pooled and kept alive between requests.
+every request is given the connect and read timeouts configured in the 'http' section of app.cfg.
+
+requests to each host are rate limited with a token bucket and guarded by a circuit breaker, both configured in the
+'http' section. while a host's circuit is open requests to it fail immediately with `CircuitOpen` rather than waiting
+on timeouts and retries. rate limiters and circuit breakers are shared by every thread of a process. the state of each
+circuit is reported by the process making the requests as the `bp_circuit_state` metric.
+
+`AsyncSession` is the asyncio counterpart used by `bp/async_logic.py`."""
+
+from django.conf import settings
+from urllib.parse import urlsplit
+import asyncio
+import httpx
+import requests, requests.adapters
+import threading
+import time
+from . import metrics, utils
+
+_SESSIONS = {}
+_SESSIONS_LOCK = threading.Lock()
+
+_RATE_LIMITS = {}
+_BREAKERS = {}
+
+
+class CircuitOpen(requests.exceptions.ConnectionError):
+    "raised instead of making a request to a host whose circuit is open"
+
+
+def circuit_open(e):
+    "a `backoff` give-up predicate, requests refused by an open circuit are not re-attempted"
+    return isinstance(e, CircuitOpen)
+
+
+class CircuitBreaker:
+    """a thread-safe circuit breaker for a single host.
+    the circuit opens after `threshold` consecutive failures and requests are refused until `reset_timeout` seconds have
+    passed. a single trial request is then let through, closing the circuit if it succeeds or re-opening it if not.
+    a `threshold` of zero disables the breaker.
+    the state of the breaker is reported by the `bp_circuit_state` metric when given the `host` it guards.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half-open"
+
+    # values of the `bp_circuit_state` metric
+    METRIC_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+    def __init__(self, threshold, reset_timeout, host=None):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.host = host
+        self.failures = 0
+        self.opened = None
+        self.lock = threading.Lock()
+        self._set_state(self.CLOSED)
+
+    def _set_state(self, state):
+        self.state = state
+        if self.host is not None:
+            metrics.CIRCUIT_STATE.labels(self.host).set(self.METRIC_VALUES[state])
+
+    def allow(self):
+        "returns `True` if a request may be made"
+        with self.lock:
+            if self.state == self.CLOSED:
+                return True
+            if (
+                self.state == self.OPEN
+                and time.monotonic() - self.opened >= self.reset_timeout
+            ):
+                self._set_state(self.HALF_OPEN)
+                return True
+            # open, or half-open with the trial request still in flight
+            return False
+
+    def record(self, ok):
+        "records the outcome of a request allowed by `allow`"
+        with self.lock:
+            if ok:
+                self._set_state(self.CLOSED)
+                self.failures = 0
+                return
+            self.failures += 1
+            if self.state == self.HALF_OPEN or (
+                self.threshold and self.failures >= self.threshold
+            ):
+                self._set_state(self.OPEN)
+                self.opened = time.monotonic()
+
+    def info(self):
+        "returns a map of the state of the breaker and the number of consecutive failures"
+        with self.lock:
+            return {"state": self.state, "failures": self.failures}
+
+
+def host(url):
+    "returns the host (and port, if any) of the given `url`"
+    return urlsplit(url).netloc
+
+
+def session(url):
+    "returns the shared session for the host of the given `url`, creating it if necessary"
+    key = host(url)
+    with _SESSIONS_LOCK:
+        if key not in _SESSIONS:
+            sess = requests.Session()
+            # `pool_block` caps the number of concurrent connections to the host at `pool-size`
+            adapter = requests.adapters.HTTPAdapter(
+                pool_connections=1,
+                pool_maxsize=settings.HTTP["pool-size"],
+                pool_block=True,
+            )
+            sess.mount("http://", adapter)
+            sess.mount("https://", adapter)
+            sess.headers["user-agent"] = settings.USER_AGENT
+            _SESSIONS[key] = sess
+        return _SESSIONS[key]
+
+
+def rate_limit(url):
+    "returns the token bucket limiting requests to the host of the given `url`, or `None` if unlimited"
+    if not settings.HTTP["rate"]:
+        return None
+    key = host(url)
+    with _SESSIONS_LOCK:
+        if key not in _RATE_LIMITS:
+            _RATE_LIMITS[key] = utils.TokenBucket(
+                settings.HTTP["rate"], settings.HTTP["burst"]
+            )
+        return _RATE_LIMITS[key]
+
+
+def breaker(url):
+    "returns the circuit breaker for the host of the given `url`, creating it if necessary"
+    key = host(url)
+    with _SESSIONS_LOCK:
+        if key not in _BREAKERS:
+            _BREAKERS[key] = CircuitBreaker(
+                settings.HTTP["breaker-threshold"],
+                settings.HTTP["breaker-reset"],
+                host=key,
+            )
+        return _BREAKERS[key]
+
+
+def reset():
+    "closes and discards all sessions, rate limiters and circuit breakers"
+    with _SESSIONS_LOCK:
+        for sess in _SESSIONS.values():
+            sess.close()
+        _SESSIONS.clear()
+        _RATE_LIMITS.clear()
+        _BREAKERS.clear()
+
+
+def timeout():
+    "returns a pair of (connect, read) timeouts in seconds"
+    return (settings.HTTP["connect-timeout"], settings.HTTP["read-timeout"])
+
+
+def succeeded(status):
+    "returns `True` if a request that ended with the given `status` shouldn't count against the host's circuit breaker"
+    return status is not None and status < 500 and status != 429
+
+
+def guard(url):
+    """raises `CircuitOpen` if the circuit of the host of the given `url` is open.
+    returns the circuit breaker the outcome of the request must be recorded with, whatever happens next. a half-open
+    circuit refuses every request until the outcome of it's trial request is recorded.
+    """
+    circuit = breaker(url)
+    if not circuit.allow():
+        metrics.CIRCUIT_OPEN_REQUESTS.labels(host(url)).inc()
+        raise CircuitOpen("circuit open, not requesting: %s" % url)
+    return circuit
+
+
+def request(method, url, **kwargs):
+    kwargs.setdefault("timeout", timeout())
+    circuit = guard(url)
+    status = None
+    try:
+        bucket = rate_limit(url)
+        if bucket:
+            bucket.acquire()
+        start = time.perf_counter()
+        try:
+            resp = session(url).request(method, url, **kwargs)
+            status = resp.status_code
+            return resp
+        finally:
+            metrics.observe_http(host(url), method, status, start)
+    finally:
+        circuit.record(succeeded(status))
+
+
+def get(url, **kwargs):
+    return request("GET", url, **kwargs)
+
+
+def post(url, **kwargs):
+    return request("POST", url, **kwargs)
+
+
+class AsyncSession:
+    """an httpx client for use within a single event loop.
+    no more than `host_concurrency` requests are in flight to each host at a time."""
+
+    def __init__(self, host_concurrency=None, transport=None):
+        self.host_concurrency = host_concurrency or settings.HTTP["pool-size"]
+        self.limits = {}
+        connect_timeout, read_timeout = timeout()
+        self.client = httpx.AsyncClient(
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+            limits=httpx.Limits(
+                max_connections=None, max_keepalive_connections=self.host_concurrency
+            ),
+            headers={"user-agent": settings.USER_AGENT},
+            transport=transport,
+        )
+
+    def limit(self, url):
+        "returns the semaphore capping requests to the host of the given `url`"
+        key = host(url)
+        if key not in self.limits:
+            self.limits[key] = asyncio.Semaphore(self.host_concurrency)
+        return self.limits[key]
+
+    async def request(self, method, url, **kwargs):
+        circuit = guard(url)
+        status = None
+        # a request cancelled while waiting on the rate limit or the semaphore is recorded as a failure
+        try:
+            bucket = rate_limit(url)
+            if bucket:
+                await asyncio.sleep(bucket.reserve())
+            async with self.limit(url):
+                start = time.perf_counter()
+                try:
+                    resp = await self.client.request(method, url, **kwargs)
+                    status = resp.status_code
+                    return resp
+                finally:
+                    metrics.observe_http(host(url), method, status, start)
+        finally:
+            circuit.record(succeeded(status))
+
+    async def get(self, url, **kwargs):
+        return await self.request("GET", url, **kwargs)
+
+    async def post(self, url, **kwargs):
+        return await self.request("POST", url, **kwargs)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.client.aclose()
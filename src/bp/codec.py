@@ -0,0 +1,106 @@
+"""a pluggable JSON codec for parsing requests and rendering responses.
+
+`orjson` is used if it's installed, then `ujson`, then the standard library's `json`. a backend can be chosen with
+'json-backend' in the 'api' section of `app.cfg`. every backend returns compact JSON with the same separators as
+`json.dumps(..., separators=(",", ":"))` and indented JSON in the same format as `json.dumps(..., indent=...)`.
+"""
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+
+class StdlibCodec:
+    "the standard library's `json` module"
+
+    name = "json"
+
+    def loads(self, data):
+        return json.loads(data)
+
+    def dumps(self, obj, indent=None, sort_keys=False):
+        separators = None if indent else (",", ":")
+        return json.dumps(
+            obj,
+            indent=indent,
+            sort_keys=sort_keys,
+            separators=separators,
+            cls=DjangoJSONEncoder,
+        ).encode()
+
+
+class OrjsonCodec:
+    "`orjson`. it can only indent by two spaces, other indents are rendered by the standard library"
+
+    name = "orjson"
+
+    def loads(self, data):
+        return orjson.loads(data)
+
+    def dumps(self, obj, indent=None, sort_keys=False):
+        if indent and indent != 2:
+            return STDLIB.dumps(obj, indent=indent, sort_keys=sort_keys)
+        option = orjson.OPT_NON_STR_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        if sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        return orjson.dumps(obj, default=DjangoJSONEncoder().default, option=option)
+
+
+class UjsonCodec:
+    "`ujson`. indented JSON is rendered by the standard library as `ujson` doesn't separate keys and values the same way"
+
+    name = "ujson"
+
+    def loads(self, data):
+        return ujson.loads(data)
+
+    def dumps(self, obj, indent=None, sort_keys=False):
+        if indent:
+            return STDLIB.dumps(obj, indent=indent, sort_keys=sort_keys)
+        return ujson.dumps(
+            obj,
+            sort_keys=sort_keys,
+            ensure_ascii=False,
+            escape_forward_slashes=False,
+            default=DjangoJSONEncoder().default,
+        ).encode()
+
+
+STDLIB = StdlibCodec()
+
+BACKENDS = {"json": STDLIB}
+if ujson is not None:
+    BACKENDS["ujson"] = UjsonCodec()
+if orjson is not None:
+    BACKENDS["orjson"] = OrjsonCodec()
+
+# the fastest backend available
+DEFAULT = BACKENDS.get("orjson") or BACKENDS.get("ujson") or STDLIB
+
+
+def backend():
+    "returns the configured JSON backend, or the fastest one available if not configured"
+    name = settings.API["json-backend"]
+    return BACKENDS[name] if name else DEFAULT
+
+
+def loads(data):
+    "parses the given JSON `str` or `bytes`"
+    return backend().loads(data)
+
+
+def dumps(obj, indent=None, sort_keys=False):
+    "returns `obj` as JSON `bytes`, compact unless indented by `indent` spaces"
+    return backend().dumps(obj, indent=indent, sort_keys=sort_keys)
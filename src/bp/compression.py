@@ -0,0 +1,109 @@
+"""compression of response bodies, negotiated with the Accept-Encoding header of the request.
+
+brotli is used if the optional `brotli` package is installed and the client accepts it, gzip otherwise.
+responses smaller than the 'compress-min-size' setting in the 'api' section of app.cfg are left as they are.
+streaming responses are compressed as they're streamed, whatever their size."""
+
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+from django.utils.text import compress_sequence, compress_string
+from functools import wraps
+
+try:
+    import brotli
+except ImportError:  # optional
+    brotli = None
+
+# brotli's default quality of 11 is meant for static content and is slower than gzip by two orders of magnitude.
+# 4 compresses better than gzip in about the same time.
+BROTLI_QUALITY = 4
+
+
+def accepted_encodings(request):
+    "returns a map of content-coding to quality value from the Accept-Encoding header of the given request"
+    accepted = {}
+    for coding in request.META.get("HTTP_ACCEPT_ENCODING", "").split(","):
+        coding, *params = [bit.strip() for bit in coding.split(";")]
+        if not coding:
+            continue
+        quality = 1.0
+        for param in params:
+            key, _, val = param.partition("=")
+            if key.strip() == "q":
+                try:
+                    quality = float(val)
+                except ValueError:
+                    quality = 0
+        accepted[coding.lower()] = quality
+    return accepted
+
+
+def negotiate(request):
+    "returns the content-coding to compress the response to the given request with, or `None`"
+    accepted = accepted_encodings(request)
+    candidates = (["br"] if brotli else []) + ["gzip"]
+    for coding in candidates:
+        if accepted.get(coding, accepted.get("*", 0)) > 0:
+            return coding
+    return None
+
+
+def compress(coding, content):
+    if coding == "br":
+        return brotli.compress(content, quality=BROTLI_QUALITY)
+    return compress_string(content)
+
+
+def compress_stream(coding, chunks):
+    "yields the given iterable of byte chunks compressed"
+    if coding == "br":
+        compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+        for chunk in chunks:
+            yield compressor.process(chunk)
+        yield compressor.finish()
+    else:
+        yield from compress_sequence(chunks)
+
+
+def compress_streaming_response(request, response):
+    patch_vary_headers(response, ("Accept-Encoding",))
+    coding = negotiate(request)
+    if not coding:
+        return response
+    response.streaming_content = compress_stream(coding, response.streaming_content)
+    response["Content-Encoding"] = coding
+    return response
+
+
+def compress_response(request, response):
+    "compresses the content of the given response in place if it's large enough and the client accepts it"
+    if not settings.API["compress"] or response.has_header("Content-Encoding"):
+        return response
+    if response.streaming:
+        return compress_streaming_response(request, response)
+    if len(response.content) < settings.API["compress-min-size"]:
+        return response
+
+    patch_vary_headers(response, ("Accept-Encoding",))
+    coding = negotiate(request)
+    if not coding:
+        return response
+
+    response.content = compress(coding, response.content)
+    response["Content-Length"] = str(len(response.content))
+    response["Content-Encoding"] = coding
+    # the compressed content is a different representation, see `django.middleware.gzip.GZipMiddleware`
+    etag = response.get("ETag")
+    if etag and etag.startswith('"'):
+        response["ETag"] = "W/" + etag
+    return response
+
+
+def compressed(view):
+    "decorates a view so it's responses are compressed, see `compress_response`"
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        return compress_response(request, view(request, *args, **kwargs))
+
+    return wrapper
@@ -1,10 +1,21 @@
 from django.conf import settings
-from . import models, utils
+from django.db import transaction
+from django.db.models import Count, DateTimeField, F, Max, Q, Value
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from . import cache, clients, codec, metrics, models, utils
 from .utils import rename_key, ensure, first, merge, splitfilter
 import logging
+import hashlib
+import threading
+import json
 import requests, requests.exceptions
 import backoff
+import ijson
 from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode
 
 LOG = logging.getLogger()
 
@@ -22,6 +33,15 @@ class ProcessingError(BPError):
     pass
 
 
+class WriteError(ProcessingError):
+    "an unhandled exception writing an article's results, see `add_results`"
+    pass
+
+
+class SyncError(BPError):
+    pass
+
+
 def format_error(bperr):
     # "ValidationError: 'KeyError' thrown with message 'URI' on data: {...}"
     clsname = lambda e: e.__class__.__name__
@@ -62,15 +82,166 @@ def serialise_protocol_data(apobj):
 def protocol_data(msid):
     """returns a list of protocol data given an msid.
     raises `ArticleProtocol.DoesNotExist` if no data for given `msid` found."""
-    protocol_data = models.ArticleProtocol.objects.filter(msid=msid)
-    if not protocol_data:
+    items = [
+        serialise_protocol_data(apobj)
+        for apobj in models.ArticleProtocol.objects.filter(msid=msid, is_protocol=True)
+    ]
+    # protocol data for an article may exist, but may be empty after stripping non-protocol results.
+    # only then is a second query needed to tell the two apart.
+    if not items and not models.ArticleProtocol.objects.filter(msid=msid).exists():
         raise models.ArticleProtocol.DoesNotExist()
-    # protocol data for an article may exist, but may be empty after stripping non-protocol results
-    protocol_data = protocol_data.filter(is_protocol=True)
-    items = [serialise_protocol_data(apobj) for apobj in protocol_data]
     return {"total": len(items), "items": items}
 
 
+def make_etag(*bits):
+    "returns a strong ETag derived from the given values"
+    return '"%s"' % hashlib.sha1(repr(bits).encode()).hexdigest()
+
+
+def article_validators(msid):
+    """returns a pair of (etag, last_modified) for the protocol data of the given `msid` using a single aggregate query.
+    raises `ArticleProtocol.DoesNotExist` if no data for given `msid` found."""
+    agg = models.ArticleProtocol.objects.filter(msid=msid).aggregate(
+        last_modified=Max("datetime_record_updated"), count=Count("id")
+    )
+    if not agg["count"]:
+        raise models.ArticleProtocol.DoesNotExist()
+    etag = make_etag(int(msid), agg["count"], agg["last_modified"].isoformat())
+    return etag, agg["last_modified"]
+
+
+# number of rows read from the database at a time by `export_rows`
+EXPORT_CHUNK_SIZE = 2000
+
+# fields of each row exported by `export_rows`, in order
+EXPORT_FIELDS = ["msid"] + list(PROTOCOL_DATA_KEYS.values()) + ["updated"]
+
+
+def export_rows(since=None, chunk_size=None):
+    """yields a map of `EXPORT_FIELDS` for every protocol, ordered by article, optionally only those updated at or after
+    `since`. rows are read `chunk_size` at a time with a server-side cursor where the database supports it,
+    so they're never all held in memory."""
+    queryset = models.ArticleProtocol.objects.filter(is_protocol=True)
+    if since:
+        queryset = queryset.filter(datetime_record_updated__gte=since)
+    queryset = queryset.order_by("msid", "protocol_sequencing_number")
+    for apobj in queryset.iterator(chunk_size=chunk_size or EXPORT_CHUNK_SIZE):
+        row = serialise_protocol_data(apobj)
+        row["msid"] = apobj.msid
+        row["updated"] = apobj.datetime_record_updated.isoformat()
+        yield {field: row[field] for field in EXPORT_FIELDS}
+
+
+def render_document(msid, apobj_list):
+    """returns a map of the rendered protocol data of an article and it's ETag and Last-Modified values,
+    given every `ArticleProtocol` row of the article. see `protocol_data` and `article_validators`.
+    """
+    items = [
+        serialise_protocol_data(apobj) for apobj in apobj_list if apobj.is_protocol
+    ]
+    last_modified = max(apobj.datetime_record_updated for apobj in apobj_list)
+    content = codec.dumps({"total": len(items), "items": items})
+    return {
+        "etag": make_etag(int(msid), len(apobj_list), last_modified.isoformat()),
+        "last-modified": last_modified,
+        "content": content,
+    }
+
+
+def store_document(msid, document, exists=True):
+    """writes the given rendered `document` of an article to `ArticleDocument`.
+    `exists` can be `False` if the article is known not to have a document, saving a query.
+    """
+    fields = {
+        "content": document["content"],
+        "etag": document["etag"],
+        "last_modified": document["last-modified"],
+    }
+    if exists:
+        updated = models.ArticleDocument.objects.filter(msid=msid).update(
+            datetime_record_updated=timezone.now(), **fields
+        )
+        if updated:
+            return
+    models.ArticleDocument.objects.create(msid=msid, **fields)
+
+
+def update_document(msid):
+    """renders and stores the document of the given `msid` from it's rows in `ArticleProtocol`, returning the document.
+    raises `ArticleProtocol.DoesNotExist` if no data for given `msid` found."""
+    apobj_list = list(models.ArticleProtocol.objects.filter(msid=msid).order_by("id"))
+    if not apobj_list:
+        raise models.ArticleProtocol.DoesNotExist()
+    document = render_document(msid, apobj_list)
+    store_document(msid, document)
+    return document
+
+
+def article_document(msid):
+    """returns a map of the rendered protocol data of the given `msid` and it's ETag and Last-Modified values,
+    read from `ArticleDocument` with a single indexed lookup. the document is rendered if it's missing.
+    raises `ArticleProtocol.DoesNotExist` if no data for given `msid` found."""
+    row_list = list(
+        models.ArticleDocument.objects.filter(msid=msid).values_list(
+            "content", "etag", "last_modified"
+        )[:1]
+    )
+    if not row_list:
+        return update_document(msid)
+    content, etag, last_modified = row_list[0]
+    return {"etag": etag, "last-modified": last_modified, "content": bytes(content)}
+
+
+# primary key of the single row of `ProtocolSummary`
+SUMMARY_ID = 1
+
+
+def rebuild_summary():
+    """recalculates the summary of `ArticleProtocol` with a single aggregate query and stores it.
+    returns the `ProtocolSummary`."""
+    with transaction.atomic():
+        agg = models.ArticleProtocol.objects.aggregate(
+            last_updated=Max("datetime_record_updated"),
+            row_count=Count("id", filter=Q(is_protocol=True)),
+        )
+        summary_obj, _ = models.ProtocolSummary.objects.update_or_create(
+            pk=SUMMARY_ID,
+            defaults={
+                "row_count": agg["row_count"],
+                "last_updated": agg["last_updated"],
+            },
+        )
+    return summary_obj
+
+
+def update_summary(row_count_delta, last_updated):
+    """adjusts the number of protocols in the summary by `row_count_delta` and sets the date of the most recently
+    updated row, unless a later one was already recorded. the summary is rebuilt if it doesn't exist.
+    """
+    last_updated = Value(last_updated, output_field=DateTimeField())
+    updated = models.ProtocolSummary.objects.filter(pk=SUMMARY_ID).update(
+        row_count=F("row_count") + row_count_delta,
+        # null if nothing was recorded, with sqlite
+        last_updated=Coalesce(Greatest("last_updated", last_updated), last_updated),
+    )
+    if not updated:
+        rebuild_summary()
+
+
+def summary():
+    """returns a map of the date of the most recently updated row and the number of protocols in the database,
+    read from the single row of `ProtocolSummary`. the date is `None` if there is no data in the database.
+    """
+    try:
+        summary_obj = models.ProtocolSummary.objects.get(pk=SUMMARY_ID)
+    except models.ProtocolSummary.DoesNotExist:
+        summary_obj = rebuild_summary()
+    return {
+        "last-updated": summary_obj.last_updated,
+        "row-count": summary_obj.row_count,
+    }
+
+
 def last_updated():
     """returns an iso8601 formatted date of the most recently updated row in db.
     returns None if no data in database."""
@@ -147,11 +318,20 @@ def validate(result):
 
 
 def upsert(result):
-    return first(
-        utils.create_or_update(
-            models.ArticleProtocol, result, ["msid", "protocol_sequencing_number"]
+    key_list = ["msid", "protocol_sequencing_number"]
+    with transaction.atomic():
+        was_protocol = (
+            models.ArticleProtocol.objects.filter(**utils.subdict(result, key_list))
+            .values_list("is_protocol", flat=True)
+            .first()
         )
-    )
+        apobj = first(utils.create_or_update(models.ArticleProtocol, result, key_list))
+        update_summary(
+            apobj.is_protocol - bool(was_protocol), apobj.datetime_record_updated
+        )
+        update_document(apobj.msid)
+    transaction.on_commit(lambda: cache.invalidate(apobj.msid))
+    return apobj
 
 
 def _add_result_item(result):
@@ -169,75 +349,181 @@ def _add_result_item(result):
         raise
 
 
+def _process_result_item(result):
+    "pre-processes and validates an individual result in the `data` list, returning the error on failure"
+    try:
+        return validate(pre_process(result))
+    except (ProcessingError, ValidationError) as pe:
+        LOG.error(format_error(pe))
+        return pe
+
+
+# fields written to an existing row when it is updated.
+# `datetime_record_updated` is included as `bulk_update` doesn't honour `auto_now`.
+UPDATE_FIELDS = [
+    "protocol_title",
+    "is_protocol",
+    "protocol_status",
+    "uri",
+    "datetime_record_updated",
+]
+
+
+def bulk_upsert(msid, result_list):
+    """creates or updates the given processed and validated results for a single `msid`.
+    existing rows are fetched in a single query and all writes happen within a single transaction.
+    returns a list of `ArticleProtocol` objects, one per result."""
+    existing = {
+        apobj.protocol_sequencing_number: apobj
+        for apobj in models.ArticleProtocol.objects.filter(msid=msid).order_by("id")
+    }
+    was_protocol = {key: apobj.is_protocol for key, apobj in existing.items()}
+    now = timezone.now()
+    to_create, to_update = OrderedDict(), OrderedDict()
+    apobj_list = []
+    for result in result_list:
+        key = result["protocol_sequencing_number"]
+        apobj = existing.get(key) or to_create.get(key)
+        if apobj:
+            [setattr(apobj, attr, val) for attr, val in result.items()]
+        else:
+            apobj = to_create[key] = models.ArticleProtocol(**result)
+        if apobj.pk:
+            to_update[key] = apobj
+            apobj.datetime_record_updated = now
+        # uniqueness is guaranteed by the lookup above, skip the extra query per-row
+        apobj.full_clean(validate_unique=False)
+        apobj_list.append(apobj)
+
+    if not apobj_list:
+        return apobj_list
+
+    # protocols created, plus existing rows that became protocols, less those that stopped being protocols
+    row_count_delta = sum(apobj.is_protocol for apobj in to_create.values()) + sum(
+        apobj.is_protocol - was_protocol[key] for key, apobj in to_update.items()
+    )
+
+    with transaction.atomic():
+        models.ArticleProtocol.objects.bulk_create(to_create.values())
+        models.ArticleProtocol.objects.bulk_update(to_update.values(), UPDATE_FIELDS)
+        # `bulk_create` sets `datetime_record_updated` on each new row
+        update_summary(
+            row_count_delta,
+            max(apobj.datetime_record_updated for apobj in apobj_list),
+        )
+        # every row of the article is either existing or new, no need to fetch them again
+        article = list(existing.values()) + list(to_create.values())
+        store_document(msid, render_document(msid, article), exists=bool(existing))
+
+    return apobj_list
+
+
 def add_result(result):
     msid = result["elifeID"]
-    result_list = result["data"]
+    metrics.ADD_RESULT_ROWS.observe(len(result["data"]))
     result_list = [
-        _add_result_item(merge(result, {"msid": msid})) for result in result_list
+        _process_result_item(merge(result, {"msid": msid})) for result in result["data"]
     ]
-    failed, successful = splitfilter(lambda x: isinstance(x, BPError), result_list)
+    failed, processed = splitfilter(lambda x: isinstance(x, BPError), result_list)
+    try:
+        successful = bulk_upsert(msid, processed)
+    except:
+        LOG.exception("unhandled exception attempting to add rows to database")
+        raise
+    # the cached response is discarded once the write is committed, immediately if not within a transaction
+    transaction.on_commit(lambda: cache.invalidate(msid))
     return {"msid": msid, "successful": successful, "failed": failed}
 
 
+# number of results written per-transaction by `add_results`
+ADD_RESULTS_CHUNK_SIZE = 100
+
+
+def add_results(result_list, chunk_size=None):
+    """adds many results, each a map of `elifeID` and `data`, writing each chunk of results in a single transaction.
+    yields the return value of `add_result` for each result.
+    a result that fails with an unhandled exception is rolled back and reported as a failure, the rest of the chunk is kept.
+    """
+    for chunk in utils.chunks(result_list, chunk_size or ADD_RESULTS_CHUNK_SIZE):
+        chunk_results = []
+        with transaction.atomic():
+            for result in chunk:
+                try:
+                    with transaction.atomic():
+                        chunk_results.append(add_result(result))
+                except Exception as e:
+                    LOG.exception(
+                        "unhandled exception adding result for article %r",
+                        result["elifeID"],
+                    )
+                    pe = WriteError(str(e))
+                    pe.data = result
+                    pe.original = e
+                    chunk_results.append(
+                        {"msid": result["elifeID"], "successful": [], "failed": [pe]}
+                    )
+        yield from chunk_results
+
+
+def write_failed(result):
+    "returns True if the given `add_results` result failed to be written at all, rather than having invalid rows"
+    return any(isinstance(err, WriteError) for err in result["failed"])
+
+
 # elife -> bioprotocol
 # when a new article event is received we fetch the article, parse it and then POST it to BP
 
 
-def visit(data, pred, fn, coll=None):
-    "visits every value in the given data and applies `fn` when `pred` is true"
-    if pred(data):
-        if coll is not None:
-            data = fn(data, coll)
-        else:
-            data = fn(data)
-        # why don't we return here after matching?
-        # the match may contain matches within child elements (lists, dicts)
-        # we want to visit them, too
-    if isinstance(data, OrderedDict):
-        results = OrderedDict()
+def is_mandms(data):
+    "returns True if the given dictionary is a 'materials and methods' section"
+    title = data.get("title")
+    return bool(title) and title.lower() == "materials and methods"
+
+
+def _children(data, within_mandms):
+    "yields pairs of (value, is the value within a 'materials and methods' section?) for each value in a dict or list"
+    if isinstance(data, dict):
+        mandms = is_mandms(data)
         for key, val in data.items():
-            results[key] = visit(val, pred, fn, coll)
-        return results
-    elif isinstance(data, dict):
-        return OrderedDict(
-            [(key, visit(val, pred, fn, coll)) for key, val in data.items()]
-        )
-    elif isinstance(data, list):
-        return [visit(row, pred, fn, coll) for row in data]
-    # unsupported type/no further matches
-    return data
+            yield val, within_mandms or (mandms and key == "content")
+    else:
+        for row in data:
+            yield row, within_mandms
 
 
+def mandms_sections(article_json):
+    """yields each section within the content of any 'materials and methods' section of the given article-json.
+    the article-json is walked once, depth-first and in document order, and is not copied or modified.
+    """
+    # a stack of iterators over the children of each value being visited, bounded by the depth of the article-json
+    stack = [iter([(article_json, False)])]
+    while stack:
+        pair = next(stack[-1], None)
+        if pair is None:
+            stack.pop()
+            continue
+        data, within_mandms = pair
+        if isinstance(data, dict):
+            if within_mandms and data.get("type") == "section":
+                yield data
+            # sections may contain sections within them, we want to visit them, too
+            stack.append(_children(data, within_mandms))
+        elif isinstance(data, list):
+            stack.append(_children(data, within_mandms))
+        # unsupported type/no further matches
+
+
+@metrics.EXTRACT_PROTOCOLS_SECONDS.time()
 def extract_protocols(article_json):
     ensure(isinstance(article_json, dict), "given data must be a dictionary")
     if not article_json:
         return None
 
-    # first, find the 'materials and methods' section
-    def pred1(data):
-        return (
-            isinstance(data, dict)
-            and data.get("title")
-            and data["title"].lower() == "materials and methods"
-        )
-
-    def identity(data, coll):
-        coll.append(data["content"])
-        return data
-
-    mandms = []
-    visit(article_json, pred1, identity, mandms)
-
-    # next, extract the id and title of each sub-section
-    def pred2(data):
-        return isinstance(data, dict) and data.get("type") == "section"
-
-    def extractor(data, coll):
-        coll.append(utils.subdict(data, ["id", "title"]))
-        return data
-
-    targets = []
-    visit(mandms, pred2, extractor, targets)
+    # find the id and title of each sub-section of the 'materials and methods' section
+    targets = [
+        utils.subdict(section, ["id", "title"])
+        for section in mandms_sections(article_json)
+    ]
 
     # finally, ensure each of the targets is exactly as expected
     def scrub_targets(target):
@@ -310,10 +596,12 @@ def extract_bioprotocol_response(article_json):
     ),
     max_tries=3,
     max_time=60,
+    # requests refused by an open circuit fail immediately, see `clients.CircuitBreaker`
+    giveup=clients.circuit_open,
+    on_backoff=metrics.count_retry,
 )
 def _get(url, **kwargs):
-    headers = {"user-agent": settings.USER_AGENT}
-    resp = requests.get(url, headers=headers, auth=kwargs.get("auth"))
+    resp = clients.get(url, auth=kwargs.get("auth"), stream=kwargs.get("stream", False))
     resp.raise_for_status()
     return resp
 
@@ -327,10 +615,14 @@ def get(url, **kwargs):
         requests.exceptions.HTTPError,
     ) as e:
         custom_msg = kwargs.get("on_error_message")
-        default_msg = "request failed with status code %r: %s" % (
-            e.response.status_code,
-            url,
-        )
+        if e.response is None:
+            # timeouts and connection errors have no response
+            default_msg = "request failed with %s: %s" % (e.__class__.__name__, url)
+        else:
+            default_msg = "request failed with status code %r: %s" % (
+                e.response.status_code,
+                url,
+            )
         LOG.error(custom_msg or default_msg)
         return e.response
     except Exception as e:
@@ -340,6 +632,20 @@ def get(url, **kwargs):
         raise
 
 
+def delivery_url(msid):
+    "returns the BioProtocol URL that protocol data for the given `msid` is POSTed to"
+    padded_msid = "elife" + utils.pad_msid(msid)
+    return settings.BP["api_host"] + "/api/" + padded_msid + "?action=sendArticle"
+
+
+def post_protocol_data(msid, protocol_data):
+    "POSTs protocol data to BioProtocol once, raising an exception if it fails."
+    auth = (settings.BP["api_user"], settings.BP["api_password"])
+    resp = clients.post(delivery_url(msid), json=protocol_data, auth=auth)
+    resp.raise_for_status()
+    return resp
+
+
 @backoff.on_exception(
     backoff.expo,
     (
@@ -349,16 +655,13 @@ def get(url, **kwargs):
     ),
     max_tries=3,
     max_time=60,
+    # requests refused by an open circuit fail immediately, see `clients.CircuitBreaker`
+    giveup=clients.circuit_open,
+    on_backoff=metrics.count_retry,
 )
 def _deliver_protocol_data(msid, protocol_data):
     "POSTs protocol data to BioProtocol."
-    padded_msid = "elife" + utils.pad_msid(msid)
-    url = settings.BP["api_host"] + "/api/" + padded_msid + "?action=sendArticle"
-    auth = (settings.BP["api_user"], settings.BP["api_password"])
-    headers = {"user-agent": settings.USER_AGENT}
-    resp = requests.post(url, json=protocol_data, headers=headers, auth=auth)
-    resp.raise_for_status()
-    return resp
+    return post_protocol_data(msid, protocol_data)
 
 
 def deliver_protocol_data(msid, protocol_data):
@@ -385,18 +688,94 @@ def deliver_protocol_data(msid, protocol_data):
 #
 
 
+class ChunkReader:
+    "a minimal file-like object over an iterable of byte chunks"
+
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+
+    def read(self, size=-1):
+        # `ijson` reads zero bytes to detect the type of data
+        if size == 0:
+            return b""
+        # returning fewer bytes than requested is fine, an empty chunk signals the end of the data
+        return next((chunk for chunk in self.chunks if chunk), b"")
+
+
+# bytes read from the response at a time when streaming article-json
+STREAM_CHUNK_SIZE = 64 * 1024
+
+# top-level article-json keys kept by `stream_article_json`, along with any 'materials and methods' section in the body
+STREAMED_ARTICLE_KEYS = ["title", "type", "status", "authors"]
+
+
+def stream_article_json(chunks):
+    """incrementally parses the given iterable of article-json byte chunks, keeping only the `STREAMED_ARTICLE_KEYS` and
+    the sections of the body that are or contain a 'materials and methods' section.
+    everything else is discarded as it is parsed so memory is bounded by the largest section rather than the article.
+    """
+    article_json = {"body": []}
+    builder = target = None
+    for prefix, event, value in ijson.parse(ChunkReader(chunks), use_float=True):
+        if builder is None:
+            if prefix in STREAMED_ARTICLE_KEYS or (
+                prefix == "body.item" and event == "start_map"
+            ):
+                builder, target = ijson.ObjectBuilder(), prefix
+            else:
+                continue
+
+        builder.event(event, value)
+
+        # the value is complete once the event that started it has been closed
+        if prefix != target or event in ["start_map", "start_array", "map_key"]:
+            continue
+
+        if target == "body.item":
+            section = builder.value
+            if next(mandms_sections(section), None) is not None:
+                article_json["body"].append(section)
+        else:
+            article_json[target] = builder.value
+        builder = target = None
+
+    return article_json
+
+
 def download_elife_article(msid):
-    "downloads the latest article data for given msid"
+    """downloads the latest article data for given msid.
+    if the gateway is configured for streaming then only the data needed to extract protocols is returned,
+    see `stream_article_json`."""
     url = settings.ELIFE_GATEWAY + "/articles/" + str(msid)
-    resp = get(url)
-    if resp.status_code == 200:
-        return resp.json()
+    streaming = settings.ELIFE_GATEWAY_STREAMING
+    resp = get(url, stream=streaming)
+    if resp is not None and resp.status_code == 200:
+        if streaming:
+            with resp:
+                chunks = resp.iter_content(chunk_size=STREAM_CHUNK_SIZE)
+                return stream_article_json(chunks)
+        return codec.loads(resp.content)
     return resp
 
 
-def download_parse_deliver_data(msid):
+def fingerprint(protocol_data):
+    """returns a hash of the given protocol data that doesn't depend on the order of keys.
+    always rendered by the standard library so the hash doesn't change with the JSON backend, see `codec`.
+    """
+    return hashlib.sha256(
+        json.dumps(protocol_data, sort_keys=True).encode()
+    ).hexdigest()
+
+
+def download_parse_data(msid):
+    """downloads and parses the article for the given `msid`, returning the protocol data to deliver to BioProtocol.
+    returns `None` if the article couldn't be downloaded or isn't a VOR."""
     result = download_elife_article(msid)
 
+    # we failed to connect to the api, this has already been logged
+    if result is None:
+        return
+
     # we failed to download article_json from the api
     if isinstance(result, requests.Response):
         if result.status_code == 404:
@@ -413,8 +792,115 @@ def download_parse_deliver_data(msid):
     if article_json["status"] != "vor":
         return
 
-    protocol_data = extract_bioprotocol_response(article_json)
-    return deliver_protocol_data(msid, protocol_data)
+    return extract_bioprotocol_response(article_json)
+
+
+def is_delivered(msid, digest):
+    "returns `True` if protocol data with the given `digest` was the last to be delivered for `msid`"
+    return models.DeliveryFingerprint.objects.filter(msid=msid, digest=digest).exists()
+
+
+def deliver_if_changed(msid, protocol_data, force=False):
+    """delivers the `protocol_data` for the given `msid` to BioProtocol.
+    delivery is skipped if the protocol data hasn't changed since it was last delivered, unless `force` is `True`.
+    returns the response from BioProtocol or `None` if nothing was delivered."""
+    digest = fingerprint(protocol_data)
+    if not force and is_delivered(msid, digest):
+        LOG.info("protocol data for article %r unchanged, skipping delivery" % msid)
+        return
+
+    resp = deliver_protocol_data(msid, protocol_data)
+    if resp is not None and resp.ok:
+        utils.create_or_update(
+            models.DeliveryFingerprint, {"msid": msid, "digest": digest}, ["msid"]
+        )
+    return resp
+
+
+def download_parse_deliver_data(msid, force=False):
+    """downloads, parses and delivers the protocol data for the given `msid` to BioProtocol.
+    delivery is skipped if the protocol data hasn't changed since it was last delivered, unless `force` is `True`.
+    """
+    protocol_data = download_parse_data(msid)
+    if protocol_data is None:
+        return
+    return deliver_if_changed(msid, protocol_data, force)
+
+
+# outcomes of resending an article to BioProtocol, see `resend_articles`
+RESEND_NOT_FOUND = "not-found"
+RESEND_UNCHANGED = "unchanged"
+RESEND_DELIVERED = "delivered"
+RESEND_FAILED = "failed"
+RESEND_DRY_RUN = "dry-run"
+
+
+def resend_articles(
+    msid_list, concurrency=4, host_concurrency=None, force=False, dry_run=False
+):
+    """downloads, parses and delivers the protocol data for many articles to BioProtocol.
+    articles are processed `concurrency` at a time with no more than `host_concurrency` requests
+    in flight to each of the eLife API gateway and BioProtocol. each article is downloaded exactly once.
+    if `dry_run` is `True` the protocol data is extracted but not delivered.
+    yields a triple of (msid, outcome, protocol data) per-article, in the order given.
+    """
+    host_concurrency = host_concurrency or concurrency
+    gateway_limit = threading.BoundedSemaphore(host_concurrency)
+    bp_limit = threading.BoundedSemaphore(host_concurrency)
+
+    def download(msid):
+        try:
+            with gateway_limit:
+                return download_parse_data(msid), None
+        except Exception:
+            LOG.exception("unhandled exception downloading article %r" % msid)
+            return None, RESEND_FAILED
+
+    def deliver(pair):
+        msid, protocol_data = pair
+        with bp_limit:
+            resp = deliver_protocol_data(msid, protocol_data)
+        return resp is not None and resp.ok
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for msid_chunk in utils.chunks(msid_list, ADD_RESULTS_CHUNK_SIZE):
+            downloaded = dict(zip(msid_chunk, executor.map(download, msid_chunk)))
+
+            # the database is only touched from this thread, once per-chunk
+            delivered_digests = dict(
+                models.DeliveryFingerprint.objects.filter(
+                    msid__in=msid_chunk
+                ).values_list("msid", "digest")
+            )
+
+            outcomes = {}
+            digests = {}
+            for msid, (protocol_data, outcome) in downloaded.items():
+                if outcome:
+                    outcomes[msid] = outcome
+                elif protocol_data is None:
+                    outcomes[msid] = RESEND_NOT_FOUND
+                elif dry_run:
+                    outcomes[msid] = RESEND_DRY_RUN
+                else:
+                    digests[msid] = fingerprint(protocol_data)
+                    if not force and delivered_digests.get(msid) == digests[msid]:
+                        outcomes[msid] = RESEND_UNCHANGED
+
+            pending = [
+                (msid, downloaded[msid][0]) for msid in digests if msid not in outcomes
+            ]
+            for (msid, _), ok in zip(pending, executor.map(deliver, pending)):
+                outcomes[msid] = RESEND_DELIVERED if ok else RESEND_FAILED
+                if ok:
+                    utils.create_or_update(
+                        models.DeliveryFingerprint,
+                        {"msid": msid, "digest": digests[msid]},
+                        ["msid"],
+                    )
+
+            for msid in msid_chunk:
+                yield msid, outcomes[msid], downloaded[msid][0]
 
 
 #
@@ -428,15 +914,294 @@ def download_protocol_data(msid):
     auth = (settings.BP["api_user"], settings.BP["api_password"])
     resp = get(url, auth=auth)
     if resp and resp.status_code == 200:
-        return resp.json()
+        return codec.loads(resp.content)
     # return resp # bad requests are already logged. just don't return anything
 
 
+def _coerce_protocol_data(bp_data):
+    "coerce output from their API to what they POST to us"
+    return utils.rename_keys(bp_data, [("elifeid", "elifeID"), ("Protocols", "data")])
+
+
 def reload_article_data(msid):
     bp_data = download_protocol_data(msid)
     if bp_data:
-        # coerce output from their API to what they POST to us
-        bp_data = utils.rename_keys(
-            bp_data, [("elifeid", "elifeID"), ("Protocols", "data")]
-        )
+        bp_data = _coerce_protocol_data(bp_data)
         bp_data and add_result(bp_data)
+
+
+# the results of an article whose protocol data couldn't be fetched, see `reload_articles_data`
+RELOAD_FAILED = "failed"
+
+
+def reload_articles_data(msid_list, concurrency=4, rate=None, chunk_size=None):
+    """re-fetches protocol data for many articles from BioProtocol and inserts it into the database.
+    articles are fetched `concurrency` at a time, no faster than `rate` requests per second if given,
+    and each chunk of articles is written in a single transaction (see `add_results`).
+    yields a list of pairs of (msid, `add_result` results) per chunk written. the results are `None` if BioProtocol had
+    no data and `RELOAD_FAILED` if the protocol data couldn't be fetched.
+    """
+    limiter = utils.TokenBucket(rate) if rate else None
+
+    def fetch(msid):
+        limiter and limiter.acquire()
+        try:
+            return download_protocol_data(msid)
+        except Exception:
+            LOG.exception("unhandled exception fetching protocol data for %r" % msid)
+            return RELOAD_FAILED
+
+    chunk_size = chunk_size or ADD_RESULTS_CHUNK_SIZE
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for msid_chunk in utils.chunks(msid_list, chunk_size):
+            bp_data_list = list(executor.map(fetch, msid_chunk))
+            found = [
+                _coerce_protocol_data(bp_data)
+                for bp_data in bp_data_list
+                if bp_data and bp_data != RELOAD_FAILED
+            ]
+            results = iter(list(add_results(found, chunk_size)))
+
+            def outcome(bp_data):
+                if bp_data == RELOAD_FAILED:
+                    return RELOAD_FAILED
+                return next(results) if bp_data else None
+
+            yield [
+                (msid, outcome(bp_data))
+                for msid, bp_data in zip(msid_chunk, bp_data_list)
+            ]
+
+
+# reconciliation of the protocol data we have with the protocol data BioProtocol serves
+
+# fields of each protocol row compared by `reconcile_articles`
+RECONCILE_FIELDS = [
+    "protocol_sequencing_number",
+    "protocol_title",
+    "protocol_status",
+    "uri",
+    "is_protocol",
+]
+
+# outcomes of reconciling an article, see `reconcile_articles`
+RECONCILE_MATCHED = "matched"
+RECONCILE_DRIFTED = "drifted"
+RECONCILE_REPAIRED = "repaired"
+RECONCILE_UNAVAILABLE = "unavailable"
+
+# number of articles reconciled at a time by `reconcile_articles`
+RECONCILE_CHUNK_SIZE = 100
+
+
+def row_hash(row):
+    "returns a hash of the `RECONCILE_FIELDS` of the given map of a protocol row"
+    values = [
+        row["protocol_sequencing_number"],
+        row["protocol_title"],
+        int(row["protocol_status"]),
+        row["uri"] or None,
+        bool(row["is_protocol"]),
+    ]
+    return hashlib.sha1(repr(values).encode()).hexdigest()
+
+
+def local_msids():
+    """yields the msid of every article with protocol data in order.
+    rows are read with a server-side cursor where the database supports it, so they're never all held in memory.
+    """
+    return (
+        models.ArticleProtocol.objects.order_by("msid")
+        .values_list("msid", flat=True)
+        .distinct()
+        .iterator(chunk_size=RECONCILE_CHUNK_SIZE * 10)
+    )
+
+
+def local_row_hashes(msid_list):
+    "returns a map of msid to a map of protocol sequencing number to `row_hash` for each of the given articles"
+    hashes = {msid: {} for msid in msid_list}
+    rows = models.ArticleProtocol.objects.filter(msid__in=msid_list).values(
+        "msid", *RECONCILE_FIELDS
+    )
+    for row in rows:
+        hashes[row["msid"]][row["protocol_sequencing_number"]] = row_hash(row)
+    return hashes
+
+
+def remote_row_hashes(msid, result_list):
+    """returns a pair of (map of protocol sequencing number to `row_hash`, list of protocol sequencing numbers that
+    couldn't be hashed) for the given BioProtocol results of an article.
+    results that fail to be processed are skipped, they would fail to be written as well.
+    """
+    hashes, failed = {}, []
+    for result in result_list:
+        row = _process_result_item(merge(result, {"msid": msid}))
+        if isinstance(row, BPError):
+            continue
+        try:
+            hashes[row["protocol_sequencing_number"]] = row_hash(row)
+        except (TypeError, ValueError):
+            LOG.warning(
+                "failed to compare protocol %r of article %r: %s"
+                % (row["protocol_sequencing_number"], msid, row)
+            )
+            failed.append(row["protocol_sequencing_number"])
+    return hashes, sorted(failed)
+
+
+def diff_row_hashes(local, remote):
+    "returns a map of the protocol sequencing numbers that differ between the `local` and `remote` row hashes"
+    return {
+        "changed": sorted(
+            key for key in local.keys() & remote.keys() if local[key] != remote[key]
+        ),
+        "local-only": sorted(local.keys() - remote.keys()),
+        "remote-only": sorted(remote.keys() - local.keys()),
+    }
+
+
+def reconcile_articles(
+    msid_list=None, concurrency=4, rate=None, chunk_size=None, repair=False
+):
+    """compares the protocol data of each article with the protocol data BioProtocol serves for it, row by row.
+    every article with protocol data is compared if `msid_list` isn't given.
+    articles are fetched `concurrency` at a time, no faster than `rate` requests per second if given, a chunk at a time.
+    if `repair` is `True` the changed and missing rows of a drifted article are written (see `add_results`).
+    rows BioProtocol no longer serves are reported but never deleted. rows BioProtocol serves that can't be compared
+    are reported as failed and the article as drifted. an article whose protocol data can't be fetched or read at all
+    is reported as unavailable.
+    yields a map of msid, outcome and the differing rows per-article, in the order given.
+    """
+    if msid_list is None:
+        msid_list = local_msids()
+    limiter = utils.TokenBucket(rate) if rate else None
+
+    def fetch(msid):
+        limiter and limiter.acquire()
+        try:
+            return download_protocol_data(msid)
+        except Exception:
+            LOG.exception("unhandled exception fetching protocol data for %r" % msid)
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for msid_chunk in utils.chunks(msid_list, chunk_size or RECONCILE_CHUNK_SIZE):
+            bp_data_list = list(executor.map(fetch, msid_chunk))
+
+            # the database is only touched from this thread, once per-chunk
+            local = local_row_hashes(msid_chunk)
+            report_list, to_repair = [], {}
+            for msid, bp_data in zip(msid_chunk, bp_data_list):
+                if not bp_data:
+                    report_list.append({"msid": msid, "outcome": RECONCILE_UNAVAILABLE})
+                    continue
+                try:
+                    result = merge(_coerce_protocol_data(bp_data), {"elifeID": msid})
+                    remote, failed = remote_row_hashes(msid, result["data"])
+                except Exception:
+                    # malformed protocol data, e.g. a missing or null list of protocols
+                    LOG.exception(
+                        "failed to compare protocol data of article %r" % msid
+                    )
+                    report_list.append({"msid": msid, "outcome": RECONCILE_UNAVAILABLE})
+                    continue
+                # rows that couldn't be compared are reported as failed rather than local-only
+                local_hashes = utils.subdict(local[msid], local[msid].keys() - failed)
+                diff = diff_row_hashes(local_hashes, remote)
+                diff["failed"] = failed
+                outcome = RECONCILE_DRIFTED if any(diff.values()) else RECONCILE_MATCHED
+                report = merge({"msid": msid, "outcome": outcome}, diff)
+                if repair and (diff["changed"] or diff["remote-only"]):
+                    to_repair[msid] = (result, report)
+                report_list.append(report)
+
+            repaired = add_results([result for result, _ in to_repair.values()])
+            for repair_result in repaired:
+                if not repair_result["failed"]:
+                    to_repair[repair_result["msid"]][1]["outcome"] = RECONCILE_REPAIRED
+            yield from report_list
+
+
+# bioprotocol -> elife, incrementally
+# BioProtocol lists the articles whose protocol data changed at or after a given time, oldest first, a page at a time:
+#   GET /api/elife?action=listChanges&since=2019-08-29T06:00:00+00:00&page=<token>
+#   {"items": [{"elifeid": "00003", "Protocols": [...], "updated": "2019-08-29T06:00:00+00:00"}, ...], "next": <token>}
+# the last page has no 'next' token.
+
+# name of the `SyncCursor` recording how far BioProtocol has been synced
+SYNC_CURSOR = "bioprotocol"
+
+
+def changes_url(since=None, page=None):
+    "returns the BioProtocol URL listing the articles changed at or after `since`, or every article if not given"
+    params = {"action": "listChanges"}
+    if since:
+        params["since"] = since.isoformat()
+    if page:
+        params["page"] = page
+    return settings.BP["api_host"] + "/api/elife?" + urlencode(params)
+
+
+def download_changes(since=None, page=None):
+    """fetches a page of the articles changed at or after `since` from BioProtocol.
+    raises a `SyncError` if the page can't be fetched."""
+    auth = (settings.BP["api_user"], settings.BP["api_password"])
+    resp = get(changes_url(since, page), auth=auth)
+    if resp is None or resp.status_code != 200:
+        raise SyncError("failed to fetch changes from BioProtocol since %s" % since)
+    return codec.loads(resp.content)
+
+
+def _updated(bp_data):
+    "returns the time the given article listed by BioProtocol was changed"
+    dt = parse_datetime(bp_data["updated"])
+    return dt if timezone.is_aware(dt) else timezone.make_aware(dt, timezone.utc)
+
+
+def sync_cursor():
+    "returns the time up to which BioProtocol has been synced, or `None` if it never has"
+    return (
+        models.SyncCursor.objects.filter(name=SYNC_CURSOR)
+        .values_list("since", flat=True)
+        .first()
+    )
+
+
+def sync_articles_data(since=None):
+    """fetches the protocol data of the articles changed at BioProtocol since the last sync and inserts it into the
+    database, a page at a time. changes since `since` are fetched instead if given.
+    each page is written along with the advanced cursor in a single transaction (see `add_results`), so an interrupted
+    sync picks up from the last page written. changes at the cursor itself are fetched again, they're idempotent.
+    the cursor is never advanced past the earliest change that failed to be written, so it's fetched again next sync.
+    rows that fail validation are reported in the results but don't hold the cursor, fetching them again won't fix them.
+    yields a pair of (list of `add_result` results, cursor) per page."""
+    since = since or sync_cursor()
+    latest = since
+    earliest_failed = None
+    page = None
+    while True:
+        changes = download_changes(since, page)
+        bp_data_list = changes["items"]
+        updated = [_updated(bp_data) for bp_data in bp_data_list]
+        latest = max(updated + [latest] if latest else updated, default=None)
+        with transaction.atomic():
+            results = list(
+                add_results(
+                    [_coerce_protocol_data(bp_data) for bp_data in bp_data_list]
+                )
+            )
+            failed = [
+                dt for dt, result in zip(updated, results) if write_failed(result)
+            ]
+            if earliest_failed:
+                failed.append(earliest_failed)
+            earliest_failed = min(failed, default=None)
+            cursor = earliest_failed or latest
+            if cursor:
+                utils.create_or_update(
+                    models.SyncCursor, {"name": SYNC_CURSOR, "since": cursor}, ["name"]
+                )
+        yield results, cursor
+        page = changes.get("next")
+        if not page:
+            return
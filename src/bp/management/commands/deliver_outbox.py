@@ -0,0 +1,47 @@
+import sys
+from collections import Counter
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from bp import codec, metrics, outbox
+import logging
+
+LOG = logging.getLogger()
+
+
+class Command(BaseCommand):
+    help = "delivers protocol data queued in the outbox to BP, re-attempting failed deliveries"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            help="number of deliveries claimed at a time. defaults to the outbox 'batch-size' setting",
+        )
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            help="number of deliveries sent at a time. defaults to the outbox 'concurrency' setting",
+        )
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="exit once no more deliveries are due rather than waiting for more",
+        )
+
+    def handle(self, *args, **options):
+        if settings.METRICS["outbox-port"]:
+            metrics.serve(settings.METRICS["outbox-port"])
+        counts = Counter()
+        try:
+            for msid, outcome in outbox.deliver(
+                batch_size=options["batch_size"],
+                concurrency=options["concurrency"],
+                forever=not options["once"],
+            ):
+                counts[outcome] += 1
+        except Exception:
+            LOG.exception("unhandled exception delivering the outbox to BioProtocol")
+            sys.exit(1)
+        summary = {"total": sum(counts.values())}
+        summary.update(counts)
+        print(codec.dumps(summary).decode())
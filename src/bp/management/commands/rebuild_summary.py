@@ -0,0 +1,27 @@
+import sys
+from django.core.management.base import BaseCommand
+from bp import codec, logic
+import logging
+
+LOG = logging.getLogger()
+
+
+class Command(BaseCommand):
+    help = "recalculates the summary of protocol data served by /status"
+
+    def handle(self, *args, **options):
+        try:
+            summary = logic.rebuild_summary()
+            last_updated = summary.last_updated
+            print(
+                codec.dumps(
+                    {
+                        "last-updated": last_updated and last_updated.isoformat(),
+                        "row-count": summary.row_count,
+                    },
+                    indent=4,
+                ).decode()
+            )
+        except Exception:
+            LOG.exception("unhandled exception rebuilding the summary")
+            sys.exit(1)
@@ -0,0 +1,67 @@
+import sys
+from collections import Counter
+from django.core.management.base import BaseCommand, CommandError
+from bp import codec, logic, utils
+import logging
+
+LOG = logging.getLogger()
+
+
+class Command(BaseCommand):
+    help = "compares our article data with BioProtocol's, reporting and optionally repairing the differences"
+
+    def add_arguments(self, parser):
+        parser.add_argument("msid", type=int, nargs="*")
+        parser.add_argument(
+            "--file", help="file of msids, one per line. use '-' to read from stdin"
+        )
+        parser.add_argument(
+            "--range", help="an inclusive range of msids, for example '1-100'"
+        )
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            default=4,
+            help="number of articles fetched at a time",
+        )
+        parser.add_argument(
+            "--rate", type=float, help="maximum number of requests per second"
+        )
+        parser.add_argument(
+            "--repair",
+            action="store_true",
+            help="write the protocol data of articles that differ. rows BioProtocol no longer has are kept",
+        )
+
+    def msid_list(self, options):
+        "returns an iterable of the msids given, or `None` to reconcile every article we have"
+        try:
+            sources = utils.msid_sources(
+                options["msid"], options["file"], options["range"]
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+        if sources == [[]]:
+            return None
+        return (msid for source in sources for msid in source)
+
+    def handle(self, *args, **options):
+        msid_list = self.msid_list(options)
+        counts = Counter()
+        try:
+            for report in logic.reconcile_articles(
+                msid_list,
+                concurrency=options["concurrency"],
+                rate=options["rate"],
+                repair=options["repair"],
+            ):
+                counts[report["outcome"]] += 1
+                if report["outcome"] != logic.RECONCILE_MATCHED:
+                    # one line per-article that differs
+                    print(codec.dumps(report).decode())
+        except Exception:
+            LOG.exception("unhandled exception reconciling article data")
+            sys.exit(1)
+        summary = {"total": sum(counts.values())}
+        summary.update(counts)
+        print(codec.dumps(summary).decode())
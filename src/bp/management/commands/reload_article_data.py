@@ -1,25 +1,121 @@
-import json
+import os
 import sys
-from django.core.management.base import BaseCommand
-from bp import logic, models
+from django.core.management.base import BaseCommand, CommandError
+from bp import codec, logic, models, utils
 import logging
 
 LOG = logging.getLogger()
 
 
+def read_checkpoint(path):
+    "returns the set of msids recorded in the checkpoint file at `path`, if it exists"
+    if not path or not os.path.exists(path):
+        return set()
+    with open(path, "r") as fh:
+        return set(utils.read_msids(fh))
+
+
+def write_checkpoint(path, msid_list):
+    "appends the given msids to the checkpoint file at `path`"
+    with open(path, "a") as fh:
+        fh.writelines("%s\n" % msid for msid in msid_list)
+        fh.flush()
+        os.fsync(fh.fileno())
+
+
 class Command(BaseCommand):
     help = "re-fetches article data from BioProtocol"
 
     def add_arguments(self, parser):
-        parser.add_argument("msid", type=int)
+        parser.add_argument("msid", type=int, nargs="*")
+        parser.add_argument(
+            "--file", help="file of msids, one per line. use '-' to read from stdin"
+        )
+        parser.add_argument(
+            "--range", help="an inclusive range of msids, for example '1-100'"
+        )
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            default=4,
+            help="number of articles fetched at a time",
+        )
+        parser.add_argument(
+            "--rate", type=float, help="maximum number of requests per second"
+        )
+        parser.add_argument(
+            "--checkpoint",
+            help="file of msids already reloaded. these are skipped and newly reloaded msids are appended",
+        )
+
+    def sources(self, options):
+        "returns a list of iterables of msids from the msid arguments, the file and the range"
+        try:
+            return utils.msid_sources(
+                options["msid"], options["file"], options["range"]
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+
+    def msid_list(self, sources, checkpoint):
+        "yields each distinct msid from the given sources, skipping those already checkpointed"
+        skip = read_checkpoint(checkpoint)
+        for source in sources:
+            for msid in source:
+                if msid not in skip:
+                    skip.add(msid)
+                    yield msid
+
+    def reload_one(self, msid):
+        logic.reload_article_data(msid)
+        try:
+            print(codec.dumps(logic.protocol_data(msid), indent=4).decode())
+        except models.ArticleProtocol.DoesNotExist:
+            print("article not found: %s" % msid)
+
+    def reload_many(self, sources, options):
+        total = found = failed = unavailable = 0
+        for chunk in logic.reload_articles_data(
+            self.msid_list(sources, options["checkpoint"]),
+            concurrency=options["concurrency"],
+            rate=options["rate"],
+        ):
+            for msid, results in chunk:
+                total += 1
+                if results == logic.RELOAD_FAILED:
+                    unavailable += 1
+                elif results:
+                    found += 1
+                    failed += len(results["failed"])
+            if options["checkpoint"]:
+                # articles that couldn't be fetched are re-attempted when resumed
+                write_checkpoint(
+                    options["checkpoint"],
+                    [msid for msid, results in chunk if results != logic.RELOAD_FAILED],
+                )
+            self.stderr.write(
+                "reloaded %s articles, %s found, %s failed rows, %s unavailable"
+                % (total, found, failed, unavailable)
+            )
+        summary = {
+            "total": total,
+            "found": found,
+            "failed": failed,
+            "unavailable": unavailable,
+        }
+        print(codec.dumps(summary).decode())
 
     def handle(self, *args, **options):
         try:
-            logic.reload_article_data(options["msid"])
-            try:
-                print(json.dumps(logic.protocol_data(options["msid"]), indent=4))
-            except models.ArticleProtocol.DoesNotExist:
-                print("article not found: %s" % options["msid"])
+            sources = self.sources(options)
+            if sources == [options["msid"]] and len(options["msid"]) == 1:
+                self.reload_one(options["msid"][0])
+            elif sources == [[]]:
+                raise CommandError("no msids given")
+            else:
+                self.reload_many(sources, options)
+        except CommandError:
+            raise
         except Exception:
             LOG.exception("unhandled exception reloading article from BioProtocol")
             sys.exit(1)
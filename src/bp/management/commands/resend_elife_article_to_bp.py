@@ -1,7 +1,8 @@
-import json
 import sys
-from django.core.management.base import BaseCommand
-from bp import logic
+import time
+from collections import Counter
+from django.core.management.base import BaseCommand, CommandError
+from bp import async_logic, codec, logic, utils
 import logging
 
 LOG = logging.getLogger()
@@ -11,17 +12,113 @@ class Command(BaseCommand):
     help = "downloads the article from elife, parses it, sends it to BP. typically happened by update_listener"
 
     def add_arguments(self, parser):
-        parser.add_argument("msid", type=int)
+        parser.add_argument("msid", type=int, nargs="*")
+        parser.add_argument(
+            "--file", help="file of msids, one per line. use '-' to read from stdin"
+        )
+        parser.add_argument(
+            "--range", help="an inclusive range of msids, for example '1-100'"
+        )
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            default=4,
+            help="number of articles resent at a time",
+        )
+        parser.add_argument(
+            "--host-concurrency",
+            type=int,
+            help="maximum number of requests in flight to each host. defaults to --concurrency",
+        )
+        parser.add_argument(
+            "--async",
+            action="store_true",
+            dest="use_async",
+            help="handle the articles in an event loop. allows a much higher --concurrency",
+        )
+        parser.add_argument(
+            "--force",
+            action="store_true",
+            help="deliver the article even if it hasn't changed since it was last delivered",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="download and parse the articles but don't deliver them",
+        )
+
+    def resend_one(self, msid, options):
+        _, outcome, protocol_data = next(
+            logic.resend_articles(
+                [msid],
+                concurrency=1,
+                force=options["force"],
+                dry_run=options["dry_run"],
+            )
+        )
+        if protocol_data is None:
+            print("article not found: %s" % msid)
+        else:
+            print(codec.dumps(protocol_data, indent=4).decode())
+        if outcome == logic.RESEND_FAILED:
+            sys.exit(1)
+
+    def msid_list(self, sources):
+        "yields each distinct msid from the given sources"
+        seen = set()
+        for source in sources:
+            for msid in source:
+                if msid not in seen:
+                    seen.add(msid)
+                    yield msid
+
+    def resend_many(self, sources, options):
+        counts = Counter()
+        start = time.monotonic()
+        resend_articles = (
+            async_logic.resend_many if options["use_async"] else logic.resend_articles
+        )
+        for i, (msid, outcome, _) in enumerate(
+            resend_articles(
+                self.msid_list(sources),
+                concurrency=options["concurrency"],
+                host_concurrency=options["host_concurrency"],
+                force=options["force"],
+                dry_run=options["dry_run"],
+            ),
+            start=1,
+        ):
+            counts[outcome] += 1
+            if outcome == logic.RESEND_FAILED:
+                self.stderr.write("failed to resend article %s" % msid)
+            if i % 100 == 0:
+                elapsed = time.monotonic() - start
+                self.stderr.write(
+                    "resent %s articles in %.1fs (%.1f articles/s)"
+                    % (i, elapsed, i / elapsed if elapsed else 0)
+                )
+        summary = {"total": sum(counts.values())}
+        summary.update(counts)
+        print(codec.dumps(summary).decode())
+        if counts[logic.RESEND_FAILED]:
+            sys.exit(1)
 
     def handle(self, *args, **options):
         try:
-            msid = options["msid"]
-            logic.download_parse_deliver_data(msid)
+            sources = utils.msid_sources(
+                options["msid"], options["file"], options["range"]
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        if sources == [[]]:
+            raise CommandError("no msids given")
 
-            # replicated code, only for our benefit
-            article_json = logic.download_elife_article(msid)
-            protocol_data = logic.extract_bioprotocol_response(article_json)
-            print(json.dumps(protocol_data, indent=4))
+        try:
+            if sources == [options["msid"]] and len(options["msid"]) == 1:
+                self.resend_one(options["msid"][0], options)
+            else:
+                self.resend_many(sources, options)
         except Exception:
             LOG.exception("unhandled exception re-sending article to BioProtocol")
             sys.exit(1)
@@ -0,0 +1,64 @@
+import sys
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from bp import codec, logic
+import logging
+
+LOG = logging.getLogger()
+
+
+class Command(BaseCommand):
+    help = "fetches the article data changed at BioProtocol since the last sync"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--since",
+            help="sync changes since this ISO 8601 time rather than since the last sync, for example '2019-08-29T06:00:00Z'",
+        )
+
+    def handle(self, *args, **options):
+        since = None
+        if options["since"]:
+            since = parse_datetime(options["since"])
+            if not since:
+                raise CommandError("unparseable time: %s" % options["since"])
+            if timezone.is_naive(since):
+                since = timezone.make_aware(since, timezone.utc)
+
+        pages = total = failed = invalid = 0
+        cursor = None
+        try:
+            for results, cursor in logic.sync_articles_data(since):
+                pages += 1
+                total += len(results)
+                for result in results:
+                    if logic.write_failed(result):
+                        failed += 1
+                    elif result["failed"]:
+                        invalid += 1
+            if invalid:
+                LOG.warning(
+                    "skipped invalid rows of %s articles synced from BioProtocol"
+                    % invalid
+                )
+            if failed:
+                LOG.error(
+                    "failed to write %s articles synced from BioProtocol" % failed
+                )
+                sys.exit(1)
+        except logic.SyncError as e:
+            LOG.error(str(e))
+            sys.exit(1)
+        except Exception:
+            LOG.exception("unhandled exception syncing article data from BioProtocol")
+            sys.exit(1)
+        finally:
+            summary = {
+                "pages": pages,
+                "total": total,
+                "failed": failed,
+                "invalid": invalid,
+                "cursor": cursor and cursor.isoformat(),
+            }
+            print(codec.dumps(summary).decode())
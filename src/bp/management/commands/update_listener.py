@@ -1,7 +1,7 @@
 import sys
 from django.conf import settings
 from django.core.management.base import BaseCommand
-from bp import article_update_logic
+from bp import article_update_logic, metrics
 import logging
 
 LOG = logging.getLogger()
@@ -14,6 +14,8 @@ class Command(BaseCommand):
         if not settings.SQS["queue-name"]:
             LOG.error("no queue name found. a queue name can be set in your 'app.cfg'.")
             sys.exit(1)
+        if settings.METRICS["listener-port"]:
+            metrics.serve(settings.METRICS["listener-port"])
         try:
             article_update_logic.listen()
         except Exception:
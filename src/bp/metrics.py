@@ -0,0 +1,138 @@
+"""Prometheus metrics for the hot paths of ingesting, delivering and listening, served at /metrics.
+
+metrics are kept per-process. when the `PROMETHEUS_MULTIPROC_DIR` environment variable is set (for example under
+uWSGI with several workers) the metrics of every process are written there and aggregated by `render`.
+the update listener and the outbox worker run in processes of their own and serve their metrics on the ports given
+in the 'metrics' section of `app.cfg`, see `serve`.
+"""
+
+from functools import wraps
+import logging
+import os
+import time
+import prometheus_client
+from prometheus_client import Counter, Gauge, Histogram, multiprocess
+
+LOG = logging.getLogger()
+
+CONTENT_TYPE = prometheus_client.CONTENT_TYPE_LATEST
+
+ARTICLE_REQUEST_SECONDS = Histogram(
+    "bp_article_request_seconds",
+    "time taken to respond to a request for /bioprotocol/article/<msid>",
+    ["method"],
+)
+
+ADD_RESULT_ROWS = Histogram(
+    "bp_add_result_rows",
+    "number of protocol rows given per article to `logic.add_result`",
+    buckets=(1, 2, 5, 10, 20, 50, 100, 200, 500),
+)
+
+EXTRACT_PROTOCOLS_SECONDS = Histogram(
+    "bp_extract_protocols_seconds",
+    "time taken to extract protocols from article-json",
+)
+
+HTTP_REQUEST_SECONDS = Histogram(
+    "bp_http_request_seconds",
+    "time taken by outgoing requests to the eLife API gateway and BioProtocol. 'status' is 'error' if there was no response",
+    ["host", "method", "status"],
+)
+
+CIRCUIT_OPEN_REQUESTS = Counter(
+    "bp_circuit_open_requests",
+    "number of outgoing requests refused as the circuit to the host was open",
+    ["host"],
+)
+
+CIRCUIT_STATE = Gauge(
+    "bp_circuit_state",
+    "state of the circuit to the host in the process making requests to it. 0 is closed, 1 is half-open and 2 is open",
+    ["host"],
+    multiprocess_mode="max",
+)
+
+BACKOFF_RETRIES = Counter(
+    "bp_backoff_retries",
+    "number of times a failed request was re-attempted",
+    ["function"],
+)
+
+SQS_MESSAGES_RECEIVED = Counter(
+    "bp_sqs_messages_received",
+    "number of messages received from the SQS queue",
+)
+
+SQS_MESSAGES_COALESCED = Counter(
+    "bp_sqs_messages_coalesced",
+    "number of article events skipped as another event for the same article was in the same batch",
+)
+
+SQS_ARTICLES_HANDLED = Counter(
+    "bp_sqs_articles_handled",
+    "number of articles from the SQS queue handled successfully",
+)
+
+SQS_ARTICLES_FAILED = Counter(
+    "bp_sqs_articles_failed",
+    "number of articles from the SQS queue that failed to be handled",
+)
+
+OUTBOX_QUEUED = Counter(
+    "bp_outbox_queued",
+    "number of deliveries to BioProtocol queued in the outbox",
+)
+
+OUTBOX_DELIVERIES = Counter(
+    "bp_outbox_deliveries",
+    "number of deliveries from the outbox attempted. 'outcome' is 'delivered', 'retry' or 'abandoned'",
+    ["outcome"],
+)
+
+
+def timed(histogram):
+    "decorates a view so the time taken to respond is observed by `histogram`, labelled with the request method"
+
+    def wrap(fn):
+        @wraps(fn)
+        def wrapper(request, *args, **kwargs):
+            with histogram.labels(request.method).time():
+                return fn(request, *args, **kwargs)
+
+        return wrapper
+
+    return wrap
+
+
+def observe_http(host, method, status, start):
+    "observes an outgoing request to `host` that began at `start` and ended with `status`, or `None` if there was no response"
+    HTTP_REQUEST_SECONDS.labels(host, method, status or "error").observe(
+        time.perf_counter() - start
+    )
+
+
+def count_retry(details):
+    "a `backoff` handler that counts each retry of the decorated function"
+    BACKOFF_RETRIES.labels(details["target"].__name__).inc()
+
+
+def registry():
+    "returns a registry of the metrics of every process if `PROMETHEUS_MULTIPROC_DIR` is set, otherwise of this process"
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registry = prometheus_client.CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return registry
+    return prometheus_client.REGISTRY
+
+
+def render():
+    "returns the current metrics in the Prometheus text format"
+    return prometheus_client.generate_latest(registry())
+
+
+def serve(port):
+    """serves the metrics of this process over HTTP on the given `port` from a background thread.
+    used by processes outside of the web app, whose metrics /metrics can't see."""
+    LOG.info("serving metrics on port %s" % port)
+    prometheus_client.start_http_server(port, registry=registry())
@@ -0,0 +1,31 @@
+# Generated by Django 3.2.25 on 2026-10-17 18:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("bp", "0004_auto_20201027_0601"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DeliveryFingerprint",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("msid", models.BigIntegerField(unique=True)),
+                ("digest", models.CharField(max_length=64)),
+                ("datetime_record_created", models.DateTimeField(auto_now_add=True)),
+                ("datetime_record_updated", models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
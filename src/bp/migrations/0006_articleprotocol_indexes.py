@@ -0,0 +1,26 @@
+# Generated by Django 3.2.25 on 2026-10-17 19:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("bp", "0005_deliveryfingerprint"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="articleprotocol",
+            index=models.Index(
+                fields=["msid", "is_protocol"], name="bp_ap_msid_is_protocol_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="articleprotocol",
+            index=models.Index(
+                fields=["datetime_record_updated", "is_protocol"],
+                name="bp_ap_updated_idx",
+            ),
+        ),
+    ]
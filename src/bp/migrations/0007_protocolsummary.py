@@ -0,0 +1,44 @@
+# Generated by Django 3.2.25 on 2026-10-17 19:08
+
+from django.db import migrations, models
+from django.db.models import Count, Max, Q
+
+
+def build_summary(apps, schema_editor):
+    "creates the single row of `ProtocolSummary` from the existing protocol data"
+    ArticleProtocol = apps.get_model("bp", "ArticleProtocol")
+    ProtocolSummary = apps.get_model("bp", "ProtocolSummary")
+    agg = ArticleProtocol.objects.aggregate(
+        last_updated=Max("datetime_record_updated"),
+        row_count=Count("id", filter=Q(is_protocol=True)),
+    )
+    ProtocolSummary.objects.create(
+        pk=1, row_count=agg["row_count"], last_updated=agg["last_updated"]
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("bp", "0006_articleprotocol_indexes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ProtocolSummary",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("row_count", models.BigIntegerField(default=0)),
+                ("last_updated", models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.RunPython(build_summary, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 3.2.25 on 2026-10-17 19:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("bp", "0007_protocolsummary"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ArticleDocument",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("msid", models.BigIntegerField(unique=True)),
+                ("content", models.BinaryField()),
+                ("etag", models.CharField(max_length=64)),
+                ("last_modified", models.DateTimeField()),
+                ("datetime_record_created", models.DateTimeField(auto_now_add=True)),
+                ("datetime_record_updated", models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
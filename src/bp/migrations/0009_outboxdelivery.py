@@ -0,0 +1,43 @@
+# Generated by Django 3.2.25 on 2026-10-17 19:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("bp", "0008_articledocument"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="OutboxDelivery",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("msid", models.BigIntegerField(unique=True)),
+                ("protocol_data", models.JSONField()),
+                ("digest", models.CharField(max_length=64)),
+                ("attempts", models.IntegerField(default=0)),
+                ("queued", models.DateTimeField()),
+                ("next_attempt", models.DateTimeField()),
+                ("locked_until", models.DateTimeField(blank=True, null=True)),
+                ("last_error", models.TextField(blank=True, default="")),
+                ("datetime_record_created", models.DateTimeField(auto_now_add=True)),
+                ("datetime_record_updated", models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name="outboxdelivery",
+            index=models.Index(
+                fields=["next_attempt"], name="bp_outbox_next_attempt_idx"
+            ),
+        ),
+    ]
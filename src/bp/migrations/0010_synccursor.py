@@ -0,0 +1,31 @@
+# Generated by Django 3.2.25 on 2026-10-17 19:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("bp", "0009_outboxdelivery"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SyncCursor",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("name", models.CharField(max_length=50, unique=True)),
+                ("since", models.DateTimeField()),
+                ("datetime_record_created", models.DateTimeField(auto_now_add=True)),
+                ("datetime_record_updated", models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
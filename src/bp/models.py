@@ -14,6 +14,17 @@ class ArticleProtocol(models.Model):
 
     class Meta:
         unique_together = [("msid", "protocol_sequencing_number")]
+        indexes = [
+            # protocols for an article, see `logic.protocol_data` and `logic.row_count`
+            models.Index(
+                fields=["msid", "is_protocol"], name="bp_ap_msid_is_protocol_idx"
+            ),
+            # most recently updated row and, covering `is_protocol`, the summary on /status
+            models.Index(
+                fields=["datetime_record_updated", "is_protocol"],
+                name="bp_ap_updated_idx",
+            ),
+        ]
 
     def __repr__(self):
         # '<ArticleProtocol 24419#s4-1 'Antibodies'>
@@ -26,3 +37,115 @@ class ArticleProtocol(models.Model):
     def __str__(self):
         # '24419#s4-1'
         return "%s#%s" % (self.msid, self.protocol_sequencing_number)
+
+
+class DeliveryFingerprint(models.Model):
+    "a hash of the protocol data last successfully delivered to BioProtocol for an article"
+
+    msid = models.BigIntegerField(unique=True)
+    digest = models.CharField(max_length=64)
+
+    datetime_record_created = models.DateTimeField(auto_now_add=True)
+    datetime_record_updated = models.DateTimeField(auto_now=True)
+
+    def __repr__(self):
+        # '<DeliveryFingerprint 24419 'e3b0c442...'>
+        return "<DeliveryFingerprint %s %r>" % (self.msid, self.digest[:8] + "...")
+
+    def __str__(self):
+        return str(self.msid)
+
+
+class ProtocolSummary(models.Model):
+    """a single row summarising `ArticleProtocol` so /status doesn't count the whole table.
+    kept up to date by `logic.add_result` and rebuilt with the `rebuild_summary` management command.
+    """
+
+    # number of rows in `ArticleProtocol` that are protocols
+    row_count = models.BigIntegerField(default=0)
+    # the `datetime_record_updated` of the most recently written row in `ArticleProtocol`
+    last_updated = models.DateTimeField(blank=True, null=True)
+
+    def __repr__(self):
+        # '<ProtocolSummary 1234 2019-08-29T06:00:00+00:00>'
+        return "<ProtocolSummary %s %s>" % (
+            self.row_count,
+            self.last_updated and self.last_updated.isoformat(),
+        )
+
+    def __str__(self):
+        return str(self.row_count)
+
+
+class ArticleDocument(models.Model):
+    """the protocol data of an article as served by /bioprotocol/article/<msid>, rendered when the article is written.
+    see `logic.article_document`."""
+
+    msid = models.BigIntegerField(unique=True)
+    content = models.BinaryField()
+    etag = models.CharField(max_length=64)
+    # the `datetime_record_updated` of the most recently written row of the article in `ArticleProtocol`
+    last_modified = models.DateTimeField()
+
+    datetime_record_created = models.DateTimeField(auto_now_add=True)
+    datetime_record_updated = models.DateTimeField(auto_now=True)
+
+    def __repr__(self):
+        # '<ArticleDocument 24419 "e3b0c442...">'
+        return "<ArticleDocument %s %s>" % (self.msid, self.etag[:9] + '..."')
+
+    def __str__(self):
+        return str(self.msid)
+
+
+class OutboxDelivery(models.Model):
+    """protocol data of an article waiting to be delivered to BioProtocol, see `bp/outbox.py`.
+    there is at most one per article, queueing newer protocol data replaces the old."""
+
+    msid = models.BigIntegerField(unique=True)
+    protocol_data = models.JSONField()
+    # `logic.fingerprint` of the protocol data
+    digest = models.CharField(max_length=64)
+    # number of failed attempts to deliver the protocol data
+    attempts = models.IntegerField(default=0)
+    # when the protocol data was queued. it is abandoned once older than the outbox 'max-age'
+    queued = models.DateTimeField()
+    # the delivery is not attempted before this time
+    next_attempt = models.DateTimeField()
+    # while set and in the future, a worker is delivering the protocol data
+    locked_until = models.DateTimeField(blank=True, null=True)
+    last_error = models.TextField(blank=True, default="")
+
+    datetime_record_created = models.DateTimeField(auto_now_add=True)
+    datetime_record_updated = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            # deliveries due to be attempted, see `outbox.claim`
+            models.Index(fields=["next_attempt"], name="bp_outbox_next_attempt_idx"),
+        ]
+
+    def __repr__(self):
+        # '<OutboxDelivery 24419 attempts=2>'
+        return "<OutboxDelivery %s attempts=%s>" % (self.msid, self.attempts)
+
+    def __str__(self):
+        return str(self.msid)
+
+
+class SyncCursor(models.Model):
+    """the time up to which protocol data has been synced from a source, see `logic.sync_articles_data`.
+    only changes at or after the cursor are requested by the next sync."""
+
+    name = models.CharField(max_length=50, unique=True)
+    since = models.DateTimeField()
+
+    datetime_record_created = models.DateTimeField(auto_now_add=True)
+    datetime_record_updated = models.DateTimeField(auto_now=True)
+
+    def __repr__(self):
+        # '<SyncCursor bioprotocol 2019-08-29T06:00:00+00:00>'
+        return "<SyncCursor %s %s>" % (self.name, self.since.isoformat())
+
+    def __str__(self):
+        return self.name
@@ -0,0 +1,207 @@
+"""a database-backed queue of protocol data waiting to be delivered to BioProtocol.
+
+the update listener queues the protocol data of an article with `enqueue` when the 'enabled' setting in the 'outbox'
+section of `app.cfg` is set. the `deliver_outbox` management command runs `deliver`, claiming batches of deliveries that
+are due and POSTing them to BioProtocol. a failed delivery is re-attempted with an exponential backoff until it's older
+than the 'max-age' setting, when it is abandoned.
+
+there is at most one delivery per article and a worker holds a lease on each delivery it claims, renewed just before the
+delivery is attempted, so an article's protocol data is only ever being delivered once at a time. protocol data queued while a delivery is in flight replaces the old and
+is delivered once the lease is released."""
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+import logging
+import time
+from . import clients, logic, metrics, models, utils
+
+LOG = logging.getLogger()
+
+# outcomes of attempting a delivery, see `deliver_batch`
+DELIVERED = "delivered"
+RETRY = "retry"
+ABANDONED = "abandoned"
+
+
+def enqueue(msid, protocol_data, force=False):
+    """queues the `protocol_data` of the given `msid` for delivery to BioProtocol, replacing any already queued.
+    nothing is queued if the protocol data hasn't changed since it was last delivered, unless `force` is `True`.
+    returns `True` if the protocol data was queued."""
+    digest = logic.fingerprint(protocol_data)
+    if not force and logic.is_delivered(msid, digest):
+        LOG.info("protocol data for article %r unchanged, skipping delivery" % msid)
+        return False
+    now = timezone.now()
+    # a lease held by a worker is kept so the replaced delivery isn't attempted twice at once
+    utils.create_or_update(
+        models.OutboxDelivery,
+        {
+            "msid": msid,
+            "protocol_data": protocol_data,
+            "digest": digest,
+            "attempts": 0,
+            "queued": now,
+            "next_attempt": now,
+            "last_error": "",
+        },
+        ["msid"],
+    )
+    metrics.OUTBOX_QUEUED.inc()
+    return True
+
+
+def download_parse_enqueue(msid, force=False):
+    """downloads and parses the protocol data for the given `msid` and queues it for delivery to BioProtocol.
+    like `logic.download_parse_deliver_data` without waiting on BioProtocol."""
+    protocol_data = logic.download_parse_data(msid)
+    if protocol_data is None:
+        return False
+    return enqueue(msid, protocol_data, force)
+
+
+def claim(batch_size, now=None):
+    """returns up to `batch_size` deliveries that are due and not held by another worker, oldest first.
+    each is leased to the caller for the outbox 'lease' setting."""
+    now = now or timezone.now()
+    locked_until = now + timedelta(seconds=settings.OUTBOX["lease"])
+    with transaction.atomic():
+        # other workers skip the rows locked here rather than waiting on them
+        delivery_list = list(
+            models.OutboxDelivery.objects.select_for_update(skip_locked=True)
+            .filter(next_attempt__lte=now)
+            .filter(Q(locked_until__isnull=True) | Q(locked_until__lte=now))
+            .order_by("next_attempt")[:batch_size]
+        )
+        models.OutboxDelivery.objects.filter(
+            id__in=[delivery.id for delivery in delivery_list]
+        ).update(locked_until=locked_until)
+    for delivery in delivery_list:
+        delivery.locked_until = locked_until
+    return delivery_list
+
+
+def renew(delivery_list, now=None):
+    """extends the lease on each of the given claimed deliveries by the outbox 'lease' setting.
+    returns the deliveries still held by the caller, dropping any whose lease expired and was claimed by another worker.
+    """
+    now = now or timezone.now()
+    locked_until = now + timedelta(seconds=settings.OUTBOX["lease"])
+    held = []
+    for delivery in delivery_list:
+        renewed = models.OutboxDelivery.objects.filter(
+            id=delivery.id, locked_until=delivery.locked_until
+        ).update(locked_until=locked_until)
+        if renewed:
+            delivery.locked_until = locked_until
+            held.append(delivery)
+        else:
+            LOG.warning(
+                "lease on delivery of article %r to BioProtocol was lost, skipping"
+                % delivery.msid
+            )
+    return held
+
+
+def backoff(attempts):
+    "returns the number of seconds to wait before the next attempt after the given number of failed `attempts`"
+    return min(
+        settings.OUTBOX["backoff"] * 2 ** (attempts - 1), settings.OUTBOX["max-backoff"]
+    )
+
+
+def _post(delivery):
+    "attempts the given delivery once, returning an error message or `None` if it succeeded"
+    try:
+        logic.post_protocol_data(delivery.msid, delivery.protocol_data)
+    except Exception as e:
+        return "%s: %s" % (e.__class__.__name__, e)
+
+
+def _release(delivery):
+    "releases the lease on a delivery whose protocol data was replaced while it was being delivered"
+    models.OutboxDelivery.objects.filter(id=delivery.id).update(locked_until=None)
+
+
+def _delivered(delivery):
+    utils.create_or_update(
+        models.DeliveryFingerprint,
+        {"msid": delivery.msid, "digest": delivery.digest},
+        ["msid"],
+    )
+    deleted, _ = models.OutboxDelivery.objects.filter(
+        id=delivery.id, digest=delivery.digest
+    ).delete()
+    if not deleted:
+        _release(delivery)
+    return DELIVERED
+
+
+def _failed(delivery, error, now):
+    unchanged = models.OutboxDelivery.objects.filter(
+        id=delivery.id, digest=delivery.digest
+    )
+    attempts = delivery.attempts + 1
+    if now - delivery.queued > timedelta(seconds=settings.OUTBOX["max-age"]):
+        LOG.error(
+            "abandoning delivery of article %r to BioProtocol after %s attempts: %s"
+            % (delivery.msid, attempts, error)
+        )
+        outcome = ABANDONED
+        changed, _ = unchanged.delete()
+    else:
+        LOG.warning(
+            "failed to deliver article %r to BioProtocol, attempt %s: %s"
+            % (delivery.msid, attempts, error)
+        )
+        outcome = RETRY
+        changed = unchanged.update(
+            attempts=attempts,
+            next_attempt=now + timedelta(seconds=backoff(attempts)),
+            locked_until=None,
+            last_error=error,
+        )
+    if not changed:
+        _release(delivery)
+    return outcome
+
+
+def deliver_batch(delivery_list, executor, concurrency):
+    """attempts to deliver each of the given claimed deliveries, POSTing `concurrency` at a time with the given `executor`.
+    the lease on each delivery is renewed just before it's POSTed, so it only has to outlast a single request.
+    the database is only touched from the calling thread. returns a list of (msid, outcome) pairs.
+    """
+    results = []
+    for chunk in utils.chunks(delivery_list, concurrency):
+        chunk = renew(chunk)
+        for delivery, error in zip(chunk, executor.map(_post, chunk)):
+            if error is None:
+                outcome = _delivered(delivery)
+            else:
+                outcome = _failed(delivery, error, timezone.now())
+            metrics.OUTBOX_DELIVERIES.labels(outcome).inc()
+            results.append((delivery.msid, outcome))
+    return results
+
+
+def deliver(batch_size=None, concurrency=None, forever=True):
+    """claims and delivers batches of due deliveries until there are none, waiting for more if `forever` is `True`.
+    yields a pair of (msid, outcome) for each delivery attempted."""
+    batch_size = batch_size or settings.OUTBOX["batch-size"]
+    concurrency = concurrency or settings.OUTBOX["concurrency"]
+    utils.ensure(
+        settings.OUTBOX["lease"] > sum(clients.timeout()),
+        "the outbox 'lease' must be longer than the connect and read timeouts of a request",
+    )
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        while True:
+            delivery_list = claim(batch_size)
+            if delivery_list:
+                yield from deliver_batch(delivery_list, executor, concurrency)
+            elif forever:
+                time.sleep(settings.OUTBOX["poll-interval"])
+            else:
+                return
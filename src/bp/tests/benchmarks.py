@@ -0,0 +1,360 @@
+"""performance benchmarks.
+
+these are not collected with the rest of the tests, run them with:
+
+    ./bench.sh
+
+results are saved as JSON in `.benchmarks/` and can be compared between commits with `pytest-benchmark compare`."""
+
+import copy
+import itertools
+import json
+import os
+import tracemalloc
+from collections import OrderedDict
+from functools import lru_cache
+from os.path import join
+from django import urls
+from django.test import Client
+import pytest
+from bp import cache, codec, compression, logic, models, utils
+
+_this_dir = os.path.dirname(os.path.realpath(__file__))
+FIXTURE_DIR = join(_this_dir, "fixtures")
+
+
+@lru_cache(maxsize=None)
+def _article_json(scale):
+    fixture = join(FIXTURE_DIR, "elife-00003-v1.xml.json")
+    data = json.load(open(fixture, "r"))
+    # the bulk of an article is in it's body and references
+    for key in ["body", "references"]:
+        data[key] = [copy.deepcopy(row) for _ in range(scale) for row in data[key]]
+    return data
+
+
+def article_json(scale=1):
+    "returns the fixture article-json with it's body and references repeated `scale` times"
+    return _article_json(scale)
+
+
+def peak_memory(fn, *args):
+    "returns the peak number of bytes allocated while calling `fn` with the given `args`"
+    tracemalloc.start()
+    try:
+        fn(*args)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+#
+# baselines
+#
+
+
+def visit(data, pred, fn, coll=None):
+    "the tree-copying walker replaced by `logic.mandms_sections`"
+    if pred(data):
+        if coll is not None:
+            data = fn(data, coll)
+        else:
+            data = fn(data)
+    if isinstance(data, OrderedDict):
+        results = OrderedDict()
+        for key, val in data.items():
+            results[key] = visit(val, pred, fn, coll)
+        return results
+    elif isinstance(data, dict):
+        return OrderedDict(
+            [(key, visit(val, pred, fn, coll)) for key, val in data.items()]
+        )
+    elif isinstance(data, list):
+        return [visit(row, pred, fn, coll) for row in data]
+    return data
+
+
+def visit_extract_protocols(article_json):
+    "`logic.extract_protocols` as it was when it used `visit`"
+    mandms = []
+    visit(
+        article_json,
+        lambda data: isinstance(data, dict) and logic.is_mandms(data),
+        lambda data, coll: coll.append(data["content"]) or data,
+        mandms,
+    )
+    targets = []
+    visit(
+        mandms,
+        lambda data: isinstance(data, dict) and data.get("type") == "section",
+        lambda data, coll: coll.append({"id": data["id"], "title": data["title"]})
+        or data,
+        targets,
+    )
+    return [
+        {"ProtocolSequencingNumber": t["id"], "ProtocolTitle": t["title"]}
+        for t in targets
+    ]
+
+
+#
+# extraction
+#
+
+EXTRACTORS = [
+    pytest.param(logic.extract_protocols, id="mandms_sections"),
+    pytest.param(visit_extract_protocols, id="visit"),
+]
+
+
+@pytest.mark.parametrize("scale", [1, 10, 100])
+@pytest.mark.parametrize("extractor", EXTRACTORS)
+def test_extract_protocols(benchmark, extractor, scale):
+    data = article_json(scale)
+    benchmark.group = "extract_protocols, article x%s" % scale
+    benchmark.extra_info["peak_memory"] = peak_memory(extractor, data)
+    result = benchmark(extractor, data)
+    assert len(result) == 14 * scale
+
+
+def test_mandms_sections_peak_memory():
+    "walking an article doesn't allocate memory in proportion to the size of the article"
+
+    def walk(data):
+        for _ in logic.mandms_sections(data):
+            pass
+
+    small, large = article_json(1), article_json(100)
+    assert peak_memory(walk, large) < 2 * peak_memory(walk, small)
+
+
+def test_extract_protocols_peak_memory():
+    "extracting protocols from an article doesn't allocate a copy of the article"
+    large = article_json(100)
+    assert logic.extract_protocols(large) == visit_extract_protocols(large)
+    assert (
+        peak_memory(logic.extract_protocols, large)
+        < peak_memory(visit_extract_protocols, large) / 10
+    )
+
+
+#
+# parsing
+#
+
+
+@lru_cache(maxsize=None)
+def article_json_bytes(scale=1):
+    return json.dumps(article_json(scale)).encode()
+
+
+def chunked(content, size=logic.STREAM_CHUNK_SIZE):
+    return (content[i : i + size] for i in range(0, len(content), size))
+
+
+def parse_whole(content):
+    return logic.extract_bioprotocol_response(json.loads(content))
+
+
+def parse_streaming(content):
+    return logic.extract_bioprotocol_response(
+        logic.stream_article_json(chunked(content))
+    )
+
+
+PARSERS = [
+    pytest.param(parse_whole, id="whole"),
+    pytest.param(parse_streaming, id="streaming"),
+]
+
+
+@pytest.mark.parametrize("scale", [1, 100])
+@pytest.mark.parametrize("parser", PARSERS)
+def test_parse_article_json(benchmark, parser, scale):
+    content = article_json_bytes(scale)
+    benchmark.group = "parse article-json, article x%s" % scale
+    benchmark.extra_info["peak_memory"] = peak_memory(parser, content)
+    result = benchmark(parser, content)
+    assert len(result["Protocols"]) == 14 * scale
+
+
+def test_parse_article_json_peak_memory():
+    "streaming article-json doesn't hold the whole article in memory"
+    content = article_json_bytes(100)
+    assert parse_streaming(content) == parse_whole(content)
+    assert peak_memory(parse_streaming, content) < peak_memory(parse_whole, content) / 5
+
+
+#
+# ingest
+#
+
+
+@lru_cache(maxsize=None)
+def _bp_data(size):
+    fixture = join(FIXTURE_DIR, "bp-post-to-elife.json")
+    data = json.load(open(fixture, "r"))["data"]
+    rows = itertools.islice(itertools.cycle(data), size)
+    return [
+        dict(row, ProtocolSequencingNumber="s4-%s" % i) for i, row in enumerate(rows)
+    ]
+
+
+def bp_data(msid, size):
+    "returns a POST from BioProtocol for the given `msid` with `size` protocols"
+    return {"elifeID": msid, "data": copy.deepcopy(_bp_data(size))}
+
+
+SIZES = [1, 10, 100, 1000]
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("size", SIZES)
+def test_add_result_insert(benchmark, size):
+    "adding protocol data for a new article"
+    msids = itertools.count(1)
+    benchmark.group = "add_result, insert"
+
+    def setup():
+        return (bp_data(next(msids), size),), {}
+
+    results = benchmark.pedantic(logic.add_result, setup=setup, rounds=20)
+    assert len(results["successful"]) == size
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("size", SIZES)
+def test_add_result_update(benchmark, size):
+    "adding protocol data for an article that already has it"
+    logic.add_result(bp_data(1, size))
+    benchmark.group = "add_result, update"
+
+    def setup():
+        return (bp_data(1, size),), {}
+
+    results = benchmark.pedantic(logic.add_result, setup=setup, rounds=20)
+    assert len(results["successful"]) == size
+
+
+#
+# reading
+#
+
+# protocols per-article when populating `ArticleProtocol`
+ROWS_PER_ARTICLE = 10
+
+
+@pytest.fixture(scope="module", params=[10_000, 1_000_000], ids=["10k", "1M"])
+def article_protocol_rows(request, django_db_setup, django_db_blocker):
+    """populates `ArticleProtocol` with the given number of rows, `ROWS_PER_ARTICLE` per-article.
+    returns the number of rows."""
+    size = request.param
+    with django_db_blocker.unblock():
+        if models.ArticleProtocol.objects.count() != size:
+            models.ArticleProtocol.objects.all().delete()
+            template = [
+                logic._process_result_item(dict(row, msid=0))
+                for row in _bp_data(ROWS_PER_ARTICLE)
+            ]
+            rows = (
+                models.ArticleProtocol(**dict(row, msid=msid))
+                for msid in range(1, size // ROWS_PER_ARTICLE + 1)
+                for row in template
+            )
+            for chunk in utils.chunks(rows, 10_000):
+                models.ArticleProtocol.objects.bulk_create(chunk)
+    yield size
+
+
+@pytest.mark.parametrize("cached", [False, True], ids=["uncached", "cached"])
+def test_article_get(
+    benchmark, settings, django_db_blocker, article_protocol_rows, cached
+):
+    "requesting an article from a table of `article_protocol_rows` rows"
+    settings.RESPONSE_CACHE = dict(settings.RESPONSE_CACHE, enabled=cached)
+    cache.clear()
+    c = Client()
+    msid = article_protocol_rows // ROWS_PER_ARTICLE // 2
+    url = urls.reverse("article", kwargs={"msid": msid})
+    benchmark.group = "GET article, %s rows" % article_protocol_rows
+    with django_db_blocker.unblock():
+        resp = benchmark(c.get, url)
+    assert resp.status_code == 200
+
+
+@pytest.mark.parametrize("fmt", ["ndjson", "csv"])
+def test_export(benchmark, django_db_blocker, article_protocol_rows, fmt):
+    "streaming every protocol from a table of `article_protocol_rows` rows, and the peak memory doing so"
+    c = Client()
+    url = urls.reverse("export")
+
+    def export():
+        return sum(len(chunk) for chunk in c.get(url, {"format": fmt}))
+
+    benchmark.group = "GET export, %s rows" % article_protocol_rows
+    with django_db_blocker.unblock():
+        benchmark.extra_info["content_length"] = benchmark.pedantic(export, rounds=1)
+        benchmark.extra_info["peak_memory"] = peak_memory(export)
+
+
+def test_serialise_protocol_data(benchmark):
+    apobj = models.ArticleProtocol(
+        **logic._process_result_item(dict(_bp_data(1)[0], msid=1))
+    )
+    result = benchmark(logic.serialise_protocol_data, apobj)
+    assert result["sectionId"] == "s4-0"
+
+
+#
+# response formats
+#
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("coding", ["identity", "gzip", "br"])
+@pytest.mark.parametrize("indent", [None, 4], ids=["compact", "indent"])
+def test_article_get_large(benchmark, settings, indent, coding):
+    "requesting a cached article with 1000 protocols in each format and content-coding"
+    if coding == "br" and compression.brotli is None:
+        pytest.skip("brotli isn't installed")
+    settings.API = dict(settings.API, **{"json-indent": indent, "compress": True})
+    settings.RESPONSE_CACHE = dict(settings.RESPONSE_CACHE, enabled=True)
+    cache.clear()
+    logic.add_result(bp_data(1, 1000))
+    c = Client()
+    url = urls.reverse("article", kwargs={"msid": 1})
+    benchmark.group = "GET article, 1000 protocols"
+    resp = benchmark(c.get, url, HTTP_ACCEPT_ENCODING=coding)
+    assert resp.status_code == 200
+    benchmark.extra_info["content_length"] = len(resp.content)
+
+
+#
+# JSON codec
+#
+
+CODEC_FIXTURES = ["elife-00003-v1.xml.json", "bp-post-to-elife.json"]
+
+
+@lru_cache(maxsize=None)
+def fixture_bytes(fixture):
+    return open(join(FIXTURE_DIR, fixture), "rb").read()
+
+
+@pytest.mark.parametrize("fixture", CODEC_FIXTURES)
+@pytest.mark.parametrize("backend", sorted(codec.BACKENDS))
+def test_json_decode(benchmark, backend, fixture):
+    "parsing each fixture with each installed JSON backend"
+    benchmark.group = "JSON decode, %s" % fixture
+    result = benchmark(codec.BACKENDS[backend].loads, fixture_bytes(fixture))
+    assert result == json.loads(fixture_bytes(fixture))
+
+
+@pytest.mark.parametrize("fixture", CODEC_FIXTURES)
+@pytest.mark.parametrize("backend", sorted(codec.BACKENDS))
+def test_json_encode(benchmark, backend, fixture):
+    "rendering each fixture as compact JSON with each installed JSON backend"
+    data = json.loads(fixture_bytes(fixture))
+    benchmark.group = "JSON encode, %s" % fixture
+    result = benchmark(codec.BACKENDS[backend].dumps, data)
+    assert json.loads(result) == data
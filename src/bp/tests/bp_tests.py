@@ -1,13 +1,44 @@
 from django.conf import settings
+import requests
 import responses
 import os
 from os.path import join
-from datetime import datetime, timezone
-from unittest.mock import patch
+from datetime import datetime, timedelta, timezone
+from unittest.mock import patch, Mock
+import asyncio
+import copy
+import csv
+import decimal
+import gzip
+import httpx
 import json
+import re
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from io import StringIO
+from urllib.parse import parse_qs, urlsplit
 from django import urls
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
 from django.test import TestCase, Client
-from bp import logic, models, utils
+from django.test.utils import CaptureQueriesContext
+from asgiref.sync import async_to_sync
+from bp import (
+    article_update_logic,
+    async_logic,
+    cache,
+    clients,
+    codec,
+    compression,
+    logic,
+    metrics,
+    models,
+    outbox,
+    utils,
+)
+import prometheus_client
 import pytest
 from freezegun import freeze_time
 
@@ -17,6 +48,22 @@ _this_dir = os.path.dirname(os.path.realpath(__file__))
 FIXTURE_DIR = join(_this_dir, "fixtures")
 
 
+@pytest.fixture(autouse=True)
+def clear_cache():
+    "the response cache lives outside of the database and isn't reset between tests"
+    cache.clear()
+    yield
+    cache.clear()
+
+
+@pytest.fixture(autouse=True)
+def reset_clients():
+    "rate limiters and circuit breakers are shared by the process and aren't reset between tests"
+    clients.reset()
+    yield
+    clients.reset()
+
+
 class BaseCase(TestCase):
     maxDiff = None
 
@@ -37,6 +84,147 @@ class ReloadProtocolData(BaseCase):
             self.assertEqual(models.ArticleProtocol.objects.count(), 14)
 
 
+class BulkReloadProtocolData(BaseCase):
+    "fetch the data for many articles from BP and add it to the database"
+
+    def setUp(self):
+        fixture = join(FIXTURE_DIR, "bp-api-output.json")
+        self.data = json.load(open(fixture, "r"))
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.checkpoint = join(self.tempdir.name, "checkpoint.txt")
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def mock_bp(self, mock_resp, msid_list, missing=None):
+        for msid in msid_list:
+            url = "https://dev.bio-protocol.org/api/elife%05d" % msid
+            data = dict(self.data, elifeid="%05d" % msid)
+            mock_resp.add(responses.GET, url, json=data, status=200)
+        for msid in missing or []:
+            url = "https://dev.bio-protocol.org/api/elife%05d" % msid
+            mock_resp.add(responses.GET, url, status=404)
+
+    def test_reload_articles_data(self):
+        "protocol data for many articles is fetched and written a chunk at a time"
+        with responses.RequestsMock() as mock_resp:
+            self.mock_bp(mock_resp, [1, 2, 4], missing=[3])
+            chunks = list(logic.reload_articles_data([1, 2, 3, 4], chunk_size=3))
+        self.assertEqual([len(chunk) for chunk in chunks], [3, 1])
+        results = dict(msid_results for chunk in chunks for msid_results in chunk)
+        self.assertEqual(results[3], None)
+        self.assertEqual(len(results[1]["successful"]), 14)
+        self.assertEqual(models.ArticleProtocol.objects.count(), 14 * 3)
+
+    def test_reload_articles_data_fetch_failed(self):
+        "an article whose protocol data can't be fetched is reported as failed, the rest are written"
+        with responses.RequestsMock() as mock_resp:
+            self.mock_bp(mock_resp, [1, 3])
+            url = "https://dev.bio-protocol.org/api/elife00002"
+            mock_resp.add(responses.GET, url, body="<html>", status=200)
+            chunks = list(logic.reload_articles_data([1, 2, 3]))
+        results = dict(msid_results for chunk in chunks for msid_results in chunk)
+        self.assertEqual(results[2], logic.RELOAD_FAILED)
+        self.assertEqual(len(results[3]["successful"]), 14)
+        self.assertEqual(models.ArticleProtocol.objects.count(), 14 * 2)
+
+    def test_reload_command_fetch_failed(self):
+        "an article that couldn't be fetched isn't checkpointed so it's re-attempted when resumed"
+        stdout = StringIO()
+        with responses.RequestsMock() as mock_resp:
+            self.mock_bp(mock_resp, [1, 3])
+            url = "https://dev.bio-protocol.org/api/elife00002"
+            mock_resp.add(responses.GET, url, body="<html>", status=200)
+            with patch("sys.stdout", stdout):
+                call_command(
+                    "reload_article_data",
+                    "--range",
+                    "1-3",
+                    "--checkpoint",
+                    self.checkpoint,
+                    stderr=StringIO(),
+                )
+        expected = {"total": 3, "found": 2, "failed": 0, "unavailable": 1}
+        self.assertEqual(json.loads(stdout.getvalue()), expected)
+        self.assertEqual(open(self.checkpoint).read().split(), ["1", "3"])
+
+    def test_reload_articles_data_rate_limited(self):
+        "requests are made no faster than the given rate"
+        with responses.RequestsMock() as mock_resp:
+            self.mock_bp(mock_resp, [1, 2, 3])
+            with patch("bp.utils.TokenBucket.acquire") as acquire:
+                list(logic.reload_articles_data([1, 2, 3], rate=10))
+                self.assertEqual(acquire.call_count, 3)
+
+    def test_reload_command_range(self):
+        "a range of articles can be reloaded and the progress is checkpointed"
+        with responses.RequestsMock() as mock_resp:
+            self.mock_bp(mock_resp, [1, 2, 3])
+            call_command(
+                "reload_article_data",
+                "--range",
+                "1-3",
+                "--checkpoint",
+                self.checkpoint,
+                stdout=StringIO(),
+                stderr=StringIO(),
+            )
+        self.assertEqual(models.ArticleProtocol.objects.count(), 14 * 3)
+        self.assertEqual(open(self.checkpoint).read().split(), ["1", "2", "3"])
+
+    def test_reload_command_resume(self):
+        "articles already checkpointed are skipped"
+        with open(self.checkpoint, "w") as fh:
+            fh.write("1\n2\n")
+        msid_file = join(self.tempdir.name, "msids.txt")
+        with open(msid_file, "w") as fh:
+            fh.write("1\n2\n3\n\n")
+        with responses.RequestsMock() as mock_resp:
+            self.mock_bp(mock_resp, [3])
+            call_command(
+                "reload_article_data",
+                "--file",
+                msid_file,
+                "--checkpoint",
+                self.checkpoint,
+                stdout=StringIO(),
+                stderr=StringIO(),
+            )
+        self.assertEqual(models.ArticleProtocol.objects.filter(msid=3).count(), 14)
+        self.assertEqual(models.ArticleProtocol.objects.count(), 14)
+        self.assertEqual(open(self.checkpoint).read().split(), ["1", "2", "3"])
+
+    def test_reload_command_stdin(self):
+        "msids can be read from stdin"
+        with responses.RequestsMock() as mock_resp:
+            self.mock_bp(mock_resp, [1, 2])
+            with patch("sys.stdin", StringIO("1\n2\n")):
+                call_command(
+                    "reload_article_data",
+                    "--file",
+                    "-",
+                    stdout=StringIO(),
+                    stderr=StringIO(),
+                )
+        self.assertEqual(models.ArticleProtocol.objects.count(), 14 * 2)
+
+    def test_reload_command_bad_range(self):
+        with self.assertRaises(CommandError):
+            call_command("reload_article_data", "--range", "foo")
+
+    def test_token_bucket(self):
+        "a token bucket allows bursts up to it's capacity and then refills at it's rate"
+        with patch("bp.utils.time.monotonic") as monotonic:
+            monotonic.return_value = 100
+            bucket = utils.TokenBucket(rate=2)
+            self.assertTrue(bucket.try_acquire())
+            self.assertTrue(bucket.try_acquire())
+            self.assertFalse(bucket.try_acquire())
+            monotonic.return_value = 100.5
+            self.assertTrue(bucket.try_acquire())
+            self.assertFalse(bucket.try_acquire())
+
+
 class SendProtocols(BaseCase):
     "sending of protocol data TO BioProtocol"
 
@@ -79,6 +267,75 @@ class SendProtocols(BaseCase):
             resp = logic.download_parse_deliver_data(msid)
             self.assertEqual(resp, None)
 
+    def test_protocols_unchanged_not_sent(self):
+        "protocol data that hasn't changed since it was last delivered is not sent again"
+        msid = 3
+        fixture = join(FIXTURE_DIR, "elife-00003-v1.xml.json")
+        data = json.load(open(fixture, "r"))
+        url = settings.ELIFE_GATEWAY + "/articles/" + str(msid)
+        bp_url = "https://dev.bio-protocol.org/api/elife00003?action=sendArticle"
+        with responses.RequestsMock() as mock_resp:
+            mock_resp.add(responses.GET, url, json=data, status=200)
+            mock_resp.add(responses.POST, bp_url, status=200)
+            resp = logic.download_parse_deliver_data(msid)
+            self.assertEqual(resp.status_code, 200)
+            self.assertEqual(models.DeliveryFingerprint.objects.count(), 1)
+
+            resp = logic.download_parse_deliver_data(msid)
+            self.assertEqual(resp, None)
+            self.assertEqual(len(mock_resp.calls), 3)  # GET, POST, GET
+
+            # forced
+            resp = logic.download_parse_deliver_data(msid, force=True)
+            self.assertEqual(resp.status_code, 200)
+            self.assertEqual(len(mock_resp.calls), 5)
+
+    def test_protocols_changed_sent(self):
+        "protocol data that has changed since it was last delivered is sent"
+        msid = 3
+        fixture = join(FIXTURE_DIR, "elife-00003-v1.xml.json")
+        data = json.load(open(fixture, "r"))
+        url = settings.ELIFE_GATEWAY + "/articles/" + str(msid)
+        bp_url = "https://dev.bio-protocol.org/api/elife00003?action=sendArticle"
+        with responses.RequestsMock() as mock_resp:
+            mock_resp.add(responses.GET, url, json=data, status=200)
+            mock_resp.add(responses.POST, bp_url, status=200)
+            logic.download_parse_deliver_data(msid)
+            digest = models.DeliveryFingerprint.objects.get(msid=msid).digest
+
+            mock_resp.replace(
+                responses.GET, url, json=dict(data, title="Foo"), status=200
+            )
+            resp = logic.download_parse_deliver_data(msid)
+            self.assertEqual(resp.status_code, 200)
+            new_digest = models.DeliveryFingerprint.objects.get(msid=msid).digest
+            self.assertNotEqual(digest, new_digest)
+
+    def test_protocols_failed_send_not_fingerprinted(self):
+        "protocol data that failed to be delivered is sent again"
+        msid = 3
+        fixture = join(FIXTURE_DIR, "elife-00003-v1.xml.json")
+        data = json.load(open(fixture, "r"))
+        url = settings.ELIFE_GATEWAY + "/articles/" + str(msid)
+        bp_url = "https://dev.bio-protocol.org/api/elife00003?action=sendArticle"
+        with responses.RequestsMock() as mock_resp:
+            mock_resp.add(responses.GET, url, json=data, status=200)
+            mock_resp.add(responses.POST, bp_url, status=500)
+            resp = logic.download_parse_deliver_data(msid)
+            self.assertEqual(resp.status_code, 500)
+            self.assertEqual(models.DeliveryFingerprint.objects.count(), 0)
+
+    def test_fingerprint(self):
+        "the fingerprint of protocol data doesn't depend on the order of keys"
+        self.assertEqual(
+            logic.fingerprint({"a": 1, "b": [1, 2]}),
+            logic.fingerprint({"b": [1, 2], "a": 1}),
+        )
+        self.assertNotEqual(
+            logic.fingerprint({"a": 1, "b": [1, 2]}),
+            logic.fingerprint({"a": 1, "b": [2, 1]}),
+        )
+
     def test_protocols_bad_elife_response(self):
         "elife api 'can't find' article data for us to scrape and send to BP"
         msid = 3
@@ -89,6 +346,432 @@ class SendProtocols(BaseCase):
             self.assertEqual(resp, None)
 
 
+class ResendArticles(BaseCase):
+    "downloading, parsing and delivering many articles to BP"
+
+    def setUp(self):
+        fixture = join(FIXTURE_DIR, "elife-00003-v1.xml.json")
+        self.data = json.load(open(fixture, "r"))
+
+    def mock_gateway(self, mock_resp, msid_list, missing=None):
+        for msid in msid_list:
+            url = settings.ELIFE_GATEWAY + "/articles/" + str(msid)
+            mock_resp.add(responses.GET, url, json=self.data, status=200)
+        for msid in missing or []:
+            url = settings.ELIFE_GATEWAY + "/articles/" + str(msid)
+            mock_resp.add(responses.GET, url, status=404)
+
+    def mock_bp(self, mock_resp, msid_list, status=200):
+        for msid in msid_list:
+            url = "https://dev.bio-protocol.org/api/elife%05d?action=sendArticle" % msid
+            mock_resp.add(responses.POST, url, status=status)
+
+    def test_resend_articles(self):
+        "each article is downloaded once and delivered, in the order given"
+        with responses.RequestsMock() as mock_resp:
+            self.mock_gateway(mock_resp, [1, 3], missing=[2])
+            self.mock_bp(mock_resp, [1, 3])
+            results = list(logic.resend_articles([1, 2, 3], concurrency=2))
+            self.assertEqual(len(mock_resp.calls), 5)
+        expected = [
+            (1, logic.RESEND_DELIVERED),
+            (2, logic.RESEND_NOT_FOUND),
+            (3, logic.RESEND_DELIVERED),
+        ]
+        self.assertEqual([(msid, outcome) for msid, outcome, _ in results], expected)
+        self.assertEqual(models.DeliveryFingerprint.objects.count(), 2)
+
+    def test_resend_articles_unchanged(self):
+        "articles whose protocol data hasn't changed are not delivered again, unless forced"
+        with responses.RequestsMock() as mock_resp:
+            self.mock_gateway(mock_resp, [1])
+            self.mock_bp(mock_resp, [1])
+            list(logic.resend_articles([1]))
+            results = list(logic.resend_articles([1]))
+            self.assertEqual(results[0][1], logic.RESEND_UNCHANGED)
+            self.assertEqual(len(mock_resp.calls), 3)  # GET, POST, GET
+
+            results = list(logic.resend_articles([1], force=True))
+            self.assertEqual(results[0][1], logic.RESEND_DELIVERED)
+
+    def test_resend_articles_failed(self):
+        with responses.RequestsMock() as mock_resp:
+            self.mock_gateway(mock_resp, [1])
+            self.mock_bp(mock_resp, [1], status=400)
+            results = list(logic.resend_articles([1]))
+        self.assertEqual(results[0][1], logic.RESEND_FAILED)
+        self.assertEqual(models.DeliveryFingerprint.objects.count(), 0)
+
+    def test_resend_articles_dry_run(self):
+        "protocol data is extracted but nothing is delivered during a dry run"
+        with responses.RequestsMock() as mock_resp:
+            self.mock_gateway(mock_resp, [1, 2])
+            results = list(logic.resend_articles([1, 2], dry_run=True))
+        expected = logic.extract_bioprotocol_response(self.data)
+        for msid, outcome, protocol_data in results:
+            self.assertEqual(outcome, logic.RESEND_DRY_RUN)
+            self.assertEqual(protocol_data, expected)
+        self.assertEqual(models.DeliveryFingerprint.objects.count(), 0)
+
+    def test_resend_command(self):
+        "a single article is downloaded just once and it's protocol data printed"
+        stdout = StringIO()
+        with responses.RequestsMock() as mock_resp:
+            self.mock_gateway(mock_resp, [3])
+            self.mock_bp(mock_resp, [3])
+            with patch("sys.stdout", stdout):
+                call_command("resend_elife_article_to_bp", "3")
+            self.assertEqual(len(mock_resp.calls), 2)
+        expected = logic.extract_bioprotocol_response(self.data)
+        self.assertEqual(json.loads(stdout.getvalue()), expected)
+
+    def test_resend_command_bulk(self):
+        "many articles are resent and a summary is printed"
+        stdout = StringIO()
+        with responses.RequestsMock() as mock_resp:
+            self.mock_gateway(mock_resp, [1, 2], missing=[3])
+            self.mock_bp(mock_resp, [1, 2])
+            with patch("sys.stdout", stdout):
+                call_command(
+                    "resend_elife_article_to_bp",
+                    "1",
+                    "--range",
+                    "1-3",
+                    stderr=StringIO(),
+                )
+        expected = {"total": 3, "delivered": 2, "not-found": 1}
+        self.assertEqual(json.loads(stdout.getvalue()), expected)
+
+    def test_resend_command_dry_run(self):
+        stdout = StringIO()
+        with responses.RequestsMock() as mock_resp:
+            self.mock_gateway(mock_resp, [1, 2])
+            with patch("sys.stdout", stdout):
+                call_command(
+                    "resend_elife_article_to_bp",
+                    "1",
+                    "2",
+                    "--dry-run",
+                    stderr=StringIO(),
+                )
+        self.assertEqual(json.loads(stdout.getvalue()), {"total": 2, "dry-run": 2})
+
+
+class AsyncPipeline(BaseCase):
+    "downloading, parsing and delivering articles to BP in an event loop"
+
+    def setUp(self):
+        fixture = join(FIXTURE_DIR, "elife-00003-v1.xml.json")
+        self.data = json.load(open(fixture, "r"))
+        self.requests = []
+
+    def transport(self, bp_status=200, articles=None):
+        "returns a transport that serves `articles` (default: every article) and accepts deliveries"
+        articles = articles or {}
+
+        def handler(request):
+            self.requests.append((request.method, str(request.url)))
+            if request.method == "POST":
+                return httpx.Response(bp_status)
+            msid = int(request.url.path.split("/")[-1])
+            if articles and msid not in articles:
+                return httpx.Response(404)
+            return httpx.Response(200, json=articles.get(msid, self.data))
+
+        return httpx.MockTransport(handler)
+
+    def resend_articles(self, msid_list, **kwargs):
+        return async_to_sync(async_logic.resend_articles)(msid_list, **kwargs)
+
+    def test_resend_articles(self):
+        "each article is downloaded once and delivered, in the order given"
+        transport = self.transport(articles={1: self.data, 3: {"status": "poa"}})
+        results = self.resend_articles([1, 2, 3], transport=transport)
+        expected = [
+            (1, logic.RESEND_DELIVERED),
+            (2, logic.RESEND_NOT_FOUND),
+            (3, logic.RESEND_NOT_FOUND),
+        ]
+        self.assertEqual([(msid, outcome) for msid, outcome, _ in results], expected)
+        self.assertEqual(results[0][2], logic.extract_bioprotocol_response(self.data))
+        self.assertEqual(len(self.requests), 4)
+        self.assertIn(("POST", logic.delivery_url(1)), self.requests)
+        self.assertEqual(models.DeliveryFingerprint.objects.count(), 1)
+
+    def test_resend_articles_unchanged(self):
+        "articles whose protocol data hasn't changed are not delivered again, unless forced"
+        self.resend_articles([1], transport=self.transport())
+        results = self.resend_articles([1], transport=self.transport())
+        self.assertEqual(results[0][1], logic.RESEND_UNCHANGED)
+        self.assertEqual(len(self.requests), 3)  # GET, POST, GET
+
+        results = self.resend_articles([1], force=True, transport=self.transport())
+        self.assertEqual(results[0][1], logic.RESEND_DELIVERED)
+
+    def test_resend_articles_failed(self):
+        results = self.resend_articles([1], transport=self.transport(bp_status=500))
+        self.assertEqual(results[0][1], logic.RESEND_FAILED)
+        self.assertEqual(models.DeliveryFingerprint.objects.count(), 0)
+
+    def test_resend_articles_dry_run(self):
+        results = self.resend_articles([1], dry_run=True, transport=self.transport())
+        self.assertEqual(results[0][1], logic.RESEND_DRY_RUN)
+        self.assertEqual(
+            self.requests, [("GET", settings.ELIFE_GATEWAY + "/articles/1")]
+        )
+
+    def test_resend_articles_retried(self):
+        "requests that fail to connect are re-attempted with backoff"
+        attempts = []
+
+        def handler(request):
+            attempts.append(request.method)
+            if len(attempts) < 3:
+                raise httpx.ConnectError("refused", request=request)
+            if request.method == "POST":
+                return httpx.Response(200)
+            return httpx.Response(200, json=self.data)
+
+        with patch("backoff._async.asyncio.sleep") as sleep:
+            results = self.resend_articles([1], transport=httpx.MockTransport(handler))
+            self.assertEqual(sleep.call_count, 2)
+        self.assertEqual(attempts, ["GET", "GET", "GET", "POST"])
+        self.assertEqual(results[0][1], logic.RESEND_DELIVERED)
+
+    def test_resend_articles_gives_up(self):
+        "an article that can't be downloaded after several attempts is skipped"
+
+        def handler(request):
+            raise httpx.ConnectTimeout("timeout", request=request)
+
+        with patch("backoff._async.asyncio.sleep"):
+            results = self.resend_articles([1], transport=httpx.MockTransport(handler))
+        self.assertEqual(results[0][1], logic.RESEND_NOT_FOUND)
+
+    def test_resend_articles_concurrently(self):
+        "many articles are in flight at once"
+        n = 50
+        in_flight = []
+
+        async def handler(request):
+            # each download waits for every other article to be requested
+            if request.method == "GET":
+                in_flight.append(request)
+                if len(in_flight) == n:
+                    all_requested.set()
+                await asyncio.wait_for(all_requested.wait(), timeout=5)
+                return httpx.Response(200, json=self.data)
+            return httpx.Response(200)
+
+        async def resend():
+            nonlocal all_requested
+            all_requested = asyncio.Event()
+            return await async_logic.resend_articles(
+                range(1, n + 1), concurrency=n, transport=httpx.MockTransport(handler)
+            )
+
+        all_requested = None
+        results = async_to_sync(resend)()
+        self.assertEqual(
+            [outcome for _, outcome, _ in results], [logic.RESEND_DELIVERED] * n
+        )
+
+    def test_handle_articles_failed(self):
+        "an article that fails with an unhandled exception is counted, the rest of the batch is still handled"
+        resend_articles = async_logic.resend_articles
+        transport = self.transport()
+
+        async def resend(msid_list, **kwargs):
+            return await resend_articles(msid_list, transport=transport, **kwargs)
+
+        def is_delivered(msid, digest):
+            if msid == 1:
+                raise RuntimeError("database unavailable")
+            return False
+
+        failed = sample("bp_sqs_articles_failed_total")
+        handled = sample("bp_sqs_articles_handled_total")
+        with patch("bp.async_logic.resend_articles", resend):
+            with patch("bp.logic.is_delivered", side_effect=is_delivered):
+                async_to_sync(async_logic.handle_articles)([1, 2])
+        self.assertEqual(sample("bp_sqs_articles_failed_total") - failed, 1)
+        self.assertEqual(sample("bp_sqs_articles_handled_total") - handled, 1)
+        self.assertEqual(models.DeliveryFingerprint.objects.get().msid, 2)
+
+    def test_resend_many(self):
+        "articles are handled a chunk at a time"
+        with patch("bp.async_logic.resend_articles") as resend_articles:
+            resend_articles.side_effect = lambda msid_list, **kwargs: [
+                (msid, logic.RESEND_DRY_RUN, None) for msid in msid_list
+            ]
+            results = list(async_logic.resend_many(range(5), chunk_size=2))
+            self.assertEqual(resend_articles.call_count, 3)
+        self.assertEqual([msid for msid, _, _ in results], [0, 1, 2, 3, 4])
+
+    def test_listen_async(self):
+        "the articles of each batch are handled together in an event loop"
+        queue_obj = fake_queue([[article_event(1), article_event(2), article_event(1)]])
+        handled = []
+
+        async def fn(msid_list):
+            handled.append(msid_list)
+
+        sqs = dict(settings.SQS, **{"coalesce-window": 0})
+        with self.settings(SQS=sqs):
+            with patch(
+                "bp.article_update_logic.queue_resource", return_value=queue_obj
+            ):
+                with self.assertRaises(StopListening):
+                    article_update_logic._listen_async(fn)
+        self.assertEqual(handled, [[1, 2]])
+        self.assertEqual(queue_obj.delete_messages.call_count, 1)
+
+
+class StopListening(Exception):
+    pass
+
+
+def article_event(msid):
+    return json.dumps({"id": str(msid), "type": "article"})
+
+
+def fake_queue(batch_list):
+    "returns a fake SQS queue object that returns each batch of message bodies in turn, then stops the listener"
+    queue_obj = Mock()
+    batches = [
+        [
+            Mock(body=body, receipt_handle="handle-%s" % i)
+            for i, body in enumerate(batch)
+        ]
+        for batch in batch_list
+    ]
+    queue_obj.receive_messages.side_effect = batches + [StopListening()]
+    queue_obj.delete_messages.return_value = {"Successful": [], "Failed": []}
+    return queue_obj
+
+
+class ArticleUpdateListener(BaseCase):
+    "receiving and handling of article events from SQS"
+
+    def setUp(self):
+        # messages are not received beyond the first batch unless a test says otherwise
+        self.sqs = dict(settings.SQS, **{"coalesce-window": 0})
+
+    def listen(self, queue_obj, fn, exc=StopListening):
+        with self.settings(SQS=self.sqs):
+            with patch(
+                "bp.article_update_logic.queue_resource", return_value=queue_obj
+            ):
+                with self.assertRaises(exc):
+                    article_update_logic._listen(fn)
+
+    def test_poll_skips_empty_batches(self):
+        "empty responses from long polling are not yielded"
+        queue_obj = fake_queue([[], ["a"]])
+        poll = article_update_logic.poll(queue_obj)
+        self.assertEqual([m.body for m in next(poll)], ["a"])
+        self.assertEqual(queue_obj.receive_messages.call_count, 2)
+        kwargs = queue_obj.receive_messages.call_args[1]
+        self.assertEqual(kwargs["MaxNumberOfMessages"], settings.SQS["batch-size"])
+
+    def test_poll_window(self):
+        "messages continue to be received for the length of the window after the first message arrives"
+        queue_obj = fake_queue([["a"], [], ["b", "c"], ["d"]])
+        with patch("bp.article_update_logic.time.monotonic") as monotonic:
+            # window starts, 1st receive in window, 2nd receive in window, window ends
+            monotonic.side_effect = [100, 101, 104, 106]
+            poll = article_update_logic.poll(queue_obj, window=5)
+            self.assertEqual([m.body for m in next(poll)], ["a", "b", "c", "d"])
+        waits = [
+            c[1]["WaitTimeSeconds"] for c in queue_obj.receive_messages.call_args_list
+        ]
+        self.assertEqual(waits, [20, 5, 4, 1])
+
+    def test_poll_window_max_messages(self):
+        "the window ends early once the batch has the maximum number of messages"
+        queue_obj = fake_queue([["a", "b"], ["c", "d"], ["e"]])
+        with patch("bp.article_update_logic.time.monotonic") as monotonic:
+            monotonic.side_effect = [100, 101, 102]
+            poll = article_update_logic.poll(queue_obj, window=5, max_messages=5)
+            self.assertEqual([m.body for m in next(poll)], ["a", "b", "c", "d", "e"])
+        max_messages = [
+            c[1]["MaxNumberOfMessages"]
+            for c in queue_obj.receive_messages.call_args_list
+        ]
+        self.assertEqual(max_messages, [5, 3, 1])
+
+    def test_coalesce(self):
+        "events for the same article are coalesced"
+        events = [article_event(1), article_event(2), article_event(1), "foo"]
+        coalesced = sample("bp_sqs_messages_coalesced_total")
+        self.assertEqual(article_update_logic.coalesce(events), [1, 2])
+        self.assertEqual(sample("bp_sqs_messages_coalesced_total") - coalesced, 1)
+
+    def test_listen(self):
+        "every article received is handled and then the messages are deleted in a batch"
+        queue_obj = fake_queue(
+            [[article_event(1), article_event(2), article_event(3)], [article_event(4)]]
+        )
+        handled = []
+        self.listen(queue_obj, handled.append)
+        self.assertEqual(sorted(handled), [1, 2, 3, 4])
+        self.assertEqual(queue_obj.delete_messages.call_count, 2)
+        entries = queue_obj.delete_messages.call_args_list[0][1]["Entries"]
+        expected_entries = [
+            {"Id": "0", "ReceiptHandle": "handle-0"},
+            {"Id": "1", "ReceiptHandle": "handle-1"},
+            {"Id": "2", "ReceiptHandle": "handle-2"},
+        ]
+        self.assertEqual(entries, expected_entries)
+
+    def test_listen_coalesced(self):
+        "an article with several events in a batch is handled once and every message is deleted"
+        queue_obj = fake_queue([[article_event(1), article_event(2), article_event(1)]])
+        handled = []
+        self.listen(queue_obj, handled.append)
+        self.assertEqual(sorted(handled), [1, 2])
+        entries = queue_obj.delete_messages.call_args[1]["Entries"]
+        self.assertEqual(len(entries), 3)
+
+    def test_listen_concurrently(self):
+        "articles within a batch are handled concurrently"
+        queue_obj = fake_queue([[article_event(1), article_event(2), article_event(3)]])
+        self.sqs["concurrency"] = 3
+        barrier = threading.Barrier(3, timeout=5)
+        # each handler waits for the other two, failing if they aren't running at the same time
+        self.listen(queue_obj, lambda _: barrier.wait())
+        self.assertFalse(barrier.broken)
+
+    def test_listen_failed_message_deleted(self):
+        "a message that fails to be handled is still deleted"
+        queue_obj = fake_queue([[article_event(1)]])
+
+        def fn(_):
+            raise ValueError("boom")
+
+        self.listen(queue_obj, fn, exc=ValueError)
+        self.assertEqual(queue_obj.delete_messages.call_count, 1)
+
+    def test_handler_article_event(self):
+        "article events are downloaded, parsed and delivered"
+        with patch("bp.logic.download_parse_deliver_data") as dpdd:
+            self.assertEqual(article_update_logic.handler(article_event(3)), None)
+            dpdd.assert_called_once_with(3)
+
+    def test_handler_ignored_events(self):
+        "non-article and unparseable events are ignored"
+        events = [
+            "foo",
+            "[]",
+            json.dumps({"id": "3", "type": "metric"}),
+            json.dumps({}),
+        ]
+        with patch("bp.logic.download_parse_deliver_data") as dpdd:
+            for event in events:
+                self.assertEqual(article_update_logic.handler(event), None)
+            dpdd.assert_not_called()
+
+
 class ExtractProtocols(BaseCase):
     "extraction of protocol data from article-json"
 
@@ -143,6 +826,139 @@ class ExtractProtocols(BaseCase):
             self.assertEqual(resp.status_code, 500)
 
 
+class HTTPClients(BaseCase):
+    "pooled sessions for outgoing requests"
+
+    def test_session_per_host(self):
+        "a session is shared by requests to the same host"
+        sess = clients.session("https://example.org/foo")
+        self.assertTrue(sess is clients.session("https://example.org/bar?baz"))
+        self.assertFalse(sess is clients.session("https://example.com/foo"))
+
+    def test_session_pool_size(self):
+        "connections to each host are capped by the configured pool size"
+        clients.reset()
+        http = dict(settings.HTTP, **{"pool-size": 3})
+        with self.settings(HTTP=http):
+            adapter = clients.session("https://example.org").get_adapter(
+                "https://example.org"
+            )
+        self.assertEqual(adapter._pool_maxsize, 3)
+        self.assertTrue(adapter._pool_block)
+        clients.reset()
+
+    def test_requests_timeout(self):
+        "requests to the gateway and to BioProtocol are given the configured timeouts"
+        msid = 3
+        url = settings.ELIFE_GATEWAY + "/articles/" + str(msid)
+        bp_url = "https://dev.bio-protocol.org/api/elife00003?action=sendArticle"
+        http = dict(settings.HTTP, **{"connect-timeout": 1, "read-timeout": 2})
+        with self.settings(HTTP=http):
+            with responses.RequestsMock() as mock_resp:
+                mock_resp.add(responses.GET, url, json={}, status=200)
+                mock_resp.add(responses.POST, bp_url, status=200)
+                logic.download_elife_article(msid)
+                logic.deliver_protocol_data(msid, {})
+                for call in mock_resp.calls:
+                    self.assertEqual(call.request.req_kwargs["timeout"], (1, 2))
+                    self.assertEqual(
+                        call.request.headers["user-agent"], settings.USER_AGENT
+                    )
+
+    def test_requests_timeout_retried(self):
+        "requests that time out are retried and then logged"
+        msid = 3
+        url = settings.ELIFE_GATEWAY + "/articles/" + str(msid)
+        with patch("backoff._sync.time.sleep"):
+            with responses.RequestsMock() as mock_resp:
+                mock_resp.add(
+                    responses.GET, url, body=requests.exceptions.ReadTimeout()
+                )
+                resp = logic.get(url)
+                self.assertEqual(resp, None)
+                self.assertEqual(len(mock_resp.calls), 3)
+                self.assertEqual(logic.download_parse_deliver_data(msid), None)
+
+
+class StreamArticleJSON(BaseCase):
+    "incremental parsing of article-json"
+
+    def setUp(self):
+        fixture = join(FIXTURE_DIR, "elife-00003-v1.xml.json")
+        self.content = open(fixture, "rb").read()
+        self.data = json.loads(self.content)
+
+    def chunks(self, size):
+        return [self.content[i : i + size] for i in range(0, len(self.content), size)]
+
+    def test_stream_article_json(self):
+        "only the data needed to extract protocols is kept"
+        for size in [1, 100, len(self.content)]:
+            article_json = logic.stream_article_json(self.chunks(size))
+            self.assertEqual(
+                sorted(article_json.keys()),
+                ["authors", "body", "status", "title", "type"],
+            )
+            self.assertEqual(len(article_json["body"]), 1)
+            self.assertEqual(article_json["body"][0]["title"], "Materials and methods")
+            self.assertEqual(article_json["authors"], self.data["authors"])
+
+    def test_stream_article_json_extraction(self):
+        "protocols extracted from streamed article-json are identical to those extracted from the whole article"
+        article_json = logic.stream_article_json(self.chunks(1024))
+        self.assertEqual(
+            logic.extract_bioprotocol_response(article_json),
+            logic.extract_bioprotocol_response(self.data),
+        )
+
+    def test_stream_article_json_nested_mandms(self):
+        "body sections that contain a 'materials and methods' section are kept"
+        data = {
+            "title": "Foo",
+            "body": [
+                {"type": "section", "id": "s1", "title": "Introduction"},
+                {
+                    "type": "section",
+                    "id": "s2",
+                    "title": "Results",
+                    "content": [
+                        {
+                            "type": "section",
+                            "id": "s2-1",
+                            "title": "Materials and methods",
+                            "content": [
+                                {"type": "section", "id": "s2-1-1", "title": "Bar"}
+                            ],
+                        }
+                    ],
+                },
+            ],
+        }
+        article_json = logic.stream_article_json([json.dumps(data).encode()])
+        self.assertEqual(article_json["body"], [data["body"][1]])
+
+    def test_download_article_json_streaming(self):
+        "the streamed article-json is returned when the gateway is configured for streaming"
+        msid = 3
+        url = settings.ELIFE_GATEWAY + "/articles/" + str(msid)
+        with self.settings(ELIFE_GATEWAY_STREAMING=True):
+            with responses.RequestsMock() as mock_resp:
+                mock_resp.add(responses.GET, url, body=self.content, status=200)
+                resp = logic.download_elife_article(msid)
+                self.assertEqual(resp["title"], self.data["title"])
+                self.assertTrue("references" not in resp)
+
+    def test_download_article_json_streaming_failure(self):
+        "returns a http error response on failure when streaming"
+        msid = 3
+        url = settings.ELIFE_GATEWAY + "/articles/" + str(msid)
+        with self.settings(ELIFE_GATEWAY_STREAMING=True):
+            with responses.RequestsMock() as mock_resp:
+                mock_resp.add(responses.GET, url, status=500)
+                resp = logic.download_elife_article(msid)
+                self.assertEqual(resp.status_code, 500)
+
+
 class Model(BaseCase):
     def test_foo(self):
         pass
@@ -337,6 +1153,46 @@ class Logic(BaseCase):
         self.assertEqual(logic.row_count(), 3)
         self.assertEqual(models.ArticleProtocol.objects.count(), 6)
 
+    def test_add_result_queries(self):
+        "adding a result set costs the same number of queries regardless of the number of rows"
+        fixture = join(FIXTURE_DIR, "bp-post-to-elife.json")
+        fixture = json.load(open(fixture, "r"))
+        # select, insert, summary, document, savepoint + release
+        with self.assertNumQueries(6):
+            logic.add_result(fixture)
+        # select, update, summary, document, savepoint + release
+        with self.assertNumQueries(6):
+            logic.add_result(fixture)
+
+    def test_add_result_updates(self):
+        "adding a result set with changes to existing rows updates those rows"
+        fixture = join(FIXTURE_DIR, "bp-post-to-elife.json")
+        fixture = json.load(open(fixture, "r"))
+        dt1 = datetime(year=2019, month=1, day=1, tzinfo=timezone.utc)
+        dt2 = datetime(year=2020, month=1, day=1, tzinfo=timezone.utc)
+        with freeze_time(dt1):
+            logic.add_result(fixture)
+        fixture["data"][0]["IsProtocol"] = True
+        with freeze_time(dt2):
+            logic.add_result(fixture)
+        self.assertEqual(logic.row_count(), 4)
+        self.assertEqual(models.ArticleProtocol.objects.count(), 6)
+        apobj = models.ArticleProtocol.objects.get(protocol_sequencing_number="s4-1")
+        self.assertEqual(apobj.datetime_record_created, dt1)
+        self.assertEqual(apobj.datetime_record_updated, dt2)
+
+    def test_add_result_duplicate_rows(self):
+        "a result set that contains the same row twice creates a single row using the last values seen"
+        fixture = join(FIXTURE_DIR, "bp-post-to-elife.json")
+        fixture = json.load(open(fixture, "r"))
+        duplicate = dict(fixture["data"][0], ProtocolTitle="Foo")
+        fixture["data"].append(duplicate)
+        results = logic.add_result(fixture)
+        self.assertEqual(len(results["successful"]), 7)
+        self.assertEqual(models.ArticleProtocol.objects.count(), 6)
+        apobj = models.ArticleProtocol.objects.get(protocol_sequencing_number="s4-1")
+        self.assertEqual(apobj.protocol_title, "Foo")
+
     def test_protocol_data_no_article(self):
         "raises a DNE error when requested article does not exist"
         msid = 42
@@ -390,7 +1246,7 @@ class FundamentalViews(TestCase):
         self.assertEqual(resp.json(), expected)
 
     def test_bad_status(self):
-        with patch("bp.logic.last_updated", raises=RuntimeError):
+        with patch("bp.logic.summary", side_effect=RuntimeError):
             resp = self.c.get(urls.reverse("status"))
             self.assertEqual(resp.status_code, 500)
             self.assertEqual(resp.json(), {"error": "unexpected error"})
@@ -510,3 +1366,1637 @@ class APIViews(TestCase):
         self.assertEqual(resp.status_code, 400)
         expected_response = {"msid": 12345, "successful": 5, "failed": 1}
         self.assertEqual(resp.json(), expected_response)
+
+
+class ResponseCache(BaseCase):
+    def setUp(self):
+        self.c = Client()
+        self.article_url = urls.reverse("article", kwargs={"msid": 12345})
+        fixture = join(FIXTURE_DIR, "bp-post-to-elife.json")
+        self.fixture = json.load(open(fixture, "r"))
+
+    def test_lru_cache(self):
+        "the least recently used entry is evicted once the cache is full"
+        lru = cache.LRUCache(2, 60)
+        lru.set(1, b"1")
+        lru.set(2, b"2")
+        self.assertEqual(lru.get(1), b"1")
+        lru.set(3, b"3")  # evicts 2
+        self.assertEqual(lru.get(2), None)
+        self.assertEqual(lru.get(1), b"1")
+        self.assertEqual(lru.get(3), b"3")
+
+    def test_lru_cache_expiry(self):
+        "an entry expires `ttl` seconds after it was set"
+        lru = cache.LRUCache(2, 60)
+        with patch("bp.cache.time.monotonic", return_value=100):
+            lru.set(1, b"1")
+        with patch("bp.cache.time.monotonic", return_value=159):
+            self.assertEqual(lru.get(1), b"1")
+        with patch("bp.cache.time.monotonic", return_value=160):
+            self.assertEqual(lru.get(1), None)
+
+    def test_article_cached(self):
+        "a response for an article is cached and subsequent requests don't query the database"
+        logic.add_result(self.fixture)
+        resp = self.c.get(self.article_url)
+        self.assertEqual(resp.status_code, 200)
+        with self.assertNumQueries(0):
+            cached_resp = self.c.get(self.article_url)
+        self.assertEqual(cached_resp.status_code, 200)
+        self.assertEqual(cached_resp["Content-Type"], settings.ELIFE_CONTENT_TYPE)
+        self.assertEqual(cached_resp.content, resp.content)
+
+    def test_article_dne_not_cached(self):
+        "a request for an article that does not exist is not cached"
+        self.assertEqual(self.c.get(self.article_url).status_code, 404)
+        self.assertEqual(cache.get(12345), None)
+        logic.add_result(self.fixture)
+        self.assertEqual(self.c.get(self.article_url).status_code, 200)
+
+    def test_article_cache_invalidated(self):
+        "a cached response is discarded when new data for the article is written"
+        logic.add_result(self.fixture)
+        self.assertEqual(self.c.get(self.article_url).json()["total"], 3)
+        self.fixture["data"][0]["IsProtocol"] = True
+        with self.captureOnCommitCallbacks(execute=True):
+            logic.add_result(self.fixture)
+        self.assertEqual(cache.get(12345), None)
+        self.assertEqual(self.c.get(self.article_url).json()["total"], 4)
+
+    def test_article_cache_invalidated_on_post(self):
+        "a cached response is discarded when new data for the article is POSTed"
+        logic.add_result(self.fixture)
+        self.assertEqual(self.c.get(self.article_url).json()["total"], 3)
+        self.fixture["data"][0]["IsProtocol"] = True
+        with self.captureOnCommitCallbacks(execute=True):
+            self.c.post(
+                self.article_url, self.fixture["data"], content_type="application/json"
+            )
+        self.assertEqual(self.c.get(self.article_url).json()["total"], 4)
+
+    def test_article_cache_stale(self):
+        "a response for an article written by another process is served stale until the entry expires"
+        ttl = settings.RESPONSE_CACHE["ttl"]
+        with patch("bp.cache.time.monotonic", return_value=100):
+            logic.add_result(self.fixture)
+            self.assertEqual(self.c.get(self.article_url).json()["total"], 3)
+            self.fixture["data"][0]["IsProtocol"] = True
+            # the cached response is left in place, as if written by a process with it's own cache
+            with patch("bp.cache.invalidate"):
+                with self.captureOnCommitCallbacks(execute=True):
+                    logic.add_result(self.fixture)
+            self.assertEqual(self.c.get(self.article_url).json()["total"], 3)
+        with patch("bp.cache.time.monotonic", return_value=100 + ttl):
+            self.assertEqual(self.c.get(self.article_url).json()["total"], 4)
+
+    def test_django_cache_backend(self):
+        "the Django cache backend can be used instead of the in-process cache"
+        response_cache = dict(settings.RESPONSE_CACHE, backend="django")
+        with self.settings(RESPONSE_CACHE=response_cache):
+            with patch("bp.cache._CACHE", None):
+                self.assertTrue(isinstance(cache.backend(), cache.DjangoCache))
+                logic.add_result(self.fixture)
+                resp = self.c.get(self.article_url)
+                self.assertEqual(json.loads(cache.get(12345)["content"]), resp.json())
+                cache.invalidate(12345)
+                self.assertEqual(cache.get(12345), None)
+
+    def test_cache_disabled(self):
+        "the response cache can be disabled"
+        response_cache = dict(settings.RESPONSE_CACHE, enabled=False)
+        with self.settings(RESPONSE_CACHE=response_cache):
+            logic.add_result(self.fixture)
+            self.c.get(self.article_url)
+            self.assertEqual(cache.get(12345), None)
+            # document
+            with self.assertNumQueries(1):
+                self.c.get(self.article_url)
+
+
+class ConditionalRequests(BaseCase):
+    def setUp(self):
+        self.c = Client()
+        self.article_url = urls.reverse("article", kwargs={"msid": 12345})
+        fixture = join(FIXTURE_DIR, "bp-post-to-elife.json")
+        self.fixture = json.load(open(fixture, "r"))
+        self.dt = datetime(year=2019, month=8, day=29, hour=6, tzinfo=timezone.utc)
+        with freeze_time(self.dt):
+            logic.add_result(self.fixture)
+
+    def test_article_validators(self):
+        "a request for an article includes an ETag and Last-Modified header"
+        resp = self.c.get(self.article_url)
+        self.assertEqual(resp.status_code, 200)
+        self.assertTrue(resp["ETag"].startswith('"'))
+        self.assertEqual(resp["Last-Modified"], "Thu, 29 Aug 2019 06:00:00 GMT")
+
+    def test_article_if_none_match(self):
+        "a request for an article with a matching ETag returns a 304 with an empty body"
+        etag = self.c.get(self.article_url)["ETag"]
+        for _ in range(2):  # uncached, cached
+            cache.clear()
+            resp = self.c.get(self.article_url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(resp.status_code, 304)
+            self.assertEqual(resp.content, b"")
+            self.assertEqual(resp["ETag"], etag)
+
+    def test_article_if_none_match_single_query(self):
+        "a conditional request for an uncached article is answered with a single query"
+        etag = self.c.get(self.article_url)["ETag"]
+        cache.clear()
+        with self.assertNumQueries(1):
+            resp = self.c.get(self.article_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resp.status_code, 304)
+
+    def test_article_if_none_match_changed(self):
+        "a request for an article with a stale ETag returns the full response"
+        etag = self.c.get(self.article_url)["ETag"]
+        self.fixture["data"][0]["IsProtocol"] = True
+        with self.captureOnCommitCallbacks(execute=True):
+            logic.add_result(self.fixture)
+        resp = self.c.get(self.article_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resp.status_code, 200)
+        self.assertNotEqual(resp["ETag"], etag)
+        self.assertEqual(resp.json()["total"], 4)
+
+    def test_article_if_modified_since(self):
+        "a request for an article that hasn't been modified since the given date returns a 304"
+        resp = self.c.get(
+            self.article_url, HTTP_IF_MODIFIED_SINCE="Thu, 29 Aug 2019 06:00:00 GMT"
+        )
+        self.assertEqual(resp.status_code, 304)
+        resp = self.c.get(
+            self.article_url, HTTP_IF_MODIFIED_SINCE="Thu, 29 Aug 2019 05:59:59 GMT"
+        )
+        self.assertEqual(resp.status_code, 200)
+
+    def test_article_dne_conditional(self):
+        "a conditional request for an article that does not exist returns a 404"
+        url = urls.reverse("article", kwargs={"msid": 42})
+        resp = self.c.get(url, HTTP_IF_NONE_MATCH="*")
+        self.assertEqual(resp.status_code, 404)
+
+    def test_status_if_none_match(self):
+        "a request for the status with a matching ETag returns a 304 using a single query"
+        resp = self.c.get(urls.reverse("status"))
+        self.assertEqual(resp["Last-Modified"], "Thu, 29 Aug 2019 06:00:00 GMT")
+        with self.assertNumQueries(1):
+            resp = self.c.get(urls.reverse("status"), HTTP_IF_NONE_MATCH=resp["ETag"])
+        self.assertEqual(resp.status_code, 304)
+
+    def test_status_if_none_match_changed(self):
+        "a request for the status with a stale ETag returns the full response"
+        etag = self.c.get(urls.reverse("status"))["ETag"]
+        logic.add_result(dict(self.fixture, elifeID=1))
+        resp = self.c.get(urls.reverse("status"), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.json()["row-count"], 6)
+
+
+class BatchAPIViews(TestCase):
+    def setUp(self):
+        self.c = Client()
+        self.articles_url = urls.reverse("articles")
+        fixture = join(FIXTURE_DIR, "bp-post-to-elife.json")
+        self.rows = json.load(open(fixture, "r"))["data"]
+
+    def test_articles_post(self):
+        "a POST request with data for many articles returns a per-article summary"
+        post_body = [
+            {"elifeID": 12345, "data": self.rows},
+            {"elifeID": "00003", "data": self.rows[:2]},
+        ]
+        resp = self.c.post(
+            self.articles_url, post_body, content_type="application/json"
+        )
+        self.assertEqual(resp.status_code, 200)
+        expected_response = {
+            "total": 2,
+            "items": [
+                {"msid": 12345, "successful": 6, "failed": 0},
+                {"msid": 3, "successful": 2, "failed": 0},
+            ],
+        }
+        self.assertEqual(resp.json(), expected_response)
+        self.assertEqual(models.ArticleProtocol.objects.count(), 8)
+        self.assertEqual(models.ArticleProtocol.objects.filter(msid=3).count(), 2)
+
+    def test_articles_post_ndjson(self):
+        "a POST request with newline-delimited JSON is accepted"
+        post_body = "\n".join(
+            json.dumps({"elifeID": msid, "data": self.rows}) for msid in [1, 2, 3]
+        )
+        resp = self.c.post(
+            self.articles_url, post_body, content_type="application/x-ndjson"
+        )
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.json()["total"], 3)
+        self.assertEqual(models.ArticleProtocol.objects.count(), 18)
+
+    def test_articles_post_large(self):
+        "a POST request larger than Django's upload limit is accepted up to the 'max-batch-size' setting"
+        post_body = [{"elifeID": msid, "data": self.rows} for msid in range(1, 4)]
+        for content_type, body in [
+            ("application/json", json.dumps(post_body)),
+            ("application/x-ndjson", "\n".join(map(json.dumps, post_body))),
+        ]:
+            with self.settings(DATA_UPLOAD_MAX_MEMORY_SIZE=len(body) // 2):
+                resp = self.c.post(self.articles_url, body, content_type=content_type)
+                self.assertEqual(resp.status_code, 200)
+                self.assertEqual(resp.json()["total"], 3)
+
+                api = dict(settings.API, **{"max-batch-size": len(body) // 2})
+                with self.settings(API=api):
+                    resp = self.c.post(
+                        self.articles_url, body, content_type=content_type
+                    )
+                    self.assertEqual(resp.status_code, 413)
+                    self.assertIn("send fewer articles", resp.json()["error"])
+
+    def test_articles_post_chunked(self):
+        "articles are written in chunks"
+        post_body = [{"elifeID": msid, "data": self.rows} for msid in range(1, 6)]
+        with patch("bp.logic.ADD_RESULTS_CHUNK_SIZE", 2):
+            with patch("bp.utils.chunks", wraps=utils.chunks) as chunks:
+                resp = self.c.post(
+                    self.articles_url, post_body, content_type="application/json"
+                )
+                self.assertEqual(chunks.call_args[0][1], 2)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.json()["total"], 5)
+        self.assertEqual(models.ArticleProtocol.objects.count(), 30)
+
+    def test_articles_post_mixed_invalid_data(self):
+        "a POST request with some invalid rows returns a failed response with the valid rows written"
+        bad_rows = [dict(self.rows[0], foo="bar")] + self.rows[1:]
+        post_body = [
+            {"elifeID": 1, "data": self.rows},
+            {"elifeID": 2, "data": bad_rows},
+        ]
+        resp = self.c.post(
+            self.articles_url, post_body, content_type="application/json"
+        )
+        self.assertEqual(resp.status_code, 400)
+        expected_items = [
+            {"msid": 1, "successful": 6, "failed": 0},
+            {"msid": 2, "successful": 5, "failed": 1},
+        ]
+        self.assertEqual(resp.json()["items"], expected_items)
+        self.assertEqual(models.ArticleProtocol.objects.count(), 11)
+
+    def test_articles_post_unhandled_error(self):
+        "an article that fails unexpectedly is rolled back without affecting other articles"
+        bad_rows = [dict(self.rows[0], URI="not a url")] + self.rows[1:]
+        post_body = [
+            {"elifeID": 1, "data": bad_rows},
+            {"elifeID": 2, "data": self.rows},
+        ]
+        resp = self.c.post(
+            self.articles_url, post_body, content_type="application/json"
+        )
+        self.assertEqual(resp.status_code, 400)
+        expected_items = [
+            {"msid": 1, "successful": 0, "failed": 1},
+            {"msid": 2, "successful": 6, "failed": 0},
+        ]
+        self.assertEqual(resp.json()["items"], expected_items)
+        self.assertEqual(models.ArticleProtocol.objects.filter(msid=1).count(), 0)
+        self.assertEqual(models.ArticleProtocol.objects.filter(msid=2).count(), 6)
+
+    def test_articles_post_bad_data(self):
+        "a POST request with bad data returns a failed response and writes nothing"
+        bad_post_bodies = [
+            "foo",
+            {"elifeID": 1, "data": self.rows},  # not a list
+            [{"elifeID": 1, "data": self.rows}, {"elifeID": 2}],
+            [{"elifeID": "foo", "data": self.rows}],
+            [{"elifeID": 1, "data": []}],
+        ]
+        for post_body in bad_post_bodies:
+            resp = self.c.post(
+                self.articles_url, post_body, content_type="application/json"
+            )
+            self.assertEqual(resp.status_code, 400)
+        self.assertEqual(models.ArticleProtocol.objects.count(), 0)
+
+    def test_articles_post_bad_data_message(self):
+        "envelopes that aren't valid are told apart from JSON that can't be parsed"
+        expected = [
+            ("[{", "failed to parse given JSON"),
+            (
+                [{"data": self.rows}],
+                "expecting a map of 'elifeID' and 'data' for each article",
+            ),
+            (
+                [{"elifeID": "foo", "data": self.rows}],
+                "expecting a numeric 'elifeID', not 'foo'",
+            ),
+            (
+                [{"elifeID": 1, "data": []}],
+                "expecting a non-empty list of 'data' for article 1",
+            ),
+        ]
+        for post_body, message in expected:
+            resp = self.c.post(
+                self.articles_url, post_body, content_type="application/json"
+            )
+            self.assertEqual(resp.status_code, 400)
+            self.assertEqual(resp.json(), {"error": message})
+
+    def test_articles_post_no_data(self):
+        resp = self.c.post(self.articles_url, [], content_type="application/json")
+        self.assertEqual(resp.status_code, 400)
+
+    def test_articles_post_bad_encoding(self):
+        post_body = [{"elifeID": 1, "data": self.rows}]
+        resp = self.c.post(
+            self.articles_url, json.dumps(post_body), content_type="text/plain"
+        )
+        self.assertEqual(resp.status_code, 406)
+
+
+def sample(name, labels=None):
+    "returns the current value of the given metric sample, or 0 if it hasn't been observed"
+    return prometheus_client.REGISTRY.get_sample_value(name, labels or {}) or 0
+
+
+class Metrics(BaseCase):
+    def setUp(self):
+        self.c = Client()
+        fixture = join(FIXTURE_DIR, "bp-post-to-elife.json")
+        self.fixture = json.load(open(fixture, "r"))
+
+    def test_metrics(self):
+        "metrics are served in the Prometheus text format"
+        resp = self.c.get(urls.reverse("metrics"))
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp["Content-Type"], metrics.CONTENT_TYPE)
+        self.assertIn(b"bp_article_request_seconds", resp.content)
+        self.assertIn(b"bp_sqs_messages_received_total", resp.content)
+
+    def test_listener_metrics_served(self):
+        "the update listener and outbox worker serve their metrics on the configured ports"
+        metrics_settings = {"listener-port": 9101, "outbox-port": 9102}
+        sqs = dict(settings.SQS, **{"queue-name": "foo"})
+        with self.settings(METRICS=metrics_settings, SQS=sqs):
+            with patch("prometheus_client.start_http_server") as start_http_server:
+                with patch("bp.article_update_logic.listen"):
+                    call_command("update_listener")
+                with patch("bp.outbox.deliver", return_value=[]):
+                    call_command("deliver_outbox", "--once", stdout=StringIO())
+        ports = [c[0][0] for c in start_http_server.call_args_list]
+        self.assertEqual(ports, [9101, 9102])
+
+    def test_article_request_latency(self):
+        "the latency of requests for an article are observed per-method"
+        url = urls.reverse("article", kwargs={"msid": 12345})
+        name = "bp_article_request_seconds_count"
+        get_count = sample(name, {"method": "GET"})
+        post_count = sample(name, {"method": "POST"})
+        self.c.post(
+            url, json.dumps(self.fixture["data"]), content_type="application/json"
+        )
+        self.c.get(url)
+        self.c.get(url)
+        self.assertEqual(sample(name, {"method": "GET"}), get_count + 2)
+        self.assertEqual(sample(name, {"method": "POST"}), post_count + 1)
+
+    def test_add_result_rows(self):
+        "the number of rows given to `add_result` is observed"
+        count = sample("bp_add_result_rows_count")
+        total = sample("bp_add_result_rows_sum")
+        logic.add_result(self.fixture)
+        self.assertEqual(sample("bp_add_result_rows_count"), count + 1)
+        self.assertEqual(
+            sample("bp_add_result_rows_sum"), total + len(self.fixture["data"])
+        )
+
+    def test_extract_protocols_duration(self):
+        fixture = join(FIXTURE_DIR, "elife-00003-v1.xml.json")
+        article_json = json.load(open(fixture, "r"))
+        count = sample("bp_extract_protocols_seconds_count")
+        logic.extract_protocols(article_json)
+        self.assertEqual(sample("bp_extract_protocols_seconds_count"), count + 1)
+
+    def test_http_latency(self):
+        "outgoing requests are observed per-host, method and status code"
+        url = settings.ELIFE_GATEWAY + "/articles/3"
+        labels = {"host": clients.host(url), "method": "GET", "status": "404"}
+        error_labels = dict(labels, status="error")
+        count = sample("bp_http_request_seconds_count", labels)
+        error_count = sample("bp_http_request_seconds_count", error_labels)
+        with responses.RequestsMock() as mock_resp:
+            mock_resp.add(responses.GET, url, status=404)
+            clients.get(url)
+            mock_resp.replace(
+                responses.GET, url, body=requests.exceptions.ConnectTimeout()
+            )
+            with self.assertRaises(requests.exceptions.ConnectTimeout):
+                clients.get(url)
+        self.assertEqual(sample("bp_http_request_seconds_count", labels), count + 1)
+        self.assertEqual(
+            sample("bp_http_request_seconds_count", error_labels), error_count + 1
+        )
+
+    def test_backoff_retries(self):
+        "requests that are re-attempted are counted"
+        url = settings.ELIFE_GATEWAY + "/articles/3"
+        labels = {"function": "_get"}
+        count = sample("bp_backoff_retries_total", labels)
+        with responses.RequestsMock() as mock_resp:
+            mock_resp.add(
+                responses.GET, url, body=requests.exceptions.ConnectionError()
+            )
+            with patch("backoff._sync.time.sleep"):
+                self.assertEqual(logic.get(url), None)
+        self.assertEqual(sample("bp_backoff_retries_total", labels), count + 2)
+
+    def test_sqs_messages(self):
+        "messages received and articles handled or failed by the listener are counted"
+        queue_obj = fake_queue([[article_event(1), article_event(2), article_event(1)]])
+        received = sample("bp_sqs_messages_received_total")
+        coalesced = sample("bp_sqs_messages_coalesced_total")
+        handled = sample("bp_sqs_articles_handled_total")
+        failed = sample("bp_sqs_articles_failed_total")
+
+        def download_parse_deliver_data(msid):
+            if msid == 2:
+                raise ValueError("boom")
+
+        sqs = dict(settings.SQS, **{"coalesce-window": 0})
+        with self.settings(SQS=sqs):
+            with patch(
+                "bp.article_update_logic.queue_resource", return_value=queue_obj
+            ):
+                with patch(
+                    "bp.logic.download_parse_deliver_data",
+                    side_effect=download_parse_deliver_data,
+                ):
+                    with self.assertRaises(StopListening):
+                        article_update_logic.listen()
+
+        self.assertEqual(sample("bp_sqs_messages_received_total"), received + 3)
+        self.assertEqual(sample("bp_sqs_messages_coalesced_total"), coalesced + 1)
+        self.assertEqual(sample("bp_sqs_articles_handled_total"), handled + 1)
+        self.assertEqual(sample("bp_sqs_articles_failed_total"), failed + 1)
+
+
+class QueryPlans(BaseCase):
+    "the read paths are answered with a single query that uses an index"
+
+    def setUp(self):
+        fixture = join(FIXTURE_DIR, "bp-post-to-elife.json")
+        logic.add_result(json.load(open(fixture, "r")))
+
+    def assert_one_indexed_query(self, fn, *args):
+        with CaptureQueriesContext(connection) as ctx:
+            fn(*args)
+        self.assertEqual(len(ctx.captured_queries), 1)
+        if connection.vendor != "sqlite":
+            return
+        with connection.cursor() as cursor:
+            cursor.execute("EXPLAIN QUERY PLAN " + ctx.captured_queries[0]["sql"])
+            plan = [row[-1] for row in cursor.fetchall()]
+        for step in plan:
+            if step.startswith(("SCAN", "SEARCH")):
+                self.assertTrue(
+                    "INDEX" in step or "PRIMARY KEY" in step,
+                    "unindexed query plan: %s" % plan,
+                )
+
+    def test_protocol_data(self):
+        self.assert_one_indexed_query(logic.protocol_data, 12345)
+
+    def test_protocol_data_dne(self):
+        "an article with no data takes a second query to tell it apart from an article with no protocols"
+        with self.assertNumQueries(2):
+            with self.assertRaises(models.ArticleProtocol.DoesNotExist):
+                logic.protocol_data(42)
+
+    def test_article_validators(self):
+        self.assert_one_indexed_query(logic.article_validators, 12345)
+
+    def test_article_document(self):
+        self.assert_one_indexed_query(logic.article_document, 12345)
+
+    def test_last_updated(self):
+        self.assert_one_indexed_query(logic.last_updated)
+
+    def test_row_count(self):
+        self.assert_one_indexed_query(logic.row_count)
+
+    def test_summary(self):
+        self.assert_one_indexed_query(logic.summary)
+
+
+class StatusSummary(BaseCase):
+    "the summary served by /status is kept up to date as protocol data is written"
+
+    def setUp(self):
+        fixture = join(FIXTURE_DIR, "bp-post-to-elife.json")
+        self.fixture = json.load(open(fixture, "r"))
+
+    def assert_summary_accurate(self):
+        expected = logic.summary()
+        self.assertEqual(logic.rebuild_summary().row_count, expected["row-count"])
+        self.assertEqual(logic.summary(), expected)
+
+    def test_summary_empty(self):
+        self.assertEqual(logic.summary(), {"last-updated": None, "row-count": 0})
+
+    def test_summary_created(self):
+        dt = datetime(year=2019, month=8, day=29, hour=6, tzinfo=timezone.utc)
+        with freeze_time(dt):
+            logic.add_result(self.fixture)
+        self.assertEqual(logic.summary(), {"last-updated": dt, "row-count": 3})
+        self.assert_summary_accurate()
+
+    def test_summary_updated(self):
+        "rows that become or stop being protocols are counted, rows that are re-sent are not counted twice"
+        dt1 = datetime(year=2019, month=1, day=1, tzinfo=timezone.utc)
+        dt2 = datetime(year=2020, month=1, day=1, tzinfo=timezone.utc)
+        with freeze_time(dt1):
+            logic.add_result(self.fixture)
+            logic.add_result(self.fixture)
+        self.assertEqual(logic.summary()["row-count"], 3)
+
+        self.fixture["data"][0]["IsProtocol"] = True  # was False
+        self.fixture["data"][2]["IsProtocol"] = False  # was True
+        self.fixture["data"][3]["IsProtocol"] = False  # was True
+        with freeze_time(dt2):
+            logic.add_result(self.fixture)
+        self.assertEqual(logic.summary(), {"last-updated": dt2, "row-count": 2})
+        self.assert_summary_accurate()
+
+    def test_summary_out_of_order(self):
+        "the date of the most recently updated row isn't moved back by a write with an earlier time"
+        dt1 = datetime(year=2019, month=1, day=1, tzinfo=timezone.utc)
+        dt2 = datetime(year=2020, month=1, day=1, tzinfo=timezone.utc)
+        with freeze_time(dt2):
+            logic.add_result(self.fixture)
+        with freeze_time(dt1):
+            logic.add_result(dict(self.fixture, elifeID=12344))
+        self.assertEqual(logic.summary(), {"last-updated": dt2, "row-count": 6})
+        self.assert_summary_accurate()
+
+    def test_summary_upsert(self):
+        row = logic.validate(
+            logic.pre_process(dict(self.fixture["data"][2], msid=12345))
+        )
+        logic.upsert(row)
+        logic.upsert(row)
+        self.assertEqual(logic.summary()["row-count"], 1)
+        logic.upsert(dict(row, is_protocol=False))
+        self.assertEqual(logic.summary()["row-count"], 0)
+        self.assert_summary_accurate()
+
+    def test_summary_missing(self):
+        "the summary is rebuilt if it's missing"
+        logic.add_result(self.fixture)
+        models.ProtocolSummary.objects.all().delete()
+        self.assertEqual(logic.summary()["row-count"], 3)
+        models.ProtocolSummary.objects.all().delete()
+        logic.add_result(self.fixture)
+        self.assertEqual(logic.summary()["row-count"], 3)
+
+    def test_status_single_query(self):
+        "/status is answered by reading a single row"
+        logic.add_result(self.fixture)
+        with self.assertNumQueries(1):
+            resp = Client().get(urls.reverse("status"))
+        self.assertEqual(resp.json()["row-count"], 3)
+
+    def test_rebuild_summary_command(self):
+        logic.add_result(self.fixture)
+        models.ProtocolSummary.objects.update(row_count=42)
+        stdout = StringIO()
+        with patch("sys.stdout", stdout):
+            call_command("rebuild_summary")
+        self.assertEqual(json.loads(stdout.getvalue())["row-count"], 3)
+        self.assertEqual(logic.summary()["row-count"], 3)
+
+
+class ArticleDocuments(BaseCase):
+    "the rendered protocol data of an article is stored as it's written"
+
+    def setUp(self):
+        self.c = Client()
+        self.article_url = urls.reverse("article", kwargs={"msid": 12345})
+        fixture = join(FIXTURE_DIR, "bp-post-to-elife.json")
+        self.fixture = json.load(open(fixture, "r"))
+
+    def test_document_written(self):
+        "the document of an article is its protocol data, ETag and Last-Modified"
+        logic.add_result(self.fixture)
+        document = logic.article_document(12345)
+        self.assertEqual(json.loads(document["content"]), logic.protocol_data(12345))
+        etag, last_modified = logic.article_validators(12345)
+        self.assertEqual(document["etag"], etag)
+        self.assertEqual(document["last-modified"], last_modified)
+        self.assertEqual(models.ArticleDocument.objects.count(), 1)
+
+    def test_document_updated(self):
+        "the document of an article is re-rendered when the article is written"
+        logic.add_result(self.fixture)
+        etag = logic.article_document(12345)["etag"]
+        self.fixture["data"][0]["IsProtocol"] = True
+        logic.add_result(self.fixture)
+        document = logic.article_document(12345)
+        self.assertNotEqual(document["etag"], etag)
+        self.assertEqual(json.loads(document["content"])["total"], 4)
+        self.assertEqual(json.loads(document["content"]), logic.protocol_data(12345))
+        self.assertEqual(models.ArticleDocument.objects.count(), 1)
+
+    def test_document_upsert(self):
+        row = logic.validate(logic.pre_process(dict(self.fixture["data"][2], msid=42)))
+        logic.upsert(row)
+        document = logic.article_document(42)
+        self.assertEqual(json.loads(document["content"]), logic.protocol_data(42))
+
+    def test_document_rolled_back(self):
+        "the document isn't changed if writing the article fails"
+        logic.add_result(self.fixture)
+        document = logic.article_document(12345)
+        self.fixture["data"][0]["IsProtocol"] = True
+        with patch("bp.logic.update_summary", side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                logic.add_result(self.fixture)
+        self.assertEqual(logic.article_document(12345), document)
+
+    def test_document_missing(self):
+        "a missing document is rendered from the protocol data"
+        logic.add_result(self.fixture)
+        expected = logic.article_document(12345)
+        models.ArticleDocument.objects.all().delete()
+        self.assertEqual(logic.article_document(12345), expected)
+        self.assertEqual(models.ArticleDocument.objects.count(), 1)
+
+    def test_document_dne(self):
+        with self.assertRaises(models.ArticleProtocol.DoesNotExist):
+            logic.article_document(42)
+
+    def test_article_get(self):
+        "a request for an article is answered with a single lookup without creating model instances"
+        self.c.post(
+            self.article_url,
+            json.dumps(self.fixture["data"]),
+            content_type="application/json",
+        )
+        cache.clear()
+        with patch.object(
+            models.ArticleProtocol, "from_db", side_effect=AssertionError
+        ), patch.object(models.ArticleDocument, "from_db", side_effect=AssertionError):
+            with self.assertNumQueries(1):
+                resp = self.c.get(self.article_url)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.json(), logic.protocol_data(12345))
+
+
+class ResponseFormats(BaseCase):
+    "compact JSON, indentation negotiated with the Accept header and compression"
+
+    def setUp(self):
+        self.c = Client()
+        self.article_url = urls.reverse("article", kwargs={"msid": 12345})
+        fixture = join(FIXTURE_DIR, "bp-post-to-elife.json")
+        logic.add_result(json.load(open(fixture, "r")))
+        self.expected = logic.protocol_data(12345)
+        self.api = dict(settings.API, **{"json-indent": None, "compress": True})
+
+    def test_compact(self):
+        "responses are compact unless an indent is configured"
+        with self.settings(API=self.api):
+            for url in [self.article_url, urls.reverse("status")]:
+                resp = self.c.get(url)
+                self.assertNotIn(b"\n", resp.content)
+                self.assertNotIn(b": ", resp.content)
+                self.assertIn("Accept", resp["Vary"])
+
+    def test_indent_configured(self):
+        api = dict(self.api, **{"json-indent": 4})
+        with self.settings(API=api):
+            resp = self.c.get(self.article_url)
+        self.assertEqual(resp.content.decode(), json.dumps(self.expected, indent=4))
+
+    def test_indent_negotiated(self):
+        "a client can ask for an indent with a parameter of the Accept header"
+        with self.settings(API=self.api):
+            compact = self.c.get(self.article_url)
+            for _ in range(2):  # uncached, cached
+                resp = self.c.get(
+                    self.article_url, HTTP_ACCEPT="application/json; indent=2"
+                )
+                self.assertEqual(
+                    resp.content.decode(), json.dumps(self.expected, indent=2)
+                )
+            # the indented variant is cached rather than rendered again
+            with patch("bp.codec.loads") as loads:
+                self.c.get(self.article_url, HTTP_ACCEPT="application/json; indent=2")
+            loads.assert_not_called()
+            status = self.c.get(urls.reverse("status"), HTTP_ACCEPT="*/*;indent=2")
+            self.assertIn(b'\n  "row-count"', status.content)
+        # each representation has it's own ETag
+        self.assertNotEqual(compact["ETag"], resp["ETag"])
+
+    def test_indent_bad_param(self):
+        "an unparseable indent is ignored"
+        with self.settings(API=self.api):
+            resp = self.c.get(
+                self.article_url, HTTP_ACCEPT="application/json; indent=foo"
+            )
+        self.assertEqual(resp.json(), self.expected)
+        self.assertNotIn(b"\n", resp.content)
+
+    def test_indent_out_of_range(self):
+        "an indent outside of the range a client can ask for is ignored"
+        with self.settings(API=self.api):
+            for indent in ["200000", "-1", "9"]:
+                resp = self.c.get(
+                    self.article_url, HTTP_ACCEPT="application/json; indent=" + indent
+                )
+                self.assertNotIn(b"\n", resp.content)
+
+    def test_compact_negotiated(self):
+        "a client can ask for compact JSON when an indent is configured"
+        api = dict(self.api, **{"json-indent": 4})
+        with self.settings(API=api):
+            for url in [self.article_url, urls.reverse("status")]:
+                indented = self.c.get(url)
+                resp = self.c.get(url, HTTP_ACCEPT="application/json; indent=0")
+                self.assertIn(b"\n", indented.content)
+                self.assertNotIn(b"\n", resp.content)
+                self.assertNotEqual(indented["ETag"], resp["ETag"])
+
+    def test_gzip(self):
+        "responses larger than the threshold are compressed if the client accepts it"
+        api = dict(self.api, **{"compress-min-size": 10})
+        with self.settings(API=api), patch("bp.compression.brotli", None):
+            resp = self.c.get(self.article_url, HTTP_ACCEPT_ENCODING="gzip, deflate")
+        self.assertEqual(resp["Content-Encoding"], "gzip")
+        self.assertIn("Accept-Encoding", resp["Vary"])
+        self.assertTrue(resp["ETag"].startswith('W/"'))
+        self.assertEqual(json.loads(gzip.decompress(resp.content)), self.expected)
+        self.assertEqual(int(resp["Content-Length"]), len(resp.content))
+
+    @pytest.mark.skipif(compression.brotli is None, reason="brotli isn't installed")
+    def test_brotli(self):
+        "brotli is preferred if it's installed and the client accepts it"
+        api = dict(self.api, **{"compress-min-size": 10})
+        with self.settings(API=api):
+            resp = self.c.get(self.article_url, HTTP_ACCEPT_ENCODING="gzip, br")
+        self.assertEqual(resp["Content-Encoding"], "br")
+        body = compression.brotli.decompress(resp.content)
+        self.assertEqual(json.loads(body), self.expected)
+
+    def test_not_compressed(self):
+        "small responses and responses to clients that don't accept compression are not compressed"
+        cases = [
+            ({"compress-min-size": 10}, {}),
+            ({"compress-min-size": 10}, {"HTTP_ACCEPT_ENCODING": "gzip;q=0, br;q=0"}),
+            ({"compress-min-size": 10}, {"HTTP_ACCEPT_ENCODING": "identity"}),
+            ({"compress-min-size": 100_000}, {"HTTP_ACCEPT_ENCODING": "gzip"}),
+            ({"compress": False}, {"HTTP_ACCEPT_ENCODING": "gzip"}),
+        ]
+        for api, headers in cases:
+            with self.settings(API=dict(self.api, **api)):
+                resp = self.c.get(self.article_url, **headers)
+            self.assertFalse(resp.has_header("Content-Encoding"), (api, headers))
+            self.assertEqual(resp.json(), self.expected)
+
+    def test_compressed_conditional_request(self):
+        "the weak ETag of a compressed response matches when sent back"
+        api = dict(self.api, **{"compress-min-size": 10})
+        with self.settings(API=api):
+            etag = self.c.get(self.article_url, HTTP_ACCEPT_ENCODING="gzip")["ETag"]
+            resp = self.c.get(
+                self.article_url, HTTP_ACCEPT_ENCODING="gzip", HTTP_IF_NONE_MATCH=etag
+            )
+        self.assertEqual(resp.status_code, 304)
+
+    def test_accepted_encodings(self):
+        request = Mock(META={"HTTP_ACCEPT_ENCODING": "gzip;q=0.5, br, *;q=0, x;q=foo"})
+        expected = {"gzip": 0.5, "br": 1.0, "*": 0, "x": 0}
+        self.assertEqual(compression.accepted_encodings(request), expected)
+
+
+class JSONCodec(BaseCase):
+    "every JSON backend parses and renders the same JSON"
+
+    def setUp(self):
+        fixture = join(FIXTURE_DIR, "elife-00003-v1.xml.json")
+        self.article_json = json.load(open(fixture, "r"))
+        self.data = {"a": "é/ü", "b": [1, 2.5, None, True], "c": {}, "d": []}
+
+    def test_round_trip(self):
+        for name, backend in codec.BACKENDS.items():
+            for data in [self.data, self.article_json]:
+                self.assertEqual(backend.loads(backend.dumps(data)), data, name)
+                self.assertEqual(backend.loads(backend.dumps(data).decode()), data)
+
+    def test_dumps(self):
+        "compact and indented JSON is rendered the same as the standard library renders it"
+        for name, backend in codec.BACKENDS.items():
+            for indent in [None, 2, 4]:
+                expected = json.dumps(
+                    self.data,
+                    indent=indent,
+                    separators=None if indent else (",", ":"),
+                    # only the standard library escapes non-ascii characters
+                    ensure_ascii=name == "json" or indent not in [None, 2],
+                )
+                actual = backend.dumps(self.data, indent=indent).decode()
+                self.assertEqual(actual, expected, (name, indent))
+
+    def test_dumps_sort_keys(self):
+        data = {"b": 1, "a": {"d": 2, "c": 3}}
+        for backend in codec.BACKENDS.values():
+            self.assertEqual(
+                backend.dumps(data, sort_keys=True), b'{"a":{"c":3,"d":2},"b":1}'
+            )
+
+    def test_dumps_django_types(self):
+        "types the JSON backends can't render are rendered as Django would render them"
+        data = {"amount": decimal.Decimal("1.50")}
+        for backend in codec.BACKENDS.values():
+            self.assertEqual(backend.dumps(data), b'{"amount":"1.50"}')
+
+    def test_bad_json(self):
+        for backend in codec.BACKENDS.values():
+            with self.assertRaises(ValueError):
+                backend.loads(b"{")
+
+    def test_backend_configured(self):
+        self.assertIs(codec.backend(), codec.DEFAULT)
+        api = dict(settings.API, **{"json-backend": "json"})
+        with self.settings(API=api):
+            self.assertIs(codec.backend(), codec.STDLIB)
+            resp = self.client.get(urls.reverse("status"))
+        self.assertEqual(resp.status_code, 200)
+
+    @pytest.mark.skipif(codec.orjson is None, reason="orjson isn't installed")
+    def test_fastest_backend_preferred(self):
+        self.assertEqual(codec.DEFAULT.name, "orjson")
+
+
+class Outbox(BaseCase):
+    "queueing protocol data and delivering it to BP from the outbox"
+
+    def setUp(self):
+        self.bp_url = "https://dev.bio-protocol.org/api/elife00001?action=sendArticle"
+        self.protocol_data = {"elifeID": 1, "data": []}
+
+    def deliver(self, status=200):
+        with responses.RequestsMock(assert_all_requests_are_fired=False) as mock_resp:
+            mock_resp.add(responses.POST, self.bp_url, status=status)
+            return list(outbox.deliver(forever=False))
+
+    def test_enqueue(self):
+        "protocol data queued for an article replaces any already queued"
+        self.assertTrue(outbox.enqueue(1, self.protocol_data))
+        self.assertTrue(outbox.enqueue(1, dict(self.protocol_data, data=[{}])))
+        delivery = models.OutboxDelivery.objects.get()
+        self.assertEqual(delivery.protocol_data["data"], [{}])
+        self.assertEqual(delivery.attempts, 0)
+
+    def test_enqueue_unchanged(self):
+        "protocol data that hasn't changed since it was last delivered isn't queued, unless forced"
+        digest = logic.fingerprint(self.protocol_data)
+        models.DeliveryFingerprint.objects.create(msid=1, digest=digest)
+        self.assertFalse(outbox.enqueue(1, self.protocol_data))
+        self.assertEqual(models.OutboxDelivery.objects.count(), 0)
+        self.assertTrue(outbox.enqueue(1, self.protocol_data, force=True))
+
+    def test_deliver(self):
+        "delivered protocol data is removed from the outbox and it's fingerprint recorded"
+        outbox.enqueue(1, self.protocol_data)
+        self.assertEqual(self.deliver(), [(1, outbox.DELIVERED)])
+        self.assertEqual(models.OutboxDelivery.objects.count(), 0)
+        self.assertTrue(logic.is_delivered(1, logic.fingerprint(self.protocol_data)))
+
+    def test_deliver_failed(self):
+        "a failed delivery is re-attempted with an exponential backoff"
+        with freeze_time("2019-01-01 00:00:00"):
+            outbox.enqueue(1, self.protocol_data)
+            self.assertEqual(self.deliver(status=500), [(1, outbox.RETRY)])
+            # not due yet
+            self.assertEqual(self.deliver(status=500), [])
+        delivery = models.OutboxDelivery.objects.get()
+        self.assertEqual(delivery.attempts, 1)
+        self.assertIsNone(delivery.locked_until)
+        self.assertIn("HTTPError", delivery.last_error)
+        self.assertEqual(
+            delivery.next_attempt,
+            datetime(2019, 1, 1, 0, 0, 30, tzinfo=timezone.utc),
+        )
+
+        with freeze_time("2019-01-01 00:00:31"):
+            self.assertEqual(self.deliver(status=500), [(1, outbox.RETRY)])
+        delivery.refresh_from_db()
+        self.assertEqual(delivery.attempts, 2)
+        self.assertEqual(
+            delivery.next_attempt,
+            datetime(2019, 1, 1, 0, 1, 31, tzinfo=timezone.utc),
+        )
+
+        with freeze_time("2019-01-01 00:02:00"):
+            self.assertEqual(self.deliver(), [(1, outbox.DELIVERED)])
+        self.assertEqual(models.OutboxDelivery.objects.count(), 0)
+
+    def test_deliver_abandoned(self):
+        "a delivery older than the maximum age is abandoned once it fails"
+        with freeze_time("2019-01-01 00:00:00"):
+            outbox.enqueue(1, self.protocol_data)
+        with freeze_time("2019-01-04 00:00:01"):
+            self.assertEqual(self.deliver(status=500), [(1, outbox.ABANDONED)])
+        self.assertEqual(models.OutboxDelivery.objects.count(), 0)
+        self.assertEqual(models.DeliveryFingerprint.objects.count(), 0)
+
+    def test_backoff(self):
+        outbox_settings = dict(settings.OUTBOX, backoff=30, **{"max-backoff": 100})
+        with self.settings(OUTBOX=outbox_settings):
+            self.assertEqual(
+                [outbox.backoff(attempts) for attempts in [1, 2, 3, 4]],
+                [30, 60, 100, 100],
+            )
+
+    def test_claim_leased(self):
+        "a claimed delivery isn't claimed again until it's lease expires"
+        outbox.enqueue(1, self.protocol_data)
+        outbox.enqueue(2, self.protocol_data)
+        now = models.OutboxDelivery.objects.get(msid=2).next_attempt
+        self.assertEqual([d.msid for d in outbox.claim(1, now)], [1])
+        self.assertEqual([d.msid for d in outbox.claim(10, now)], [2])
+        self.assertEqual(outbox.claim(10, now), [])
+        later = now + timedelta(seconds=settings.OUTBOX["lease"] + 1)
+        self.assertEqual(len(outbox.claim(10, later)), 2)
+
+    def test_lease_renewed(self):
+        "the lease on a delivery is renewed just before it's attempted, unless another worker has since claimed it"
+        for msid in [1, 2]:
+            outbox.enqueue(msid, dict(self.protocol_data, elifeID=msid))
+        now = models.OutboxDelivery.objects.get(msid=2).next_attempt
+        delivery_list = outbox.claim(10, now)
+        # the lease expires while the first delivery is attempted and another worker claims the second
+        later = now + timedelta(seconds=settings.OUTBOX["lease"] + 1)
+        self.assertEqual([d.msid for d in outbox.claim(1, later)], [1])
+        held = outbox.renew(delivery_list, later)
+        self.assertEqual([d.msid for d in held], [2])
+        self.assertEqual(outbox.claim(10, later), [])
+
+    def test_lease_too_short(self):
+        "a lease that can't outlast a request is refused"
+        with self.settings(OUTBOX=dict(settings.OUTBOX, lease=1)):
+            with self.assertRaises(AssertionError):
+                self.deliver()
+
+    def test_replaced_while_delivering(self):
+        "protocol data queued while an article is being delivered isn't lost"
+        outbox.enqueue(1, self.protocol_data)
+        delivery_list = outbox.claim(10)
+        new_protocol_data = dict(self.protocol_data, data=[{}])
+        outbox.enqueue(1, new_protocol_data)
+        # still leased
+        self.assertEqual(outbox.claim(10), [])
+
+        with responses.RequestsMock() as mock_resp:
+            mock_resp.add(responses.POST, self.bp_url, status=200)
+            with ThreadPoolExecutor(max_workers=1) as executor:
+                outbox.deliver_batch(delivery_list, executor, 1)
+
+        delivery = models.OutboxDelivery.objects.get()
+        self.assertEqual(delivery.digest, logic.fingerprint(new_protocol_data))
+        self.assertIsNone(delivery.locked_until)
+        self.assertEqual(self.deliver(), [(1, outbox.DELIVERED)])
+
+    def test_handler_enqueues(self):
+        "with the outbox enabled, the update listener queues protocol data rather than delivering it"
+        outbox_settings = dict(settings.OUTBOX, enabled=True)
+        with self.settings(OUTBOX=outbox_settings):
+            with patch("bp.logic.download_parse_data", return_value=self.protocol_data):
+                with patch("bp.logic.deliver_protocol_data") as deliver:
+                    article_update_logic.handler(article_event(1))
+        deliver.assert_not_called()
+        self.assertEqual(models.OutboxDelivery.objects.get().msid, 1)
+
+    def test_async_handler_enqueues(self):
+        async def resend_articles(msid_list, concurrency, dry_run):
+            self.assertTrue(dry_run)
+            return [
+                (1, logic.RESEND_DRY_RUN, self.protocol_data),
+                (2, logic.RESEND_NOT_FOUND, None),
+            ]
+
+        outbox_settings = dict(settings.OUTBOX, enabled=True)
+        with self.settings(OUTBOX=outbox_settings):
+            with patch("bp.async_logic.resend_articles", resend_articles):
+                async_to_sync(async_logic.handle_articles)([1, 2])
+        self.assertEqual(models.OutboxDelivery.objects.get().msid, 1)
+
+    def test_async_handler_enqueue_failed(self):
+        "an article that fails to be queued is counted, the rest of the batch is still queued"
+
+        async def resend_articles(msid_list, concurrency, dry_run):
+            return [
+                (msid, logic.RESEND_DRY_RUN, self.protocol_data) for msid in msid_list
+            ]
+
+        enqueue = outbox.enqueue
+
+        def side_effect(msid, protocol_data):
+            if msid == 1:
+                raise RuntimeError("database unavailable")
+            return enqueue(msid, protocol_data)
+
+        failed = sample("bp_sqs_articles_failed_total")
+        outbox_settings = dict(settings.OUTBOX, enabled=True)
+        with self.settings(OUTBOX=outbox_settings):
+            with patch("bp.async_logic.resend_articles", resend_articles):
+                with patch("bp.outbox.enqueue", side_effect=side_effect):
+                    async_to_sync(async_logic.handle_articles)([1, 2])
+        self.assertEqual(sample("bp_sqs_articles_failed_total") - failed, 1)
+        self.assertEqual(models.OutboxDelivery.objects.get().msid, 2)
+
+    def test_deliver_outbox_command(self):
+        outbox.enqueue(1, self.protocol_data)
+        stdout = StringIO()
+        with responses.RequestsMock() as mock_resp:
+            mock_resp.add(responses.POST, self.bp_url, status=200)
+            with patch("sys.stdout", stdout):
+                call_command("deliver_outbox", "--once")
+        self.assertEqual(json.loads(stdout.getvalue()), {"total": 1, "delivered": 1})
+
+
+class UpstreamLimits(BaseCase):
+    "rate limiting and circuit breaking of requests to the gateway and BP"
+
+    def setUp(self):
+        self.url = settings.ELIFE_GATEWAY + "/articles/3"
+        self.http = dict(settings.HTTP, **{"breaker-threshold": 2})
+
+    def test_token_bucket_reserve(self):
+        "a reserved token may have to be waited for"
+        with patch("bp.utils.time.monotonic") as monotonic:
+            monotonic.return_value = 100
+            bucket = utils.TokenBucket(rate=2)
+            self.assertEqual([bucket.reserve() for _ in range(4)], [0, 0, 0.5, 1])
+
+    def test_breaker(self):
+        "a circuit opens after consecutive failures and a single trial request is let through once it's reset"
+        with patch("bp.clients.time.monotonic") as monotonic:
+            monotonic.return_value = 100
+            breaker = clients.CircuitBreaker(threshold=2, reset_timeout=30)
+            breaker.record(False)
+            breaker.record(True)
+            breaker.record(False)
+            self.assertTrue(breaker.allow())
+            breaker.record(False)
+            self.assertEqual(breaker.info(), {"state": "open", "failures": 2})
+            self.assertFalse(breaker.allow())
+
+            monotonic.return_value = 130
+            self.assertTrue(breaker.allow())
+            self.assertEqual(breaker.info()["state"], "half-open")
+            self.assertFalse(breaker.allow())  # trial in flight
+            breaker.record(False)
+            self.assertFalse(breaker.allow())
+
+            monotonic.return_value = 160
+            self.assertTrue(breaker.allow())
+            breaker.record(True)
+            self.assertEqual(breaker.info(), {"state": "closed", "failures": 0})
+            self.assertTrue(breaker.allow())
+
+    def test_breaker_disabled(self):
+        breaker = clients.CircuitBreaker(threshold=0, reset_timeout=30)
+        for _ in range(10):
+            breaker.record(False)
+        self.assertTrue(breaker.allow())
+
+    def test_requests_fail_fast(self):
+        "requests to a host whose circuit is open are refused without being made"
+        with self.settings(HTTP=self.http):
+            with responses.RequestsMock() as mock_resp:
+                mock_resp.add(responses.GET, self.url, status=503)
+                self.assertEqual(logic.get(self.url).status_code, 503)
+                self.assertEqual(logic.get(self.url).status_code, 503)
+                self.assertEqual(logic.get(self.url), None)
+                self.assertEqual(logic.download_elife_article(3), None)
+                self.assertEqual(len(mock_resp.calls), 2)
+        # other hosts are unaffected
+        self.assertEqual(
+            clients.breaker(settings.BP["api_host"]).info()["state"], "closed"
+        )
+
+    def test_client_errors_not_counted(self):
+        "a 404 isn't a failure of the host"
+        with self.settings(HTTP=self.http):
+            with responses.RequestsMock() as mock_resp:
+                mock_resp.add(responses.GET, self.url, status=404)
+                for _ in range(3):
+                    self.assertEqual(logic.get(self.url).status_code, 404)
+        self.assertEqual(clients.breaker(self.url).info()["state"], "closed")
+
+    def test_delivery_not_retried_when_open(self):
+        "a delivery stops being re-attempted once the circuit opens"
+        bp_url = logic.delivery_url(3)
+        with self.settings(HTTP=self.http), patch("backoff._sync.time.sleep"):
+            with responses.RequestsMock() as mock_resp:
+                mock_resp.add(
+                    responses.POST, bp_url, body=requests.exceptions.ConnectionError()
+                )
+                self.assertEqual(logic.deliver_protocol_data(3, {}), None)
+                self.assertEqual(len(mock_resp.calls), 2)
+
+    def test_rate_limit(self):
+        "requests are rate limited per-host if a rate is configured"
+        for rate, expected_calls in [(0, 0), (5, 2)]:
+            clients.reset()
+            http = dict(settings.HTTP, rate=rate)
+            with self.settings(HTTP=http):
+                with patch("bp.utils.TokenBucket.acquire") as acquire:
+                    with responses.RequestsMock() as mock_resp:
+                        mock_resp.add(responses.GET, self.url, status=200)
+                        logic.get(self.url)
+                        logic.get(self.url)
+            self.assertEqual(acquire.call_count, expected_calls)
+        self.assertEqual(clients.rate_limit(self.url), None)
+
+    def test_async_fail_fast(self):
+        "requests made in an event loop share the circuit breakers"
+        requests_made = []
+
+        def handler(request):
+            requests_made.append(request)
+            return httpx.Response(503)
+
+        async def get_twice():
+            transport = httpx.MockTransport(handler)
+            async with clients.AsyncSession(transport=transport) as session:
+                first = await async_logic.get(session, self.url)
+                second = await async_logic.get(session, self.url)
+                return first, second
+
+        with self.settings(HTTP=dict(self.http, **{"breaker-threshold": 1})):
+            first, second = async_to_sync(get_twice)()
+        self.assertEqual(first.status_code, 503)
+        self.assertEqual(second, None)
+        self.assertEqual(len(requests_made), 1)
+
+    def test_async_cancelled(self):
+        "a trial request cancelled before it's made doesn't leave the circuit half-open"
+
+        async def cancelled():
+            transport = httpx.MockTransport(lambda request: httpx.Response(200))
+            async with clients.AsyncSession(transport=transport) as session:
+                task = asyncio.ensure_future(session.get(self.url))
+                await asyncio.sleep(0)  # waiting on the rate limit
+                task.cancel()
+                with self.assertRaises(asyncio.CancelledError):
+                    await task
+
+        with patch("bp.clients.time.monotonic") as monotonic:
+            monotonic.return_value = 100
+            breaker = clients.breaker(self.url)
+            for _ in range(settings.HTTP["breaker-threshold"]):
+                breaker.record(False)
+            monotonic.return_value = 200
+            with self.settings(HTTP=dict(settings.HTTP, rate=1)):
+                async_to_sync(cancelled)()
+            self.assertEqual(breaker.info()["state"], "open")
+            monotonic.return_value = 300
+            self.assertTrue(breaker.allow())
+
+    def test_state_metric(self):
+        "the state of each circuit is reported as a metric"
+        bp_host = clients.host(settings.BP["api_host"])
+        breaker = clients.breaker(settings.BP["api_host"])
+        self.assertEqual(sample("bp_circuit_state", {"host": bp_host}), 0)
+        for _ in range(settings.HTTP["breaker-threshold"]):
+            breaker.record(False)
+        self.assertEqual(sample("bp_circuit_state", {"host": bp_host}), 2)
+        gateway_host = clients.host(settings.ELIFE_GATEWAY)
+        clients.breaker(settings.ELIFE_GATEWAY)
+        self.assertEqual(sample("bp_circuit_state", {"host": gateway_host}), 0)
+
+
+class FakeBioProtocol:
+    "a stand-in for BioProtocol's listing of changed articles, serving `page_size` articles a page"
+
+    def __init__(self, page_size=2):
+        fixture = join(FIXTURE_DIR, "bp-api-output.json")
+        self.bp_data = json.load(open(fixture, "r"))
+        self.page_size = page_size
+        self.articles = {}
+        self.requests = []
+
+    def update(self, msid, updated):
+        "changes the protocol data of the given article at the given ISO 8601 time"
+        self.articles[msid] = dict(
+            self.bp_data, elifeid=utils.pad_msid(msid), updated=updated
+        )
+
+    def callback(self, request):
+        self.requests.append(request.url)
+        query = parse_qs(urlsplit(request.url).query)
+        since = query.get("since", [None])[0]
+        page = int(query.get("page", [0])[0])
+        changed = sorted(
+            [
+                bp_data
+                for bp_data in self.articles.values()
+                if not since or bp_data["updated"] >= since
+            ],
+            key=lambda bp_data: bp_data["updated"],
+        )
+        end = (page + 1) * self.page_size
+        body = {
+            "items": changed[page * self.page_size : end],
+            "next": page + 1 if len(changed) > end else None,
+        }
+        return 200, {}, json.dumps(body)
+
+    def serve(self, mock_resp):
+        url = re.compile(re.escape(settings.BP["api_host"] + "/api/elife?") + ".*")
+        mock_resp.add_callback(responses.GET, url, callback=self.callback)
+
+
+class SyncProtocolData(BaseCase):
+    "incrementally fetching the data changed at BP since the last sync"
+
+    def setUp(self):
+        self.bp = FakeBioProtocol()
+        for msid, updated in enumerate(
+            [
+                "2019-01-01T00:00:00+00:00",
+                "2019-01-02T00:00:00+00:00",
+                "2019-01-03T00:00:00+00:00",
+            ],
+            start=1,
+        ):
+            self.bp.update(msid, updated)
+
+    def sync(self, since=None):
+        with responses.RequestsMock() as mock_resp:
+            self.bp.serve(mock_resp)
+            return list(logic.sync_articles_data(since))
+
+    def test_sync(self):
+        "every page of changes is written and the cursor advanced to the latest change"
+        pages = self.sync()
+        self.assertEqual([len(results) for results, _ in pages], [2, 1])
+        self.assertEqual(len(self.bp.requests), 2)
+        self.assertEqual(
+            models.ArticleProtocol.objects.values("msid").distinct().count(), 3
+        )
+        expected_cursor = datetime(2019, 1, 3, tzinfo=timezone.utc)
+        self.assertEqual(pages[-1][1], expected_cursor)
+        self.assertEqual(logic.sync_cursor(), expected_cursor)
+
+    def test_sync_incremental(self):
+        "only the articles changed since the last sync are fetched"
+        self.sync()
+        self.bp.update(2, "2019-01-04T00:00:00+00:00")
+        self.bp.requests.clear()
+        pages = self.sync()
+        # the article at the cursor is fetched again along with the changed article
+        self.assertEqual([result["msid"] for result in pages[0][0]], ["00003", "00002"])
+        self.assertEqual(len(self.bp.requests), 1)
+        self.assertIn("since=2019-01-03T00%3A00%3A00%2B00%3A00", self.bp.requests[0])
+        self.assertEqual(logic.sync_cursor(), datetime(2019, 1, 4, tzinfo=timezone.utc))
+
+    def test_sync_nothing_changed(self):
+        self.bp.articles.clear()
+        self.assertEqual(self.sync(), [([], None)])
+        self.assertEqual(logic.sync_cursor(), None)
+
+    def test_sync_interrupted(self):
+        "a sync that fails part way keeps the pages written so far"
+        with responses.RequestsMock() as mock_resp:
+            self.bp.serve(mock_resp)
+            sync = logic.sync_articles_data()
+            next(sync)
+            mock_resp.replace(
+                responses.GET,
+                re.compile(re.escape(settings.BP["api_host"] + "/api/elife?") + ".*"),
+                status=500,
+            )
+            with self.assertRaises(logic.SyncError):
+                next(sync)
+        self.assertEqual(
+            models.ArticleProtocol.objects.values("msid").distinct().count(), 2
+        )
+        self.assertEqual(logic.sync_cursor(), datetime(2019, 1, 2, tzinfo=timezone.utc))
+
+    def fail_article(self, msid):
+        "returns a patch of `add_result` that fails to write the given article"
+        add_result = logic.add_result
+
+        def side_effect(result):
+            if int(result["elifeID"]) == msid:
+                raise RuntimeError("failed to write")
+            return add_result(result)
+
+        return patch("bp.logic.add_result", side_effect=side_effect)
+
+    def test_sync_failed(self):
+        "the cursor isn't advanced past the earliest article that failed to be written"
+        with self.fail_article(2):
+            pages = self.sync()
+        self.assertEqual(pages[0][0][1]["msid"], "00002")
+        self.assertTrue(logic.write_failed(pages[0][0][1]))
+        failed_at = datetime(2019, 1, 2, tzinfo=timezone.utc)
+        self.assertEqual([cursor for _, cursor in pages], [failed_at, failed_at])
+        self.assertEqual(logic.sync_cursor(), failed_at)
+
+        # the failed article is fetched again by the next sync
+        self.bp.requests.clear()
+        self.sync()
+        self.assertIn("since=2019-01-02T00%3A00%3A00%2B00%3A00", self.bp.requests[0])
+        self.assertEqual(models.ArticleProtocol.objects.filter(msid=2).count(), 14)
+        self.assertEqual(logic.sync_cursor(), datetime(2019, 1, 3, tzinfo=timezone.utc))
+
+    def invalidate_row(self, msid):
+        "gives a row of the given article an unknown key, failing its validation"
+        bp_data = self.bp.articles[msid]
+        rows = copy.deepcopy(bp_data["Protocols"])
+        rows[0]["Unknown"] = "foo"
+        self.bp.articles[msid] = dict(bp_data, Protocols=rows)
+
+    def test_sync_invalid_row(self):
+        "an article with an invalid row is reported but doesn't hold the cursor"
+        self.invalidate_row(2)
+        pages = self.sync()
+        result = pages[0][0][1]
+        self.assertEqual(result["msid"], "00002")
+        self.assertEqual(len(result["failed"]), 1)
+        self.assertFalse(logic.write_failed(result))
+        self.assertEqual(models.ArticleProtocol.objects.filter(msid=2).count(), 13)
+        latest = datetime(2019, 1, 3, tzinfo=timezone.utc)
+        self.assertEqual(logic.sync_cursor(), latest)
+
+        # the next sync only fetches the article at the cursor
+        self.bp.requests.clear()
+        self.sync()
+        self.assertEqual(len(self.bp.requests), 1)
+        self.assertIn("since=2019-01-03T00%3A00%3A00%2B00%3A00", self.bp.requests[0])
+
+    def test_sync_command_invalid_row(self):
+        "the command reports articles with invalid rows without exiting with an error"
+        self.invalidate_row(2)
+        stdout = StringIO()
+        with responses.RequestsMock() as mock_resp:
+            self.bp.serve(mock_resp)
+            with patch("sys.stdout", stdout):
+                call_command("sync_article_data")
+        summary = json.loads(stdout.getvalue())
+        self.assertEqual(summary["failed"], 0)
+        self.assertEqual(summary["invalid"], 1)
+        self.assertEqual(summary["cursor"], "2019-01-03T00:00:00+00:00")
+
+    def test_sync_command_failed(self):
+        "the command exits with an error if any article failed to be written"
+        stdout = StringIO()
+        with responses.RequestsMock() as mock_resp:
+            self.bp.serve(mock_resp)
+            with self.fail_article(2), patch("sys.stdout", stdout):
+                with self.assertRaises(SystemExit) as cm:
+                    call_command("sync_article_data")
+        self.assertEqual(cm.exception.code, 1)
+        self.assertEqual(json.loads(stdout.getvalue())["failed"], 1)
+
+    def test_sync_command(self):
+        stdout = StringIO()
+        with responses.RequestsMock() as mock_resp:
+            self.bp.serve(mock_resp)
+            with patch("sys.stdout", stdout):
+                call_command("sync_article_data", "--since", "2019-01-02T00:00:00")
+        expected = {
+            "pages": 1,
+            "total": 2,
+            "failed": 0,
+            "invalid": 0,
+            "cursor": "2019-01-03T00:00:00+00:00",
+        }
+        self.assertEqual(json.loads(stdout.getvalue()), expected)
+
+    def test_sync_command_bad_since(self):
+        with self.assertRaises(CommandError):
+            call_command("sync_article_data", "--since", "foo")
+
+
+class ReconcileProtocolData(BaseCase):
+    "comparing our protocol data with BP's"
+
+    def setUp(self):
+        fixture = join(FIXTURE_DIR, "bp-api-output.json")
+        self.bp_data = json.load(open(fixture, "r"))
+        for msid in [3, 4]:
+            logic.add_result(
+                {"elifeID": msid, "data": copy.deepcopy(self.bp_data["Protocols"])}
+            )
+
+    def serve(self, mock_resp, msid, bp_data=None, status=200):
+        url = "https://dev.bio-protocol.org/api/elife%s" % utils.pad_msid(msid)
+        bp_data = bp_data or dict(self.bp_data, elifeid=utils.pad_msid(msid))
+        mock_resp.add(responses.GET, url, json=bp_data, status=status)
+
+    def test_reconcile_matched(self):
+        "every article we have is compared, in order"
+        with responses.RequestsMock() as mock_resp:
+            self.serve(mock_resp, 4)
+            self.serve(mock_resp, 3)
+            reports = list(logic.reconcile_articles())
+        self.assertEqual([r["msid"] for r in reports], [3, 4])
+        self.assertEqual(
+            reports[0],
+            {
+                "msid": 3,
+                "outcome": logic.RECONCILE_MATCHED,
+                "changed": [],
+                "local-only": [],
+                "remote-only": [],
+                "failed": [],
+            },
+        )
+
+    def drifted(self):
+        "returns BP's protocol data for article 3 with a changed, a missing and an extra row"
+        bp_data = copy.deepcopy(self.bp_data)
+        protocols = bp_data["Protocols"]
+        protocols[0]["ProtocolTitle"] = "foo"
+        protocols[1]["IsProtocol"] = not protocols[1]["IsProtocol"]
+        del protocols[2]
+        protocols.append(dict(protocols[-1], ProtocolSequencingNumber="s9-9"))
+        return bp_data
+
+    def test_reconcile_drifted(self):
+        with responses.RequestsMock() as mock_resp:
+            self.serve(mock_resp, 3, self.drifted())
+            self.serve(mock_resp, 4, status=404)
+            reports = list(logic.reconcile_articles([3, 4]))
+        expected = {
+            "msid": 3,
+            "outcome": logic.RECONCILE_DRIFTED,
+            "changed": ["s4-1", "s4-2"],
+            "local-only": ["s4-3"],
+            "remote-only": ["s9-9"],
+            "failed": [],
+        }
+        self.assertEqual(reports[0], expected)
+        self.assertEqual(reports[1], {"msid": 4, "outcome": "unavailable"})
+        self.assertFalse(models.ArticleProtocol.objects.filter(protocol_title="foo"))
+
+    def test_reconcile_unhashable(self):
+        "a row that can't be compared is reported as failed and the rest of the article is compared"
+        bp_data = copy.deepcopy(self.bp_data)
+        bp_data["Protocols"][0]["ProtocolStatus"] = None
+        bp_data["Protocols"][1]["ProtocolTitle"] = "foo"
+        with responses.RequestsMock() as mock_resp:
+            self.serve(mock_resp, 3, bp_data)
+            self.serve(mock_resp, 4)
+            reports = list(logic.reconcile_articles([3, 4]))
+        expected = {
+            "msid": 3,
+            "outcome": logic.RECONCILE_DRIFTED,
+            "changed": ["s4-2"],
+            "local-only": [],
+            "remote-only": [],
+            "failed": ["s4-1"],
+        }
+        self.assertEqual(reports[0], expected)
+        self.assertEqual(reports[1]["outcome"], logic.RECONCILE_MATCHED)
+
+    def test_reconcile_malformed(self):
+        "an article whose protocol data can't be read is reported as unavailable and the rest are compared"
+        with responses.RequestsMock() as mock_resp:
+            self.serve(mock_resp, 3, {"elifeid": "00003", "Protocols": None})
+            self.serve(mock_resp, 4, {"elifeid": "00004"})
+            self.serve(mock_resp, 5)
+            reports = list(logic.reconcile_articles([3, 4, 5]))
+        self.assertEqual(
+            [report["outcome"] for report in reports],
+            [
+                logic.RECONCILE_UNAVAILABLE,
+                logic.RECONCILE_UNAVAILABLE,
+                logic.RECONCILE_DRIFTED,
+            ],
+        )
+
+    def test_reconcile_repair(self):
+        "changed and missing rows are written, rows BP no longer has are kept"
+        with responses.RequestsMock() as mock_resp:
+            self.serve(mock_resp, 3, self.drifted())
+            reports = list(logic.reconcile_articles([3], repair=True))
+        self.assertEqual(reports[0]["outcome"], logic.RECONCILE_REPAIRED)
+        rows = models.ArticleProtocol.objects.filter(msid=3)
+        self.assertEqual(
+            rows.get(protocol_sequencing_number="s4-1").protocol_title, "foo"
+        )
+        self.assertTrue(rows.filter(protocol_sequencing_number="s9-9").exists())
+        self.assertTrue(rows.filter(protocol_sequencing_number="s4-3").exists())
+
+        # only the rows BP no longer has differ now
+        with responses.RequestsMock() as mock_resp:
+            self.serve(mock_resp, 3, self.drifted())
+            report = next(logic.reconcile_articles([3], repair=True))
+        self.assertEqual(report["outcome"], logic.RECONCILE_DRIFTED)
+        self.assertEqual(report["local-only"], ["s4-3"])
+        self.assertEqual(report["changed"] + report["remote-only"], [])
+
+    def test_reconcile_command(self):
+        stdout = StringIO()
+        with responses.RequestsMock() as mock_resp:
+            self.serve(mock_resp, 3, self.drifted())
+            self.serve(mock_resp, 4)
+            with patch("sys.stdout", stdout):
+                call_command("reconcile_article_data", "--concurrency", "2")
+        lines = [json.loads(line) for line in stdout.getvalue().splitlines()]
+        self.assertEqual(len(lines), 2)
+        self.assertEqual(lines[0]["msid"], 3)
+        self.assertEqual(lines[1], {"total": 2, "drifted": 1, "matched": 1})
+
+
+class Export(BaseCase):
+    "streaming every protocol as NDJSON or CSV"
+
+    def setUp(self):
+        self.c = Client()
+        self.url = urls.reverse("export")
+        fixture = join(FIXTURE_DIR, "bp-post-to-elife.json")
+        self.fixture = json.load(open(fixture, "r"))
+        with freeze_time("2019-01-01"):
+            logic.add_result(dict(self.fixture, elifeID=2))
+        with freeze_time("2019-01-02"):
+            logic.add_result(dict(self.fixture, elifeID=1))
+
+    def content(self, resp):
+        self.assertTrue(resp.streaming)
+        return b"".join(resp.streaming_content)
+
+    def test_export_ndjson(self):
+        "every protocol is streamed, ordered by article"
+        resp = self.c.get(self.url)
+        self.assertEqual(resp["Content-Type"], "application/x-ndjson")
+        rows = [json.loads(line) for line in self.content(resp).splitlines()]
+        self.assertEqual(len(rows), 6)
+        self.assertEqual([row["msid"] for row in rows], [1, 1, 1, 2, 2, 2])
+        expected = dict(
+            logic.protocol_data(1)["items"][0],
+            msid=1,
+            updated="2019-01-02T00:00:00+00:00",
+        )
+        self.assertEqual(rows[0], expected)
+        self.assertEqual(list(rows[0].keys()), logic.EXPORT_FIELDS)
+
+    def test_export_csv(self):
+        for kwargs in [{"data": {"format": "csv"}}, {"HTTP_ACCEPT": "text/csv"}]:
+            resp = self.c.get(self.url, **kwargs)
+            self.assertEqual(resp["Content-Type"], "text/csv; charset=utf-8")
+            rows = list(csv.DictReader(StringIO(self.content(resp).decode())))
+            self.assertEqual(len(rows), 6)
+            self.assertEqual(list(rows[0].keys()), logic.EXPORT_FIELDS)
+            self.assertEqual(rows[0]["msid"], "1")
+
+    def test_export_since(self):
+        "only protocols updated at or after 'since' are exported"
+        for since, expected in [
+            ("2019-01-02T00:00:00Z", [1, 1, 1]),
+            ("2019-01-02T00:00:00", [1, 1, 1]),
+            ("2019-01-03", []),
+        ]:
+            resp = self.c.get(self.url, {"since": since})
+            lines = self.content(resp).splitlines()
+            self.assertEqual([json.loads(line)["msid"] for line in lines], expected)
+
+        resp = self.c.get(self.url, {"since": "2019-01-03", "format": "csv"})
+        self.assertEqual(
+            self.content(resp).decode().strip(), ",".join(logic.EXPORT_FIELDS)
+        )
+
+    def test_export_bad_params(self):
+        for params in [{"since": "foo"}, {"since": "2019-13-01"}, {"format": "xml"}]:
+            resp = self.c.get(self.url, params)
+            self.assertEqual(resp.status_code, 400, params)
+
+    def test_export_chunked(self):
+        "rows are read from the database a chunk at a time"
+        self.assertEqual(len(list(logic.export_rows(chunk_size=2))), 6)
+        with patch("bp.views.EXPORT_ROWS_PER_CHUNK", 2):
+            chunks = list(self.c.get(self.url).streaming_content)
+        self.assertEqual(len(chunks), 3)
+
+    def test_export_compressed(self):
+        "exports are compressed as they're streamed if the client accepts it"
+        with patch("bp.compression.brotli", None):
+            resp = self.c.get(self.url, HTTP_ACCEPT_ENCODING="gzip")
+        self.assertEqual(resp["Content-Encoding"], "gzip")
+        lines = gzip.decompress(self.content(resp)).splitlines()
+        self.assertEqual(len(lines), 6)
+
+    @pytest.mark.skipif(compression.brotli is None, reason="brotli isn't installed")
+    def test_export_compressed_brotli(self):
+        resp = self.c.get(self.url, HTTP_ACCEPT_ENCODING="br")
+        self.assertEqual(resp["Content-Encoding"], "br")
+        content = compression.brotli.decompress(self.content(resp))
+        self.assertEqual(len(content.splitlines()), 6)
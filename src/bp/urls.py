@@ -4,5 +4,8 @@ from . import views
 urlpatterns = [
     path("ping", views.ping, name="ping"),
     path("status", views.status, name="status"),
+    path("metrics", views.prometheus_metrics, name="metrics"),
     path("bioprotocol/article/<int:msid>", views.article, name="article"),
+    path("bioprotocol/articles", views.articles, name="articles"),
+    path("bioprotocol/export", views.export, name="export"),
 ]
@@ -1,4 +1,8 @@
 import re
+import sys
+import threading
+import time
+from itertools import islice
 
 
 def pad_msid(msid):
@@ -54,6 +58,50 @@ def splitfilter(fn, lst):
     return a, b
 
 
+def chunks(iterable, n):
+    "yields lists of up to `n` items from the given `iterable`"
+    iterator = iter(iterable)
+    chunk = list(islice(iterator, n))
+    while chunk:
+        yield chunk
+        chunk = list(islice(iterator, n))
+
+
+def parse_range(range_str):
+    "returns a range of msids for the given inclusive range string, e.g. '1-100'"
+    try:
+        start, end = map(int, range_str.split("-"))
+    except ValueError:
+        raise ValueError("range must look like 'start-end', not %r" % range_str)
+    return range(start, end + 1)
+
+
+def read_msids(fh):
+    "yields an msid for each non-empty line of the given file handle"
+    for line in fh:
+        line = line.strip()
+        if line:
+            yield int(line)
+
+
+def read_msid_file(path):
+    with open(path, "r") as fh:
+        yield from read_msids(fh)
+
+
+def msid_sources(msid_list, path=None, range_str=None):
+    """returns a list of iterables of msids from the given list of msids, the file at `path` and the range.
+    a `path` of '-' reads msids from stdin."""
+    sources = [msid_list]
+    if path == "-":
+        sources.append(read_msids(sys.stdin))
+    elif path:
+        sources.append(read_msid_file(path))
+    if range_str:
+        sources.append(parse_range(range_str))
+    return sources
+
+
 def subdict(d, key_list):
     return {k: v for k, v in d.items() if k in key_list}
 
@@ -87,3 +135,47 @@ def create_or_update(
     # if create=True and update=False and object already exists, you'll get: (obj, False, False)
     # if the model cannot be found then None is returned: (None, False, False)
     return (inst, created, updated)
+
+
+class TokenBucket:
+    """a thread-safe token bucket allowing an average of `rate` acquisitions per second, in bursts of up to `capacity`.
+    `capacity` defaults to `rate`, or 1 if `rate` is less than 1."""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(1, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_acquire(self):
+        "takes a token and returns True if one is available, otherwise returns False"
+        with self.lock:
+            self._refill()
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return True
+            return False
+
+    def reserve(self):
+        "takes a token without blocking, returning the number of seconds to wait before using it"
+        with self.lock:
+            self._refill()
+            self.tokens -= 1
+            return max(0, -self.tokens / self.rate)
+
+    def acquire(self):
+        "takes a token, blocking until one is available"
+        while True:
+            with self.lock:
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
@@ -1,16 +1,63 @@
 from django.conf import settings
+from django.core.exceptions import RequestDataTooBig
 from django.views.decorators.http import require_http_methods
-from django.http import HttpResponse, JsonResponse as DJsonResponse
-from . import logic, models
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.dateparse import parse_date, parse_datetime
+from django.utils import timezone
+from django.utils.http import http_date
+from . import cache, codec, logic, metrics, models, utils
+from .compression import compressed
+from datetime import datetime
+import csv
+import io
 import logging
-import json
 
 LOG = logging.getLogger()
 
+NDJSON_CONTENT_TYPE = "application/x-ndjson"
+CSV_CONTENT_TYPE = "text/csv; charset=utf-8"
 
-def JsonResponse(*args, **kwargs):
-    kwargs["json_dumps_params"] = {"indent": 4}
-    return DJsonResponse(*args, **kwargs)
+# number of rows rendered per chunk of a streamed export
+EXPORT_ROWS_PER_CHUNK = 500
+
+# the range of indents a client can ask for
+MAX_INDENT = 8
+
+# `None` is compact JSON, so a missing indent is told apart with this
+_UNSET = object()
+
+
+def JsonResponse(data, indent=_UNSET, content_type="application/json", **kwargs):
+    """a JSON response rendered by `codec`, indented by `indent` spaces or by the 'json-indent' setting if not given.
+    an `indent` of `None` is compact JSON."""
+    if indent is _UNSET:
+        indent = settings.API["json-indent"]
+    return HttpResponse(
+        codec.dumps(data, indent=indent), content_type=content_type, **kwargs
+    )
+
+
+def json_indent(request):
+    """returns the number of spaces to indent a JSON response to the given request by, or `None` for compact JSON.
+    an 'indent' parameter in the Accept header, e.g. 'application/json; indent=4', overrides the 'json-indent' setting.
+    indents that can't be parsed or are outside of 0 to `MAX_INDENT` are ignored."""
+    for media_range in request.META.get("HTTP_ACCEPT", "").split(","):
+        for param in media_range.split(";")[1:]:
+            key, _, val = param.partition("=")
+            if key.strip() == "indent":
+                try:
+                    indent = int(val)
+                except ValueError:
+                    continue
+                if 0 <= indent <= MAX_INDENT:
+                    return indent or None
+    return settings.API["json-indent"]
+
+
+def variant_etag(etag, indent):
+    "returns the ETag of the representation of a response with the given `etag` indented by `indent` spaces"
+    return etag if indent is None else logic.make_etag(etag, indent)
 
 
 def error(message, status=500, content_type="application/json"):
@@ -23,33 +70,111 @@ def ping(request):
 
 
 @require_http_methods(["HEAD", "GET"])
+def prometheus_metrics(request):
+    return HttpResponse(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
+
+def conditional_response(request, etag, last_modified, render):
+    """returns a '304 Not Modified' response if the `If-None-Match` or `If-Modified-Since` headers of the given request
+    match the given `etag` and `last_modified` datetime, otherwise the response returned by calling `render`.
+    """
+    last_modified = last_modified and int(last_modified.timestamp())
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        response = render()
+    response["ETag"] = etag
+    if last_modified:
+        response["Last-Modified"] = http_date(last_modified)
+    return response
+
+
+@require_http_methods(["HEAD", "GET"])
+@compressed
 def status(request):
     try:
-        resp = {"last-updated": logic.last_updated(), "row-count": logic.row_count()}
-        return JsonResponse(resp, status=200)
+        summary = logic.summary()
+        last_updated = summary["last-updated"]
+        resp = {
+            "last-updated": last_updated and last_updated.isoformat(),
+            "row-count": summary["row-count"],
+        }
+        indent = json_indent(request)
+        etag = logic.make_etag(resp["last-updated"], resp["row-count"])
+        response = conditional_response(
+            request,
+            variant_etag(etag, indent),
+            last_updated,
+            lambda: JsonResponse(resp, status=200, indent=indent),
+        )
+        patch_vary_headers(response, ("Accept",))
+        return response
     except Exception:
         LOG.exception("unhandled exception calling /status")
         return error("unexpected error")
 
 
+def _acceptable_content_encoding(request, extra=None):
+    "returns True if the content-type of the given request is something we can parse"
+    content_encoding = request.content_type.strip().lower()
+    acceptable = ["application/json", settings.ELIFE_CONTENT_TYPE_GENERAL] + (
+        extra or []
+    )
+    return any(ctype in content_encoding for ctype in acceptable)
+
+
+def _result_summary(results):
+    "returns a summary of the map returned by `logic.add_result`"
+    return {
+        "msid": results["msid"],
+        "successful": len(results["successful"]),
+        "failed": len(results["failed"]),
+    }
+
+
 @require_http_methods(["HEAD", "GET", "POST"])
+@metrics.timed(metrics.ARTICLE_REQUEST_SECONDS)
+@compressed
 def article(request, msid):
     try:
         if request.method != "POST":  # GET, HEAD
-            art_data = logic.protocol_data(msid)
-            return JsonResponse(
-                art_data, status=200, content_type=settings.ELIFE_CONTENT_TYPE
+            entry = cache.get(msid)
+            if entry is None:
+                entry = logic.article_document(msid)
+                cache.put(msid, entry)
+
+            # documents are stored as compact JSON, indented variants are rendered once and cached with the entry
+            indent = json_indent(request)
+
+            def render():
+                content = entry["content"]
+                if indent:
+                    variants = entry.get("variants", {})
+                    content = variants.get(indent)
+                    if content is None:
+                        content = codec.dumps(
+                            codec.loads(entry["content"]), indent=indent
+                        )
+                        cache.put(
+                            msid, dict(entry, variants={**variants, indent: content})
+                        )
+                return HttpResponse(
+                    content, status=200, content_type=settings.ELIFE_CONTENT_TYPE
+                )
+
+            response = conditional_response(
+                request,
+                variant_etag(entry["etag"], indent),
+                entry["last-modified"],
+                render,
             )
+            patch_vary_headers(response, ("Accept",))
+            return response
 
         else:  # POST
-            content_encoding = request.content_type.strip().lower()
-            if (
-                "application/json" not in content_encoding
-                and settings.ELIFE_CONTENT_TYPE_GENERAL not in content_encoding
-            ):
+            if not _acceptable_content_encoding(request):
                 return error("unable to negotiate a content encoding", 406)
             try:
-                data = json.loads(request.body)
+                data = codec.loads(request.body)
             except Exception:
                 return error("failed to parse given JSON", 400)
 
@@ -57,11 +182,7 @@ def article(request, msid):
                 return error("empty request", 400)
 
             results = logic.add_result({"elifeID": msid, "data": data})
-            response = {
-                "msid": msid,
-                "successful": len(results["successful"]),
-                "failed": len(results["failed"]),
-            }
+            response = _result_summary(results)
             status_code = 200 if not results["failed"] else 400
             return JsonResponse(
                 response, status=status_code, content_type=settings.ELIFE_CONTENT_TYPE
@@ -72,3 +193,174 @@ def article(request, msid):
     except Exception:
         LOG.exception("unhandled exception calling /article")
         return error("Server error", 500)
+
+
+def _read_lines(request, limit):
+    """yields each line of the body of the given request as it's read from the stream.
+    raises `RequestDataTooBig` once more than `limit` bytes have been read."""
+    size = 0
+    for line in request:
+        size += len(line)
+        if size > limit:
+            raise RequestDataTooBig()
+        yield line
+
+
+def _parse_envelopes(request):
+    """parses a list of `{"elifeID": ..., "data": [...]}` envelopes from the body of the given request.
+    the body may be a JSON list of envelopes or newline-delimited JSON, one envelope per line, parsed as it's read.
+    the body is read from the request stream, up to the 'max-batch-size' setting rather than Django's
+    `DATA_UPLOAD_MAX_MEMORY_SIZE`. raises `RequestDataTooBig` if the body is larger.
+    raises `AssertionError` with a description of the problem if the JSON is valid but the envelopes aren't.
+    """
+    limit = settings.API["max-batch-size"]
+    if int(request.META.get("CONTENT_LENGTH") or 0) > limit:
+        raise RequestDataTooBig()
+    if NDJSON_CONTENT_TYPE in request.content_type.strip().lower():
+        envelope_list = [
+            codec.loads(line) for line in _read_lines(request, limit) if line.strip()
+        ]
+    else:
+        body = request.read(limit + 1)
+        if len(body) > limit:
+            raise RequestDataTooBig()
+        envelope_list = codec.loads(body)
+
+    utils.ensure(isinstance(envelope_list, list), "expecting a list of articles")
+    for envelope in envelope_list:
+        utils.ensure(
+            isinstance(envelope, dict)
+            and utils.has_all_keys(envelope, ["elifeID", "data"])
+            and utils.has_only_keys(envelope, ["elifeID", "data"]),
+            "expecting a map of 'elifeID' and 'data' for each article",
+        )
+        msid = envelope["elifeID"]
+        utils.ensure(
+            isinstance(msid, int) or (isinstance(msid, str) and msid.isdigit()),
+            "expecting a numeric 'elifeID', not %r" % (msid,),
+        )
+        envelope["elifeID"] = int(msid)
+        utils.ensure(
+            isinstance(envelope["data"], list) and envelope["data"],
+            "expecting a non-empty list of 'data' for article %r" % envelope["elifeID"],
+        )
+    return envelope_list
+
+
+@require_http_methods(["POST"])
+def articles(request):
+    "accepts protocol data for many articles at once"
+    try:
+        if not _acceptable_content_encoding(request, [NDJSON_CONTENT_TYPE]):
+            return error("unable to negotiate a content encoding", 406)
+        try:
+            envelope_list = _parse_envelopes(request)
+        except RequestDataTooBig:
+            return error(
+                "request larger than %s bytes, send fewer articles at a time"
+                % settings.API["max-batch-size"],
+                413,
+            )
+        except AssertionError as e:
+            return error(str(e), 400)
+        except Exception:
+            return error("failed to parse given JSON", 400)
+
+        if not envelope_list:
+            return error("empty request", 400)
+
+        items = [
+            _result_summary(results) for results in logic.add_results(envelope_list)
+        ]
+        response = {"total": len(items), "items": items}
+        status_code = 200 if not any(item["failed"] for item in items) else 400
+        return JsonResponse(
+            response, status=status_code, content_type=settings.ELIFE_CONTENT_TYPE
+        )
+
+    except Exception:
+        LOG.exception("unhandled exception calling /articles")
+        return error("Server error", 500)
+
+
+def _render_ndjson(rows):
+    for chunk in utils.chunks(rows, EXPORT_ROWS_PER_CHUNK):
+        yield b"".join(codec.dumps(row) + b"\n" for row in chunk)
+
+
+def _render_csv(rows):
+    buf = io.StringIO()
+    writer = csv.DictWriter(buf, fieldnames=logic.EXPORT_FIELDS)
+    writer.writeheader()
+    for chunk in utils.chunks(rows, EXPORT_ROWS_PER_CHUNK):
+        writer.writerows(chunk)
+        yield buf.getvalue().encode()
+        buf.seek(0)
+        buf.truncate()
+    # just the header if there were no rows
+    if buf.tell():
+        yield buf.getvalue().encode()
+
+
+EXPORT_FORMATS = {
+    "ndjson": (NDJSON_CONTENT_TYPE, _render_ndjson),
+    "csv": (CSV_CONTENT_TYPE, _render_csv),
+}
+
+
+def export_format(request):
+    """returns the format of an export requested by the 'format' parameter of the given request,
+    or by it's Accept header if not given. newline-delimited JSON by default."""
+    if "format" in request.GET:
+        return request.GET["format"]
+    if "text/csv" in request.META.get("HTTP_ACCEPT", ""):
+        return "csv"
+    return "ndjson"
+
+
+def parse_since(value):
+    "returns the given ISO 8601 date or datetime as an aware datetime, UTC if no timezone is given, or `None`"
+    try:
+        since = parse_datetime(value)
+        if not since:
+            date = parse_date(value)
+            since = date and datetime.combine(date, datetime.min.time())
+    except ValueError:
+        return None
+    if since and timezone.is_naive(since):
+        since = timezone.make_aware(since, timezone.utc)
+    return since
+
+
+def _logged(chunks):
+    "the response has already begun by the time a streamed chunk fails, all we can do is log it"
+    try:
+        yield from chunks
+    except Exception:
+        LOG.exception("unhandled exception streaming /export")
+        raise
+
+
+@require_http_methods(["HEAD", "GET"])
+@compressed
+def export(request):
+    """streams every protocol as newline-delimited JSON or CSV, optionally only those updated at or after
+    the time given by the 'since' parameter."""
+    fmt = export_format(request)
+    if fmt not in EXPORT_FORMATS:
+        return error("unknown format %r, expecting one of: ndjson, csv" % fmt, 400)
+
+    since = request.GET.get("since")
+    if since:
+        since = parse_since(since)
+        if not since:
+            return error(
+                "failed to parse 'since', expecting an ISO 8601 date or datetime", 400
+            )
+
+    content_type, render = EXPORT_FORMATS[fmt]
+    response = StreamingHttpResponse(
+        _logged(render(logic.export_rows(since))), content_type=content_type
+    )
+    patch_vary_headers(response, ("Accept",))
+    return response
@@ -121,11 +121,111 @@ DATABASES = {
 }
 
 SQS = cfg("sqs")
+SQS.update(
+    {
+        # number of messages received per-call to SQS, 1 to 10
+        "batch-size": int(cfg("sqs.batch-size", 10)),
+        # number of messages handled concurrently
+        "concurrency": int(cfg("sqs.concurrency", 4)),
+        # seconds a batch of messages is hidden from other consumers while being handled
+        "visibility-timeout": int(cfg("sqs.visibility-timeout", 300)),
+        # seconds to keep receiving messages after the first of a batch arrives.
+        # events for the same article within a batch are handled once.
+        "coalesce-window": int(cfg("sqs.coalesce-window", 0)),
+        # messages received in a batch before the window ends early. each batch must be handled within the
+        # 'visibility-timeout' or it's messages are received again.
+        "coalesce-max-messages": int(cfg("sqs.coalesce-max-messages", 40)),
+        # handle the articles of a batch in an event loop rather than a pool of threads.
+        # with `async` many more articles can be handled concurrently.
+        "async": cfg("sqs.async", False),
+    }
+)
 ELIFE_GATEWAY = cfg("gateway.host")
+# parse article-json incrementally, keeping only what is needed to extract protocols
+ELIFE_GATEWAY_STREAMING = cfg("gateway.streaming", False)
 ELIFE_CONTENT_TYPE = "application/vnd.elife.bioprotocol+json;version=1"
 ELIFE_CONTENT_TYPE_GENERAL = "application/vnd.elife.bioprotocol+json"
 BP = cfg("bioprotocol")
 
+# ports the update listener and outbox worker serve their Prometheus metrics on, see `bp/metrics.py`.
+# unset, their metrics aren't served.
+METRICS = {
+    "listener-port": int(cfg("metrics.listener-port", "") or 0) or None,
+    "outbox-port": int(cfg("metrics.outbox-port", "") or 0) or None,
+}
+
+# queued deliveries to BioProtocol, see `bp/outbox.py`
+OUTBOX = {
+    # the update listener queues protocol data for the `deliver_outbox` worker rather than delivering it directly
+    "enabled": cfg("outbox.enabled", False),
+    # number of deliveries claimed by a worker at a time
+    "batch-size": int(cfg("outbox.batch-size", 100)),
+    # number of deliveries sent concurrently by a worker
+    "concurrency": int(cfg("outbox.concurrency", 4)),
+    # seconds before a failed delivery is re-attempted, doubling with each attempt up to 'max-backoff'
+    "backoff": float(cfg("outbox.backoff", 30)),
+    "max-backoff": float(cfg("outbox.max-backoff", 3600)),
+    # seconds after being queued that a delivery is abandoned
+    "max-age": float(cfg("outbox.max-age", 3 * 24 * 60 * 60)),
+    # seconds a delivery is held by a worker before another worker may attempt it, renewed before each attempt.
+    # must be longer than the 'connect-timeout' and 'read-timeout' of a request
+    "lease": float(cfg("outbox.lease", 300)),
+    # seconds a worker waits before looking for deliveries again when none are due
+    "poll-interval": float(cfg("outbox.poll-interval", 5)),
+}
+
+# outgoing requests to the gateway and BioProtocol, see `bp/clients.py`
+HTTP = {
+    # seconds to wait for a connection to be established
+    "connect-timeout": float(cfg("http.connect-timeout", 5)),
+    # seconds to wait between bytes received from the server
+    "read-timeout": float(cfg("http.read-timeout", 60)),
+    # maximum number of connections kept open, per-host
+    "pool-size": int(cfg("http.pool-size", 10)),
+    # average requests per second to each host, unlimited if unset
+    "rate": float(cfg("http.rate", 0) or 0),
+    # requests that may be made to a host at once before being limited to 'rate', defaults to 'rate'
+    "burst": int(cfg("http.burst", 0) or 0) or None,
+    # consecutive failures (no response, a 5xx or a 429) before requests to a host are refused, never if zero
+    "breaker-threshold": int(cfg("http.breaker-threshold", 5)),
+    # seconds requests to a host are refused for before a trial request is let through
+    "breaker-reset": float(cfg("http.breaker-reset", 30)),
+}
+
+# responses, see `bp/views.py` and `bp/compression.py`
+API = {
+    # spaces to indent JSON responses by, compact JSON if unset.
+    # a client can ask for an indent with an 'indent' parameter in it's Accept header, e.g. 'application/json; indent=4'
+    "json-indent": int(cfg("api.json-indent", "") or 0) or None,
+    # compress responses with gzip, or brotli if installed, if the client accepts it
+    "compress": cfg("api.compress", True),
+    # responses smaller than this many bytes are not compressed
+    "compress-min-size": int(cfg("api.compress-min-size", 1024)),
+    # 'orjson', 'ujson' or 'json' (the standard library). the fastest installed is used if unset, see `bp/codec.py`
+    "json-backend": cfg("api.json-backend", "") or None,
+    # bytes of protocol data accepted by a single POST to /bioprotocol/articles
+    "max-batch-size": int(cfg("api.max-batch-size", 100 * 1024 * 1024)),
+}
+
+# read-through cache of rendered article responses, see `bp/cache.py`
+RESPONSE_CACHE = {
+    "enabled": cfg("cache.enabled", True),
+    "backend": cfg("cache.backend", "lru"),  # "lru" or "django"
+    "size": int(cfg("cache.size", 1000)),
+    # seconds an entry is kept for, the longest a process may serve an article written by another process
+    "ttl": int(cfg("cache.ttl", 60)),
+    "django-cache": cfg("cache.django-cache", "default"),
+}
+
+CACHES = {
+    "default": {
+        "BACKEND": cfg(
+            "cache.django-backend", "django.core.cache.backends.locmem.LocMemCache"
+        ),
+        "LOCATION": cfg("cache.django-location", ""),
+    }
+}
+
 LANGUAGE_CODE = "en-us"
 
 TIME_ZONE = "UTC"